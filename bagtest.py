@@ -5,6 +5,20 @@ from test import bagcompress
 from test import bagupdate
 from test import bagcreate
 from test import bagversion
+from test import bagvalidate
+from test import bagcache
+from test import bagfetcher
+from test import bagmetrics
+from test import bagprogress
+from test import bagwatch
+from test import bagsample
+from test import bagcheckpoint
+from test import bagchecksum
+from test import bagchunks
+from test import bagscan
+from test import bagrunner
+from test import bagcollection
+from test import bagduplicates
 
 
 def suite():
@@ -15,6 +29,20 @@ def suite():
     test_suite.addTest(bagupdate.suite())
     test_suite.addTest(bagcreate.suite())
     test_suite.addTest(bagversion.suite())
+    test_suite.addTest(bagvalidate.suite())
+    test_suite.addTest(bagcache.suite())
+    test_suite.addTest(bagfetcher.suite())
+    test_suite.addTest(bagmetrics.suite())
+    test_suite.addTest(bagprogress.suite())
+    test_suite.addTest(bagwatch.suite())
+    test_suite.addTest(bagsample.suite())
+    test_suite.addTest(bagcheckpoint.suite())
+    test_suite.addTest(bagchecksum.suite())
+    test_suite.addTest(bagchunks.suite())
+    test_suite.addTest(bagscan.suite())
+    test_suite.addTest(bagrunner.suite())
+    test_suite.addTest(bagcollection.suite())
+    test_suite.addTest(bagduplicates.suite())
     return test_suite
 
 
@@ -0,0 +1,385 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Streaming archive readers and writers for PyBagIt """
+
+import collections
+import multiprocessing
+import os
+import stat
+import struct
+import StringIO
+import tarfile
+import time
+import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
+
+from pybagit.exceptions import *
+
+
+def is_seekable(fileobj):
+    """ Returns True if fileobj supports tell() and seek(). """
+    try:
+        fileobj.seek(fileobj.tell())
+    except (AttributeError, IOError, OSError):
+        return False
+    return True
+
+
+class _PositionTracker(object):
+    """ Wraps a write-only stream (a socket file, a pipe, ...) and keeps
+        count of the bytes written, so that zipfile can ask it for tell().
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._position = 0
+
+    def write(self, data):
+        self._fileobj.write(data)
+        self._position += len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        if hasattr(self._fileobj, 'flush'):
+            self._fileobj.flush()
+
+    def close(self):
+        pass
+
+
+class StreamingZipFile(zipfile.ZipFile):
+    """ A write-only ZipFile that never seeks, so that it can write to
+        pipes and sockets.
+
+        zipfile.ZipFile.write() goes back to fill in the CRC and sizes in
+        each local file header once the file has been compressed. Instead,
+        we set bit 3 of the general purpose flags and write them in a data
+        descriptor after the file data, as the zip format allows.
+    """
+    def __init__(self, fileobj, compression=zipfile.ZIP_DEFLATED, allowZip64=True):
+        zipfile.ZipFile.__init__(self, _PositionTracker(fileobj), mode='w',
+                                 compression=compression, allowZip64=allowZip64)
+
+    def write(self, filename, arcname=None, compress_type=None):
+        if not self.fp:
+            raise RuntimeError("Attempt to write to ZIP archive that was already closed")
+
+        st = os.stat(filename)
+        if stat.S_ISDIR(st.st_mode):
+            # directory entries have no data, so there is nothing to seek back for.
+            return zipfile.ZipFile.write(self, filename, arcname, compress_type)
+
+        if arcname is None:
+            arcname = filename
+        arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+        while arcname[0] in (os.sep, os.altsep):
+            arcname = arcname[1:]
+
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+        zinfo.external_attr = (st[0] & 0xFFFF) << 16L  # Unix attributes
+        zinfo.compress_type = self.compression if compress_type is None else compress_type
+        zinfo.file_size = st.st_size
+        zinfo.flag_bits = 0x08  # CRC and sizes follow the data
+        zinfo.header_offset = self.fp.tell()
+
+        self._writecheck(zinfo)
+        self._didModify = True
+
+        zip64 = self._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        self.fp.write(zinfo.FileHeader(zip64))
+
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        else:
+            cmpr = None
+
+        crc = 0
+        file_size = 0
+        compress_size = 0
+        fp = open(filename, 'rb')
+        try:
+            while 1:
+                buf = fp.read(1024 * 64)
+                if not buf:
+                    break
+                file_size += len(buf)
+                crc = zlib.crc32(buf, crc) & 0xffffffff
+                if cmpr:
+                    buf = cmpr.compress(buf)
+                compress_size += len(buf)
+                self.fp.write(buf)
+        finally:
+            fp.close()
+
+        if cmpr:
+            buf = cmpr.flush()
+            compress_size += len(buf)
+            self.fp.write(buf)
+
+        if not zip64 and (file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT):
+            raise zipfile.LargeZipFile("File size has increased during compressing")
+
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+
+        # the data descriptor. Sizes are 8 bytes wide if the local header
+        # had a zip64 extra field.
+        fmt = "<4sLQQ" if zip64 else "<4sLLL"
+        self.fp.write(struct.pack(fmt, "PK\x07\x08", crc, compress_size, file_size))
+
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+
+
+def _deflate_block(block, compresslevel, last):
+    """ Compresses one block as a raw deflate stream. Every block but the
+        last ends with a sync flush, which byte-aligns it without ending the
+        stream, so that the blocks can simply be concatenated.
+    """
+    cmpr = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    data = cmpr.compress(block)
+    return data + cmpr.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter(object):
+    """ A write-only file object that gzips everything written to it,
+        compressing independent blocks on a pool of worker threads (zlib
+        releases the GIL while it compresses).
+
+        The output is a single standard gzip member, readable by any gunzip.
+        Blocks don't share a compression dictionary, so the output is a
+        little larger than a single-threaded gzip's.
+    """
+    def __init__(self, fileobj, processes=None, compresslevel=9, blocksize=128 * 1024, mtime=None):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.blocksize = blocksize
+        self.processes = processes or multiprocessing.cpu_count()
+        self._pool = ThreadPool(self.processes)
+        self._pending = collections.deque()
+        self._buffer = []
+        self._buffered = 0
+        self._crc = zlib.crc32("") & 0xffffffff
+        self._size = 0
+        self.closed = False
+        self._write_header(int(time.time() if mtime is None else mtime))
+
+    def _write_header(self, mtime):
+        if self.compresslevel == 9:
+            xfl = 2
+        elif self.compresslevel == 1:
+            xfl = 4
+        else:
+            xfl = 0
+        # magic, deflate, no flags, mtime, extra flags, unknown OS
+        self.fileobj.write(struct.pack("<BBBBLBB", 0x1f, 0x8b, 8, 0, mtime & 0xffffffff, xfl, 255))
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write() on closed ParallelGzipWriter")
+        if not data:
+            return
+        data = str(data)
+        self._crc = zlib.crc32(data, self._crc) & 0xffffffff
+        self._size += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.blocksize:
+            block = "".join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            for start in xrange(0, len(block) - self.blocksize + 1, self.blocksize):
+                self._submit(block[start:start + self.blocksize], False)
+            rest = len(block) % self.blocksize
+            if rest:
+                self._buffer.append(block[-rest:])
+                self._buffered = rest
+
+    def _submit(self, block, last):
+        self._pending.append(self._pool.apply_async(_deflate_block, (block, self.compresslevel, last)))
+        # keep a bounded number of blocks in flight, writing them in order.
+        while len(self._pending) > self.processes * 2:
+            self.fileobj.write(self._pending.popleft().get())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit("".join(self._buffer), True)
+            self._buffer = []
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().get())
+            self.fileobj.write(struct.pack("<LL", self._crc, self._size & 0xffffffff))
+            if hasattr(self.fileobj, 'flush'):
+                self.fileobj.flush()
+        finally:
+            self.closed = True
+            self._pool.close()
+            self._pool.join()
+
+
+class BagArchive(object):
+    """ Read-only access to a bag inside a zip or tgz package, without
+        extracting it.
+
+        The tag files (the regular files at the top of the bag) are read
+        into memory when the archive is opened, reading no further than
+        the start of the payload if bagit.txt and a manifest come before
+        it. Payload files are only ever read as streams, in archive order,
+        so that checking a tgz package written by package() takes one
+        sequential read of it.
+
+        Packages may hold the bag at their root, as package() writes them,
+        or inside a single top-level directory.
+    """
+    def __init__(self, filename, compression):
+        if compression not in ('zip', 'tgz'):
+            raise BagFormatNotRecognized("Could not read a {0} bag archive.".format(compression))
+        self.filename = filename
+        self.compression = compression
+        self.prefix = ''  # the directory in the archive holding the bag, with a trailing slash
+        self.tag_files = {}  # {name: contents} of the files at the top of the bag
+        self.has_payload_directory = False
+        self._scan()
+
+    def _members(self):
+        """ Yields (name, fileobj, size) for every member of the archive, in
+            archive order. fileobj is None for anything but a regular file,
+            and can only be read until the next member is asked for.
+        """
+        if self.compression == 'zip':
+            z = zipfile.ZipFile(self.filename)
+            try:
+                for info in z.infolist():
+                    name = _member_name(info.filename)
+                    if info.filename.endswith('/'):
+                        yield (name, None, 0)
+                        continue
+                    member = z.open(info)
+                    try:
+                        yield (name, member, info.file_size)
+                    finally:
+                        member.close()
+            finally:
+                z.close()
+        else:
+            # stream mode never seeks, so tarfile reads the package once.
+            t = tarfile.open(self.filename, 'r|*')
+            try:
+                for info in t:
+                    name = _member_name(info.name)
+                    if info.isfile():
+                        yield (name, t.extractfile(info), info.size)
+                    else:
+                        yield (name, None, 0)
+            finally:
+                t.close()
+
+    def _scan(self):
+        candidates = {}
+        members = self._members()
+        try:
+            for name, member, size in members:
+                parts = name.split('/')
+                if parts[0] == 'data' or parts[1:2] == ['data']:
+                    self.has_payload_directory = True
+                    # package() writes the tag files before the payload, so
+                    # if bagit.txt and a manifest came first, stop here and
+                    # leave the payload to a single read by payload(). In
+                    # other archives they may come after it, so read on.
+                    prefix = '' if parts[0] == 'data' else parts[0] + '/'
+                    if _has_tag_files(candidates, prefix):
+                        break
+                elif member is not None and len(parts) <= 2:
+                    candidates[name] = member.read()
+        finally:
+            members.close()
+
+        if 'bagit.txt' not in candidates:
+            for name in sorted(candidates):
+                if name.count('/') == 1 and name.endswith('/bagit.txt'):
+                    self.prefix = name[:-len('bagit.txt')]
+                    break
+
+        for name, contents in candidates.iteritems():
+            if name.startswith(self.prefix) and '/' not in name[len(self.prefix):]:
+                self.tag_files[name[len(self.prefix):]] = contents
+
+    def open_tag_file(self, name):
+        """ Returns a file object for one of the bag's tag files. Raises
+            IOError if the archive doesn't have it.
+        """
+        if name not in self.tag_files:
+            raise IOError("No such file in {0}: '{1}'".format(self.filename, name))
+        tfile = StringIO.StringIO(self.tag_files[name])
+        tfile.name = os.path.join(self.filename, name)
+        return tfile
+
+    def payload(self):
+        """ Yields (name, fileobj, size) for each payload file in the archive,
+            with names relative to the bag, e.g. 'data/file.txt'. As with
+            _members(), each fileobj must be read before asking for the next.
+        """
+        payload_prefix = self.prefix + 'data/'
+        members = self._members()
+        try:
+            for name, member, size in members:
+                if member is not None and name.startswith(payload_prefix):
+                    yield (name[len(self.prefix):], member, size)
+        finally:
+            members.close()
+
+    def payload_names(self):
+        return [name for name, member, size in self.payload()]
+
+
+def _has_tag_files(candidates, prefix):
+    """ Returns True if candidates has the bagit.txt and at least one
+        payload manifest of a bag at prefix.
+    """
+    if prefix + 'bagit.txt' not in candidates:
+        return False
+    for name in candidates:
+        rest = name[len(prefix):]
+        if name.startswith(prefix) and rest.startswith('manifest-') and '/' not in rest:
+            return True
+    return False
+
+
+def _member_name(name):
+    """ Normalises an archive member name to a relative, slash separated
+        path with no leading './' or trailing slash.
+    """
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    return '/'.join(parts)
@@ -24,28 +24,43 @@ __license__ = """The MIT License
                 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
                 THE SOFTWARE."""
 
-import subprocess
 import tempfile
-import hashlib
 import zipfile
 import tarfile
+import gzip
 import sys
 import os
-import shutil
 import codecs
 import string
 import random
-import urllib
 import re
-
 import time
+import zlib
 
 # import bagit-specific exceptions.
 from pybagit.exceptions import *
+from pybagit import multichecksum
+from pybagit.checksumcache import ChecksumCache
+from pybagit.fetcher import Fetcher
+from pybagit.metrics import phase
+from pybagit.progress import ProgressTracker, file_sizes
+from pybagit.sampling import sample_size, weighted_sample
+from pybagit.checkpoint import ValidationCheckpoint
+from pybagit.chunks import ChunkManifest, CHUNKMANIFEST_RE, chunk_ranges
+from pybagit.scan import scan_tree
+from pybagit.watch import BagWatcher
+from pybagit.manifest import read_manifest, find_duplicates, Manifest
+from pybagit.archive import BagArchive, StreamingZipFile, ParallelGzipWriter, is_seekable
+
+# the order in which we pick a bag's hash encoding when it has several manifests.
+PREFERRED_ALGORITHMS = ('sha512', 'sha256', 'sha1', 'md5')
+MANIFEST_RE = re.compile(r"^manifest-(?P<algorithm>{0})\.txt$".format("|".join(multichecksum.ALGORITHMS)))
+TAGMANIFEST_RE = re.compile(r"^tagmanifest-(?P<algorithm>{0})\.txt$".format("|".join(multichecksum.ALGORITHMS)))
 
 
 class BagIt:
-    def __init__(self, bag, validate=False, extended=True, fetch=False):
+    def __init__(self, bag, validate=False, extended=True, fetch=False, checksum_cache=None, extract=True, metrics=None, progress=None,
+                 scan_threads=1):
         """ Creates a Bag object. If file doesn't exist, it initializes an
             empty directory with empty files; if it does, it reads in the
             existing files.
@@ -55,11 +70,34 @@ class BagIt:
 
             If fetch is True, it fetches the files from fetch.txt and places
             them in the appropriate directory.
+
+            If checksum_cache is True, the checksums of payload files are
+            remembered in a cache file next to the bag directory, so that
+            update() and validate() only read files that have changed since.
+            It may also be the path to the cache file to use.
+
+            If bag is a zip or tgz package and extract is False, the bag is
+            read straight from the package instead of being extracted to a
+            temporary directory. Such a bag can be validated, but not changed.
+
+            metrics may be a pybagit.metrics.Metrics object, which records
+            the time spent in each phase of update(), validate(), fetch()
+            and package(), the files they read and the slowest of those.
+
+            progress may be a callable, which update(), validate(), fetch()
+            and package() call with a pybagit.progress.ProgressEvent as each
+            file is finished. An exception it raises stops the operation.
+
+            scan_threads is how many directories are listed at once when
+            walking the bag. On network filesystems, where each listing
+            waits on the server, a few threads make large trees much faster
+            to walk; locally, one is best.
         """
 
         self._bag              = bag  # bag as passed in. Could be either directory or file name, and may not exist.
         self.extended          = extended  # True if it is an 'extended' bag; False if it is not.
-        self.hash_encoding     = u'sha1'  # default hash encoding. Could also be md5. Should always be lowercase.
+        self.hash_encoding     = u'sha1'  # default hash encoding. Could also be md5, sha256 or sha512. Should always be lowercase.
+        self.hash_encodings    = [u'sha1']  # all the hash encodings manifests are written for. The first is hash_encoding.
         self.bag_major_version = 0
         self.bag_minor_version = 97   # default bagit version. Set to the latest approved version.
         self.tag_file_encoding = u'utf-8'  # default text encoding. always lower case.
@@ -72,6 +110,8 @@ class BagIt:
         self.baginfo_file      = None
         self.manifest_contents = None  # dictionary containing the current manifest contents.
         self.tag_manifest_contents = None
+        self.manifests         = {}  # manifest contents for every hash encoding, e.g. {'md5': {...}, 'sha256': {...}}
+        self.tag_manifests     = {}  # tag manifest contents for every hash encoding
         self.fetch_contents    = None
         self.baginfo_contents  = None
         self.bag_compression   = None  # compression type (if any)
@@ -80,9 +120,15 @@ class BagIt:
         self.new_files         = set()  # Files added discovered in the last update()
         self.existing_files    = set()  # Files known before the last update()
         self.deleted_files     = set()  # Files deleted before the last update()
-
-        module_path = os.path.dirname(os.path.abspath(__file__))
-        self._path_to_multichecksum = os.path.join(module_path, "multichecksum.py")
+        self.checksum_cache    = checksum_cache  # None/False, True or path to the checksum cache file
+        self._checksum_cache   = None  # the ChecksumCache, once it has been opened
+        self.extract           = extract  # False to read a packaged bag without extracting it
+        self._archive          = None  # the BagArchive of a bag read from its package
+        self.metrics           = metrics  # a pybagit.metrics.Metrics, or None to not collect any
+        self.chunk_size        = None  # files larger than this get chunk digests; None for none
+        self.chunk_manifest    = None  # the ChunkManifest with those digests
+        self.progress          = progress  # callback for pybagit.progress.ProgressEvents, or None
+        self.scan_threads      = scan_threads  # directories to list at once when walking the bag
 
         try:
             if os.path.exists(self._bag):
@@ -128,16 +174,41 @@ class BagIt:
         pass
 
     def get_hash_encoding(self):
-        """ Returns the hash encoding of the bag. Either 'sha1' or 'md5'. """
+        """ Returns the hash encoding of the bag: 'md5', 'sha1', 'sha256' or 'sha512'. """
         return self.hash_encoding
 
+    def get_hash_encodings(self):
+        """ Returns all the hash encodings the bag has manifests for. """
+        return list(self.hash_encodings)
+
     def set_hash_encoding(self, algorithm):
         """ Sets the bag checksum algorithm. """
-        if algorithm.lower() not in ('md5', 'sha1'):
-            raise BagCheckSumNotValid('You must specify either "md5" or "sha1".')
-        self.hash_encoding = unicode(algorithm)
+        self.set_hash_encodings([algorithm])
+
+    def set_hash_encodings(self, algorithms):
+        """ Sets the checksum algorithms to write manifests for. The first
+            one becomes the bag's hash encoding. update() calculates all of
+            them from a single read of each file.
+        """
+        algorithms = [unicode(a.lower()) for a in algorithms]
+        if not algorithms or [a for a in algorithms if a not in multichecksum.ALGORITHMS]:
+            raise BagCheckSumNotValid('You must specify one or more of {0}.'.format(", ".join(multichecksum.ALGORITHMS)))
+        self.hash_encoding = algorithms[0]
+        self.hash_encodings = algorithms
         self.manifest_file = os.path.join(self.bag_directory, "manifest-{0}.txt".format(self.hash_encoding))
 
+    def set_chunk_size(self, size):
+        """ Sets the size of the chunks that payload files larger than size
+            are split into, each chunk getting its own checksum in a
+            'chunkmanifest-<hash encoding>.txt' tag file when update() is
+            next run. validate() checks these files a chunk at a time, in
+            parallel, and reports which byte ranges are corrupt. None stops
+            writing chunk digests.
+        """
+        if size is not None and (not isinstance(size, (int, long)) or size < 1):
+            raise BagError("The chunk size must be a number of bytes; got {0!r}".format(size))
+        self.chunk_size = size
+
     def show_bag_info(self):
         """ Shows some information on the bag, it's contents and metadta.
 
@@ -177,12 +248,45 @@ class BagIt:
 
     def get_bag_contents(self):
         """ Returns a list containing all files in the data directory. """
-        data = os.walk(self.data_directory)
-        baglist = []
-        for dir in data:
-            for file in dir[2]:
-                baglist.append("{0}/{1}".format(dir[0], file))
-        return baglist
+        if self._archive is not None:
+            return [os.path.join(self.bag_directory, name) for name in self._archive.payload_names()]
+
+        return scan_tree(self.data_directory, self.scan_threads).files
+
+    def get_duplicates(self):
+        """ Returns the groups of payload files with the same contents,
+            going by the manifest, as (checksum, size, wasted, paths)
+            tuples with the most wasted space first. wasted is the bytes
+            that keeping a single copy would save; hard links to the same
+            file don't count towards it. size is None if none of the
+            files could be found.
+        """
+        groups = find_duplicates(self.manifest_contents.iteritems())
+        if not groups:
+            return []
+
+        stats = dict()
+        if self._archive is not None:
+            for name, member, size in self._archive.payload():
+                stats[os.path.normpath(name.decode(self.tag_file_encoding))] = (size, None)
+        else:
+            for paths in groups.itervalues():
+                for path in paths:
+                    st = self._stat(os.path.join(self.bag_directory, path))
+                    if st is not None:
+                        inode = (st.st_dev, st.st_ino) if st.st_nlink > 1 else None
+                        stats[os.path.normpath(path)] = (st.st_size, inode)
+
+        duplicates = []
+        for checksum, paths in groups.iteritems():
+            found = [stats[os.path.normpath(p)] for p in paths if os.path.normpath(p) in stats]
+            size = found[0][0] if found else None
+            copies = len(set(inode for s, inode in found if inode is not None))
+            copies += len([inode for s, inode in found if inode is None])
+            wasted = size * (copies - 1) if copies > 1 else 0
+            duplicates.append((checksum, size, wasted, paths))
+        duplicates.sort(key=lambda d: (-d[2], d[3]))
+        return duplicates
 
     def get_bag_errors(self, validate=False):
         """ Returns the bag errors. If validate is True, it will re-run the
@@ -192,174 +296,379 @@ class BagIt:
             self.validate()
         return self.bag_errors
 
-    def validate(self):
+    def validate(self, processes=None, strict=False, fast=False, sample=None, seed=None, weight=None,
+                 checkpoint=None, checkpoint_interval=60):
         """ Runs a suite of checks to determine the validity of a bag.
             Returns any errors it found.
+
+            If fast is True, no file is read: the payload is only checked
+            for files missing from it or from the manifests, and its size
+            and file count against the Payload-Oxum in bag-info.txt. This
+            catches incomplete transfers in seconds, but not corrupt files.
+
+            If sample is given, only a random sample of the manifest entries
+            is checked: a fraction of them if it is a float (e.g. 0.05), or
+            a number of them if it is an int. The sampled files are always
+            read, even if the checksum cache knows them, and any of them
+            that are missing are reported. The same seed picks the same
+            sample. weight makes some entries likelier to be picked: 'size'
+            favours big files, 'age' the files read longest ago (this needs
+            a checksum cache), or it may be a function of the entry's path.
+
+            If checkpoint is True, the files read so far are recorded every
+            checkpoint_interval seconds in a '.<bagname>.validate-checkpoint'
+            file next to the bag directory, so that a validation that is
+            interrupted picks up where it left off when it is run again.
+            Files that changed in between are read again. The checkpoint is
+            deleted once every file has been read. checkpoint may also be the
+            path to the checkpoint file to use.
+
+            Files with chunk digests (see set_chunk_size()) are checked
+            against them too, and any chunks that don't match are reported
+            by their byte range. If the chunk digests' algorithm is the only
+            one the bag has, the chunks are checksummed in parallel instead
+            of the whole file, and a file whose chunks all match is taken to
+            match the manifest, since its chunks roll up into its manifest
+            checksum. Chunk digests are only used if a tag manifest lists the
+            chunk manifest and matches it. The checksum cache and checkpoints
+            don't apply to these files.
+
+            Every manifest the bag has is checked, from a single read of
+            each payload file. The payload files are checksummed in parallel
+            by a pool of worker processes. If processes is None, one worker
+            per CPU is used; processes=1 checksums everything in this process.
+            processes may also be a multiprocessing Pool shared with other
+            bags, as pybagit.collection does.
+
+            If the bag has a checksum cache, files that have not changed
+            since they were last read are not read again. Set strict to True
+            to read every file regardless, e.g. for fixity audits.
+
+            A bag read from its package is checked by streaming the payload
+            out of the package in one pass, in this process; processes and
+            the checksum cache don't apply to it.
         """
         errors = []
 
         # verify the presence of the bagit.txt file
         try:
-            codecs.open(self.bagit_file, 'r', self.tag_file_encoding)
+            self._open_tag_file(self.bagit_file).close()
         except Exception, e:
             errors.append(('bagit.txt', 'bagit.txt file does not exist: {0}'.format(e)))
 
         # verify the presence of the data directory
         try:
-            if not os.path.exists(self.data_directory):
+            if not self._has_data_directory():
                 raise BagIsNotValidError('Not Found')
         except (BagIsNotValidError, Exception), e:
             errors.append(('data', 'data directory could not be found: e'.format(e)))
 
         # verify the presence of the manifest-(sha1|md5).txt file
         try:
-            codecs.open(self.manifest_file, 'r', self.tag_file_encoding)
+            self._open_tag_file(self.manifest_file).close()
         except Exception, e:
             errors.append(('manifest-{0}.txt'.format(self.hash_encoding), 'manifest-{0}.txt file does not exist: {1}'.format(self.hash_encoding, e)))
 
+        # pick the sample up front, so that bad arguments raise instead of
+        # being reported as problems with the bag.
+        sampled = None
+        if sample is not None and not fast:
+            sampled = self._sample_manifest(sample, seed, weight)
+
+        tracker = None
         try:
             # verify the contents of the manifest-(sha1|md5).txt file.
-            if not os.path.exists(self.data_directory):
+            if not self._has_data_directory():
                 raise BagIsNotValidError('Data Directory Not Found')
-            elif not os.path.exists(self.manifest_file):
+            elif not self._has_tag_file(self.manifest_file):
                 raise BagIsNotValidError('Manifest File Not Found')
+            elif fast:
+                with phase(self.metrics, 'validate.stat'):
+                    errors.extend(self._check_completeness())
             else:
-                for dir in os.walk(self.data_directory):
-                    for file in dir[2]:
-                        csum = self._calculate_checksum(os.path.join(dir[0], file))
-                        relpath = os.path.relpath(os.path.join(dir[0], file), self.bag_directory)
-                        if relpath in self.manifest_contents:
-                            if cmp(self.manifest_contents[relpath], csum) != 0:
-                                errors.append((relpath, 'Incorrect filename or checksum in manifest'))
+                algorithms = [self.hash_encoding] + sorted(a for a in self.manifests if a != self.hash_encoding)
+                if sampled is not None:
+                    strict = True
+                chunk_errors = dict()
+
+                if self._archive is not None:
+                    # the payload of a tgz can't be counted without reading it.
+                    files_total = len(self.manifest_contents) if sampled is None else len(sampled)
+                    tracker = self._progress_tracker('validate', files_total=files_total)
+                    with phase(self.metrics, 'validate.hash'):
+                        payload, checksums, failures = self._checksum_archive(algorithms, tracker, sampled)
+                else:
+                    scanned = None
+                    with phase(self.metrics, 'validate.walk'):
+                        if sampled is None:
+                            scan = scan_tree(u"{0}".format(self.data_directory), self.scan_threads)
+                            payload, scanned = scan.files, scan.stats
                         else:
-                            errors.append((relpath, 'File is not correct in manifest'))
+                            payload = [os.path.join(self.bag_directory, relpath) for relpath in sampled]
+                            payload = [f for f in payload if os.path.isfile(f)]
+                    sizes = scan.sizes() if scanned is not None else None
+                    tracker = self._progress_tracker('validate', payload, sizes=sizes)
+                    chunked = self._chunked_files(payload)
+                    if chunked:
+                        # only trust the chunk digests if a tag manifest does.
+                        vouched, chunk_manifest_errors = self._check_chunk_manifest()
+                        errors.extend(chunk_manifest_errors)
+                        if not vouched:
+                            chunked = dict()
+                    resume = self._get_checkpoint(checkpoint, algorithms, checkpoint_interval)
+                    with phase(self.metrics, 'validate.hash'):
+                        checksums, failures = self._checksum_files([f for f in payload if f not in chunked], algorithms,
+                                                                   processes, strict, tracker, resume, scanned)
+                    if resume is not None:
+                        resume.remove()
+                    if chunked:
+                        with phase(self.metrics, 'validate.chunks'):
+                            chunk_checksums, chunk_failures, chunk_errors = self._verify_chunks(chunked, algorithms,
+                                                                                                processes, tracker)
+                        checksums.update(chunk_checksums)
+                        failures.update(chunk_failures)
+                if tracker is not None:
+                    tracker.finish()
+
+                with phase(self.metrics, 'validate.compare'):
+                    for filepath in payload:
+                        relpath = os.path.relpath(filepath, self.bag_directory)
+                        if filepath in failures:
+                            errors.append((relpath, 'File could not be read: {0}'.format(failures[filepath])))
+                            continue
+
+                        for algorithm in algorithms:
+                            if algorithm == self.hash_encoding:
+                                manifest, mname = self.manifest_contents, 'manifest'
+                            else:
+                                manifest, mname = self.manifests[algorithm], 'manifest-{0}.txt'.format(algorithm)
+
+                            if relpath in manifest:
+                                if cmp(manifest[relpath], checksums[filepath][algorithm]) != 0:
+                                    errors.append((relpath, 'Incorrect filename or checksum in {0}'.format(mname)))
+                            else:
+                                errors.append((relpath, 'File is not correct in {0}'.format(mname)))
+                        errors.extend(chunk_errors.get(filepath, ()))
+
+                    if sampled is not None:
+                        found = set(os.path.relpath(f, self.bag_directory) for f in payload)
+                        for relpath in sampled:
+                            if relpath not in found:
+                                errors.append((relpath, 'File listed in the manifest is missing'))
         except (BagIsNotValidError, Exception), e:
+            if tracker is not None and tracker.raised:
+                # the progress callback wants us to stop.
+                raise
             errors.append(('checksum verification', 'Problems verifying the manifest: {0}'.format(e)))
 
         self.bag_errors = errors
         return self.bag_errors
 
-    def update(self, full=True):
+    def update(self, full=True, processes=None, strict=False):
         """ Scans the data directory, adds any new files it finds to the
             manifest, and removes any files from the manifest that it does not
             find in the directory.
 
+            Checksums are calculated in this process by multichecksum, using
+            a pool of worker processes (see validate() for the meaning of
+            processes). A manifest is written for each of the bag's hash
+            encodings, all from a single read of each file. Any files that
+            could not be read are left out of the manifests and reported in
+            bag_errors, which is cleared at the start of each update. If the bag has a bag-info.txt, the total size and
+            number of the files in the manifest are written to it as the
+            Payload-Oxum. If the bag has a chunk size, the chunk manifest is
+            brought up to date too (see set_chunk_size()).
+
+            If the bag has a checksum cache, it decides which files need to
+            be read again, whether or not the update is full; files changed
+            since the last update are noticed either way. strict works as in
+            validate().
+
         Args:
             full (bool): Only add new files and remove missing files and skip
             reindexing of previously indexed files
         """
-
-        filelist = os.listdir(self.bag_directory)
-
-        # Read old manifest so we can detect new, existing and deleted files
-        md5_hashes = dict()
-        sha1_hashes = dict()
-        datamanifests = [f for f in filelist
-                         if re.match(r"^manifest-(sha1|md5)\.txt", f)]
-        for man in datamanifests:
-            man = os.path.join(self.bag_directory, man)
-            if 'manifest-md5.txt' in man:
-                for line in codecs.open(man, 'rb', self.tag_file_encoding):
-                    hash_, file_ = line.split(' ', 1)
-                    md5_hashes[file_] = hash_
-            elif 'manifest-sha1.txt' in man:
-                for line in codecs.open(man, 'rb', self.tag_file_encoding):
-                    hash_, file_ = line.split(' ', 1)
-                    sha1_hashes[file_] = hash_
-
-            if full:
-                os.unlink(man)
-
-        # clean up any old manifest files. We'll be regenerating them later.
-        tagmanifests = [f for f in filelist
-                        if re.match(r"^tagmanifest-(sha1|md5)\.txt", f)]
-        for man in tagmanifests:
-            man = os.path.join(self.bag_directory, man)
-            os.unlink(man)
+        self._check_writable()
+        self.bag_errors = []
+
+        with phase(self.metrics, 'update.read_manifests'):
+            filelist = os.listdir(self.bag_directory)
+
+            # Read old manifest so we can detect new, existing and deleted files
+            known_files = set()
+            known_hashes = dict()  # {file: {algorithm: checksum}} in the bag's hash encodings
+            datamanifests = [f for f in filelist if MANIFEST_RE.match(f)]
+            for man in datamanifests:
+                algorithm = MANIFEST_RE.match(man).group('algorithm')
+                man = os.path.join(self.bag_directory, man)
+                for file_, hash_ in read_manifest(man, self.tag_file_encoding):
+                    file_ = os.path.normpath(file_)
+                    known_files.add(file_)
+                    if algorithm in self.hash_encodings:
+                        known_hashes.setdefault(file_, {})[algorithm] = hash_
+
+            # the old manifests stay on disk until the new ones are written
+            # over them, so an update that is stopped part way (e.g. by a
+            # progress callback raising) leaves the bag as it was.
 
         self.new_files = set()
         self.existing_files = set()
         self.removed_files = set()
 
-        for path, dirs, files in os.walk(self.data_directory):
-            # add an empty .keep file in empty directories.
-            if not dirs and not files:
-                open(os.path.join(path, '.keep'), 'w').close()
-
-            for name in files:
-                self.new_filesfile = self._sanitize_filename(name)
+        # the time spent sanitising is taken out of the walk's time.
+        timed = self.metrics is not None
+        walk_start = time.time()
+        sanitise_seconds = 0.0
+
+        # one scan of the data directory, whose stat()s are used from here
+        # on instead of stat()ing every file again.
+        scan = scan_tree(u"{0}".format(self.data_directory), self.scan_threads)
+
+        # add an empty .keep file in empty directories.
+        for path in scan.empty_dirs:
+            keep = os.path.join(path, '.keep')
+            open(keep, 'w').close()
+            scan.add(keep)
+
+        for index, full_file in enumerate(scan.files):
+            if timed:
+                sanitise_start = time.time()
+            path, name = os.path.split(full_file)
+            self.new_filesfile = self._sanitize_filename(name)
+            if self.new_filesfile != name:
                 full_file = os.path.join(path, self.new_filesfile)
-                if self.new_filesfile != name:
-                    os.rename(os.path.join(path, name), full_file)
-
-                relative_file = os.path.relpath(full_file, self.data_directory)
-                if relative_file in md5_hashes:
-                    self.existing_files.add(relative_file)
-                elif relative_file in sha1_hashes:
-                    self.existing_files.add(relative_file)
-                else:
-                    self.new_files.add(relative_file)
+                os.rename(os.path.join(path, name), full_file)
+                scan.rename(index, full_file)
+            if timed:
+                sanitise_seconds += time.time() - sanitise_start
+
+            relative_file = os.path.relpath(full_file, self.bag_directory)
+            if relative_file in known_files:
+                self.existing_files.add(relative_file)
+            else:
+                self.new_files.add(relative_file)
 
-        known_files = set(md5_hashes) | set(sha1_hashes)
         self.removed_files = known_files - self.existing_files
-        self.existing_files -= self.removed_files
-
-        # checksum the data directory
-        cmd = [
-            sys.executable,
-            self._path_to_multichecksum,
-            "-a", self.hash_encoding,
-            "-c", self.tag_file_encoding,
-            self.data_directory,
-        ]
-        if not full:
-            cmd.append('-u')
-        p = subprocess.Popen(cmd, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE)
-
-        while p.returncode is None:
-            time.sleep(0.1)
-            p.poll()
-
-        # read in the manifest to an instance variable
-        self._read_manifest_to_dict()
-
-        # clean out any previous tag manifest contents.
-        self.tag_manifest_contents = {}
-        for f in ['bagit.txt', 'bag-info.txt', 'fetch.txt', self.manifest_file]:
-            csum = self._calculate_checksum(os.path.join(self.bag_directory, f))
-            relp = os.path.relpath(os.path.join(self.bag_directory, f), self.bag_directory)
-            self.tag_manifest_contents[relp] = csum
-
-        # write out the tag manifest
-        self._write_dict_to_manifest(mode="t")
-
-        # read it back in
-        self._read_manifest_to_dict(mode="t")
-
-    def fetch(self, validate_downloads=False):
+        payload = scan.files
+        if timed:
+            self.metrics.add_time('update.walk', time.time() - walk_start - sanitise_seconds)
+            self.metrics.add_time('update.sanitise', sanitise_seconds)
+
+        # checksum the data directory. On a partial update we only need to
+        # checksum the files we don't already have every checksum for.
+        manifests = dict((alg, Manifest(alg)) for alg in self.hash_encodings)
+        cache = self._get_checksum_cache()
+        if cache is not None:
+            cache.prune(os.path.relpath(f, self.bag_directory) for f in payload)
+        elif not full:
+            reused = set()
+            for relative_file in self.existing_files:
+                csums = known_hashes.get(relative_file, {})
+                if len(csums) == len(self.hash_encodings):
+                    for alg, csum in csums.iteritems():
+                        manifests[alg][relative_file] = csum
+                    reused.add(relative_file)
+            payload = [f for f in payload
+                       if os.path.relpath(f, self.bag_directory) not in reused]
+
+        # large files get their chunk digests from the same read.
+        fresh_chunks = dict()
+        tracker = self._progress_tracker('update', payload, sizes=scan.sizes(payload))
+        with phase(self.metrics, 'update.hash'):
+            checksums, failures = self._checksum_files(payload, self.hash_encodings, processes, strict, tracker,
+                                                       scanned=scan.stats, chunk_size=self.chunk_size,
+                                                       chunks=fresh_chunks)
+        for full_file, csums in checksums.iteritems():
+            relp = os.path.relpath(full_file, self.bag_directory)
+            for alg, csum in csums.iteritems():
+                manifests[alg][relp] = csum
+        for full_file, error in sorted(failures.iteritems()):
+            relp = os.path.relpath(full_file, self.bag_directory)
+            self.bag_errors.append((relp, 'File could not be read: {0}'.format(error)))
+
+        self.manifests = manifests
+        self.manifest_contents = manifests[self.hash_encoding]
+        with phase(self.metrics, 'update.write_manifests'):
+            for alg in self.hash_encodings:
+                self._write_dict_to_manifest(algorithm=alg)
+
+        if self.chunk_size is not None or self.chunk_manifest is not None:
+            with phase(self.metrics, 'update.chunks'):
+                self._update_chunk_manifest(scan.files, processes, scan.stats, fresh_chunks)
+
+        with phase(self.metrics, 'update.tag_manifests'):
+            self._update_payload_oxum(scan.stats)
+            self._update_tag_manifests()
+
+        if tracker is not None:
+            tracker.finish()
+
+    def watch(self, debounce=1.0, processes=1, sync=True):
+        """ Returns a pybagit.watch.BagWatcher, which keeps the manifests
+            in sync with the data directory as files change in it, only
+            checksumming the files that changed. If sync is True, the bag is
+            first brought up to date with update(full=False).
+
+            Linux only, since it relies on inotify.
+        """
+        return BagWatcher(self, debounce, processes, sync)
+
+    def fetch(self, validate_downloads=False, workers=4, per_host=2, retries=3):
         """ Downloads files into the data directory.
 
+            Up to workers files are downloaded at once, with no more than
+            per_host connections to any one server. Connections are kept
+            alive between files, failed downloads are retried up to retries
+            times, and partially downloaded files are resumed.
+
+            Every download is checksummed as it arrives. Files the manifests
+            already list are only moved into place if they match them; if
+            validate_downloads is True, files they don't list yet are added
+            to the manifests, and the manifests and tag manifests are
+            rewritten, without reading the payload again. The Payload-Oxum
+            in bag-info.txt is brought up to date with the downloads.
         """
+        self._check_writable()
 
+        entries = []
+        urls = dict()
         for entry in self.fetch_contents:
-            try:
-                if not os.path.exists(os.path.join(self.bag_directory, entry['filename'])):
-                    dwnlddir = os.path.join(self.bag_directory, os.path.dirname(entry['filename']))
-                    filename = os.path.basename(entry['filename'])
-                    if not os.path.exists(dwnlddir):
-                        os.makedirs(dwnlddir)
-                    urllib.urlretrieve(entry['url'], os.path.join(dwnlddir, filename))
-                else:
-                    # file already downloaded to bag. Continue.
-                    continue
-            except Exception, e:
-                self.bag_errors.append(('fetch', 'URL {0} could not be downloaded {1}'.format(entry['url'], e)))
-                continue
-
-        if validate_downloads:
-            self.update()
-            self.validate()
+            destination = os.path.join(self.bag_directory, entry['filename'])
+            if not os.path.exists(destination):
+                relpath = os.path.normpath(entry['filename'])
+                expected = dict((alg, manifest[relpath]) for alg, manifest in self.manifests.iteritems()
+                                if relpath in manifest)
+                entries.append((entry['url'], destination, expected))
+                urls[destination] = entry['url']
+            # otherwise, the file is already downloaded to the bag.
+
+        algorithms = set(self.hash_encodings) | set(self.manifests)
+        tracker = self._progress_tracker('fetch', files_total=len(entries))
+        fetcher = Fetcher(workers=workers, per_host=per_host, retries=retries, algorithms=algorithms,
+                          metrics=self.metrics, progress=tracker and tracker.advance)
+        with phase(self.metrics, 'fetch.download'):
+            checksums, failures = fetcher.fetch(entries)
+        for destination, error in sorted(failures.iteritems()):
+            self.bag_errors.append(('fetch', 'URL {0} could not be downloaded {1}'.format(urls[destination], error)))
+
+        if checksums:
+            with phase(self.metrics, 'fetch.write_manifests'):
+                changed = False
+                if validate_downloads:
+                    for alg in self.hash_encodings:
+                        manifest = self.manifests.setdefault(alg, Manifest(alg))
+                        for destination, csums in checksums.iteritems():
+                            manifest[os.path.relpath(destination, self.bag_directory)] = csums[alg]
+                    self.manifest_contents = self.manifests[self.hash_encoding]
+                    for alg in self.hash_encodings:
+                        self._write_dict_to_manifest(algorithm=alg)
+                    changed = True
+                # the downloads count towards the Payload-Oxum.
+                if self._update_payload_oxum() or changed:
+                    self._update_tag_manifests()
+
+        if tracker is not None:
+            tracker.finish()
 
     def add_fetch_entries(self, fetch_entry, append=True):
         """ Takes a list containing a dictionary of URLs and filenames.
@@ -369,6 +678,7 @@ class BagIt:
 
             !!! TODO calculate actual length of file, instead of encoding '-'
         """
+        self._check_writable()
         fetch_items = []
         for item in fetch_entry:
             fetch_items.append({'url': item['url'],
@@ -384,20 +694,56 @@ class BagIt:
 
         self._write_list_to_fetch()
 
-    def package(self, destination, method="tgz"):
+    def package(self, destination, method="tgz", processes=1, compresslevel=9):
         """ zip the bag into a package. Can be either .zip or .tar.gz.
 
-            You must specify a destination to copy the final package to.
+            You must specify a destination for the package. It can be:
+                - a directory, in which case the package is written to
+                  <destination>/<bag name>.<method>;
+                - the path of the package file to write;
+                - a writable file-like object, such as a socket, a pipe or
+                  a subprocess' stdin. It does not need to be seekable.
+
+            The archive is streamed straight to the destination; no copy of
+            the bag is made on disk. Returns the path to the package, or the
+            file-like object it was written to.
+
+            For tgz packages, processes > 1 compresses blocks of the archive
+            on that many threads (None uses one per CPU). compresslevel sets
+            the gzip compression level, from 1 (fastest) to 9 (smallest).
          """
-        if method.lower() not in ('zip', 'tgz'):
+        self._check_writable()
+        method = method.lower()
+        if method not in ('zip', 'tgz'):
             raise BagError('You must specify either "zip" or "tgz"')
 
-        package = self._compress_bag(method)
-        shutil.move(package, destination)
-        if os.path.exists(os.path.join(destination, os.path.basename(package))):
-            return os.path.join(destination, os.path.basename(package))
-        else:
-            raise BagError("Uh oh! We've lost track of a file...")
+        if hasattr(destination, 'write'):
+            with phase(self.metrics, 'package.compress'):
+                self._compress_bag(destination, method, processes=processes, compresslevel=compresslevel)
+            return destination
+
+        if os.path.isdir(destination):
+            bagname = ".".join((os.path.basename(os.path.normpath(self.bag_directory)), method))
+            destination = os.path.join(destination, bagname)
+
+        # write next to the destination and rename it once it is complete,
+        # so that an interrupted package never looks like a finished one.
+        partial = "{0}.part".format(destination)
+        pfile = open(partial, 'wb')
+        try:
+            with phase(self.metrics, 'package.compress'):
+                self._compress_bag(pfile, method, processes=processes, compresslevel=compresslevel)
+            pfile.close()
+            if self.platform == "win32" and os.path.exists(destination):
+                os.remove(destination)
+            os.rename(partial, destination)
+        except:
+            pfile.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+        return destination
 
     # private
     def _create_bag(self):
@@ -454,26 +800,512 @@ class BagIt:
             binfofile.close()
             self._read_baginfo_to_dict()
 
-    def _calculate_checksum(self, filepath):
-        """ Taken from
-            http://abstracthack.wordpress.com/2007/10/19/calculating-md5-checksum/
+    def _update_tag_manifests(self):
+        """ Rewrites the tag manifests for each of the bag's hash encodings,
+            removing any manifest or tag manifest for an algorithm that is
+            no longer one of them.
+        """
+        for f in os.listdir(self.bag_directory):
+            match = MANIFEST_RE.match(f) or TAGMANIFEST_RE.match(f)
+            if match and match.group('algorithm') not in self.hash_encodings:
+                os.unlink(os.path.join(self.bag_directory, f))
+                self.manifests.pop(match.group('algorithm'), None)
+                self.tag_manifests.pop(match.group('algorithm'), None)
+
+        # clean out any previous tag manifest contents, and checksum the tag
+        # files (including every payload manifest) with each hash encoding.
+        tag_manifests = dict((alg, Manifest(alg)) for alg in self.hash_encodings)
+        tagfiles = ['bagit.txt', 'bag-info.txt', 'fetch.txt']
+        tagfiles.extend(sorted(f for f in os.listdir(self.bag_directory)
+                               if MANIFEST_RE.match(f) or CHUNKMANIFEST_RE.match(f)))
+        for f in tagfiles:
+            if not os.path.exists(os.path.join(self.bag_directory, f)):
+                continue
+            csums, fname = multichecksum.csumfile(os.path.join(self.bag_directory, f), self.hash_encodings)
+            for alg, csum in csums.iteritems():
+                tag_manifests[alg][f] = csum
+
+        # write out the tag manifests, and read them back in
+        self.tag_manifests = tag_manifests
+        self.tag_manifest_contents = tag_manifests[self.hash_encoding]
+        for alg in self.hash_encodings:
+            self._write_dict_to_manifest(mode="t", algorithm=alg)
+            self._read_manifest_to_dict(mode="t", algorithm=alg)
+
+    def _update_payload_oxum(self, stats=None):
+        """ Records the total size and number of the files in the manifest
+            as the Payload-Oxum in bag-info.txt. Bags without a bag-info.txt
+            are left alone. Returns True if bag-info.txt was written.
+
+            stats may be the {filepath: stat result} of a Scan of the data
+            directory, which saves stat()ing the files again.
         """
+        if self.baginfo_file is None:
+            return False
 
-        # getattr converts the hash_encoding to a method argument for hashlib.
-        block_size = 0x10000
-        hashalg = getattr(hashlib, self.hash_encoding)()  # == 'hashlib.md5' or 'hashlib.sha1'
+        octets = 0
+        count = 0
+        for relpath in self.manifest_contents:
+            filepath = os.path.join(self.bag_directory, relpath)
+            if stats is not None and filepath in stats:
+                st = stats[filepath]
+            else:
+                st = self._stat(filepath)
+            if st is None:
+                # not downloaded yet, or gone since the manifest was written.
+                continue
+            octets += st.st_size
+            count += 1
+        self._set_baginfo_field('Payload-Oxum', "{0}.{1}".format(octets, count))
+        return True
+
+    def _update_chunk_manifest(self, filepaths, processes=None, stats=None, fresh=None):
+        """ Writes the chunk digests of the files in filepaths that are
+            larger than the chunk size. fresh may give {filepath: chunks}
+            that were checksummed along with the manifests; otherwise the
+            ones that still roll up into the file's manifest checksum are
+            reused. The chunks of the other files are checksummed in
+            parallel. stats works as in _update_payload_oxum().
+        """
+        chunkname = "chunkmanifest-{0}.txt".format(self.hash_encoding)
+        for f in os.listdir(self.bag_directory):
+            if CHUNKMANIFEST_RE.match(f) and (f != chunkname or self.chunk_size is None):
+                os.unlink(os.path.join(self.bag_directory, f))
+        old = self.chunk_manifest
+        if old is not None and (old.algorithm != self.hash_encoding or old.chunk_size != self.chunk_size):
+            old = None
+        self.chunk_manifest = None
+        if self.chunk_size is None:
+            return
 
-        def upd(m, data):
-            m.update(data)
-            return m
-        fd = open(filepath, 'rb')
+        chunks = ChunkManifest(self.hash_encoding, self.chunk_size)
+        pending = dict()
+        ranges = []
+        for filepath in filepaths:
+            relpath = os.path.relpath(filepath, self.bag_directory)
+            checksum = self.manifest_contents.get(relpath)
+            st = stats.get(filepath) if stats is not None else self._stat(filepath)
+            if st is None:
+                continue
+            size = st.st_size
+            if checksum is None or size <= self.chunk_size:
+                continue
+            if fresh and filepath in fresh and sum(c[1] for c in fresh[filepath]) == size:
+                chunks.set(relpath, checksum, size, fresh[filepath])
+                continue
+            known = old and old.get(relpath, checksum)
+            if known and known[0] == size:
+                chunks.set(relpath, checksum, size, known[1])
+                continue
+            pending[filepath] = (relpath, checksum, size)
+            ranges.extend((filepath, offset, length) for offset, length in chunk_ranges(size, self.chunk_size))
+
+        results, failures = multichecksum.checksum_ranges(ranges, self.hash_encoding, processes)
+        for filepath, (relpath, checksum, size) in sorted(pending.iteritems()):
+            file_chunks = []
+            for offset, length in chunk_ranges(size, self.chunk_size):
+                if (filepath, offset) in failures:
+                    self.bag_errors.append((relpath, 'File could not be read: {0}'.format(failures[(filepath, offset)])))
+                    break
+                file_chunks.append((offset, length, results[(filepath, offset)]))
+            else:
+                chunks.set(relpath, checksum, size, file_chunks)
+
+        chunks.write(os.path.join(self.bag_directory, chunkname), self.tag_file_encoding)
+        self.chunk_manifest = chunks
+
+    def _chunked_files(self, filepaths):
+        """ Returns {filepath: (relpath, size, chunks)} for the files in
+            filepaths that have chunk digests rolling up into their current
+            manifest checksum.
+        """
+        chunks = self.chunk_manifest
+        if chunks is None or self._archive is not None:
+            return dict()
+        if chunks.algorithm == self.hash_encoding:
+            manifest = self.manifest_contents
+        else:
+            manifest = self.manifests.get(chunks.algorithm, {})
+
+        chunked = dict()
+        for filepath in filepaths:
+            relpath = os.path.relpath(filepath, self.bag_directory)
+            entry = chunks.get(relpath, manifest.get(relpath))
+            if entry is not None and relpath in manifest:
+                chunked[filepath] = (relpath, entry[0], entry[1])
+        return chunked
+
+    def _check_chunk_manifest(self):
+        """ Checks the chunk manifest against the tag manifests that list
+            it. Returns (vouched, errors): vouched is True if one of them
+            does and every one that does matches.
+        """
+        chunkname = "chunkmanifest-{0}.txt".format(self.chunk_manifest.algorithm)
+        path = os.path.join(self.bag_directory, chunkname)
+        vouched = False
+        errors = []
+        for algorithm, tag_manifest in sorted(self.tag_manifests.iteritems()):
+            expected = tag_manifest.get(chunkname)
+            if expected is None:
+                continue
+            try:
+                actual = multichecksum.csumfile(path, algorithm)[0]
+            except (IOError, OSError), e:
+                errors.append((chunkname, 'File could not be read: {0}'.format(e)))
+                break
+            if actual != expected:
+                errors.append((chunkname, 'Incorrect checksum in tagmanifest-{0}.txt'.format(algorithm)))
+            else:
+                vouched = True
+        return (vouched and not errors, errors)
+
+    def _verify_chunks(self, chunked, algorithms, processes=None, tracker=None):
+        """ Checks the files from _chunked_files() against their chunk
+            digests.
+
+            If the chunk manifest's algorithm is the only one to check, all
+            of the chunks are checksummed in parallel, and a file whose
+            chunks all match, and that is still the size they add up to, is
+            given its manifest checksum, since that is what its chunks roll
+            up into. Otherwise each file is read once, front to back, for
+            its chunks and its full checksum in every algorithm.
+
+            Returns the same ({filepath: {algorithm: checksum}},
+            {filepath: error}) tuple as _checksum_files(), and
+            {filepath: [errors]} naming the byte ranges that did not match.
+        """
+        algorithm = self.chunk_manifest.algorithm
+        chunkname = "chunkmanifest-{0}.txt".format(algorithm)
+        checksums = dict()
+        errors = dict()
+
+        if algorithms == [algorithm]:
+            ranges = [(filepath, offset, length)
+                      for filepath, (relpath, size, chunks) in chunked.iteritems()
+                      for offset, length, csum in chunks]
+            results, read_failures = multichecksum.checksum_ranges(ranges, algorithm, processes)
+            read = None
+            failures = dict()
+        else:
+            read = dict()
+            progress = tracker and tracker.advance
+            ordered = [algorithm] + [a for a in algorithms if a != algorithm]
+            checksums, failures = multichecksum.checksum_files(sorted(chunked), ordered, processes, self.metrics,
+                                                               progress, chunk_size=self.chunk_manifest.chunk_size,
+                                                               chunks=read)
+
+        for filepath, (relpath, size, chunks) in sorted(chunked.iteritems()):
+            if read is not None:
+                if filepath not in failures:
+                    found = dict((offset, (length, csum)) for offset, length, csum in read.get(filepath, ()))
+                    actual = sum(length for length, csum in found.itervalues())
+                    errors[filepath] = [(relpath, 'Bytes {0}-{1} do not match {2}'.format(offset, offset + length - 1,
+                                                                                          chunkname))
+                                        for offset, length, csum in chunks
+                                        if found.get(offset) != (length, csum)]
+                    if actual != size:
+                        errors[filepath].append((relpath, 'File is {0} bytes, but {1} bytes in {2}'.format(
+                            actual, size, chunkname)))
+                continue
+
+            file_errors = []
+            for offset, length, csum in chunks:
+                if (filepath, offset) in read_failures:
+                    failures[filepath] = read_failures[(filepath, offset)]
+                    break
+                if results[(filepath, offset)] != csum:
+                    file_errors.append((relpath, 'Bytes {0}-{1} do not match {2}'.format(offset, offset + length - 1, chunkname)))
+            try:
+                actual = os.path.getsize(filepath)
+            except OSError, e:
+                failures.setdefault(filepath, str(e))
+            if tracker is not None:
+                tracker.advance(filepath)
+            if filepath in failures:
+                continue
+
+            if actual != size:
+                file_errors.append((relpath, 'File is {0} bytes, but {1} bytes in {2}'.format(actual, size, chunkname)))
+            manifest = self.manifest_contents if algorithm == self.hash_encoding else self.manifests[algorithm]
+            checksums[filepath] = {algorithm: None if file_errors else manifest.get(relpath)}
+            errors[filepath] = file_errors
+        return (checksums, failures, errors)
+
+    def _get_checksum_cache(self):
+        """ Returns the bag's ChecksumCache, or None if it doesn't use one. """
+        if not self.checksum_cache:
+            return None
+        if self._checksum_cache is None:
+            if self.checksum_cache is True:
+                bag_parent, bag_name = os.path.split(os.path.normpath(self.bag_directory))
+                cache_file = os.path.join(bag_parent, ".{0}.checksum-cache".format(bag_name))
+            else:
+                cache_file = self.checksum_cache
+            self._checksum_cache = ChecksumCache(cache_file, self.tag_file_encoding)
+        return self._checksum_cache
+
+    def _get_checkpoint(self, checkpoint, algorithms, interval=60):
+        """ Returns the ValidationCheckpoint validate(checkpoint=...) asks
+            for, or None.
+        """
+        if not checkpoint:
+            return None
+        if checkpoint is True:
+            bag_parent, bag_name = os.path.split(os.path.normpath(self.bag_directory))
+            checkpoint = os.path.join(bag_parent, ".{0}.validate-checkpoint".format(bag_name))
+        return ValidationCheckpoint(checkpoint, self.bag_directory, algorithms, interval)
+
+    def _checksum_files(self, filepaths, algorithms, processes=None, strict=False, tracker=None, checkpoint=None,
+                        scanned=None, chunk_size=None, chunks=None):
+        """ Checksums payload files with multichecksum, skipping the ones
+            the checksum cache already knows about unless strict is True.
+            Every file, cached or not, advances tracker (a ProgressTracker)
+            if one is given.
+
+            If checkpoint (a ValidationCheckpoint) is given, the files it
+            has already recorded are not read again, and every file that is
+            read is recorded in it. scanned may be the {filepath: stat result}
+            of a Scan that found the files, to save stat()ing them again.
+            Hard links to the same file are only read once. chunk_size and
+            chunks work as in multichecksum.checksum_files(), for the files
+            that are read.
+
+            Returns the same ({filepath: {algorithm: checksum}},
+            {filepath: error}) tuple as multichecksum.checksum_files().
+        """
+        progress = tracker and tracker.advance
+        cache = self._get_checksum_cache()
+        if cache is None and checkpoint is None:
+            return multichecksum.checksum_files(filepaths, algorithms, processes, self.metrics, progress,
+                                                stats=scanned, chunk_size=chunk_size, chunks=chunks)
+
+        checksums = dict()
+        failures = dict()
+        stats = dict()
+        to_checksum = []
+        for filepath in filepaths:
+            st = scanned.get(filepath) if scanned is not None else self._stat(filepath)
+            if st is None:
+                # let multichecksum report it.
+                to_checksum.append(filepath)
+                continue
+
+            relpath = os.path.relpath(filepath, self.bag_directory)
+            if checkpoint is not None:
+                recorded = checkpoint.lookup(relpath, st)
+                if recorded is not None:
+                    if recorded[1] is None:
+                        checksums[filepath] = recorded[0]
+                    else:
+                        failures[filepath] = recorded[1]
+                    if progress is not None:
+                        progress(filepath)
+                    continue
+
+            csums = dict()
+            if cache is not None and not strict:
+                for alg in algorithms:
+                    csum = cache.lookup(relpath, st, alg)
+                    if csum is not None:
+                        csums[alg] = csum
+            if len(csums) < len(algorithms):
+                stats[filepath] = st
+                to_checksum.append(filepath)
+            else:
+                checksums[filepath] = csums
+                if progress is not None:
+                    progress(filepath)
+
+        record = None
+        if checkpoint is not None:
+            def record(filepath, csums, error):
+                if filepath in stats:
+                    checkpoint.record(os.path.relpath(filepath, self.bag_directory), stats[filepath], csums, error)
 
         try:
-            contents = iter(lambda: fd.read(block_size), "")
-            m = reduce(upd, contents, hashalg)
+            results, read_failures = multichecksum.checksum_files(to_checksum, algorithms, processes,
+                                                                  self.metrics, progress, record, stats,
+                                                                  chunk_size, chunks)
         finally:
-            fd.close()
-        return m.hexdigest()
+            # keep what was read before an interruption.
+            if checkpoint is not None:
+                checkpoint.save()
+        if cache is not None:
+            for filepath, csums in results.iteritems():
+                # the stat was taken before the file was read, so a file that
+                # changed while it was being read will be read again next time.
+                if filepath in stats:
+                    for alg, csum in csums.iteritems():
+                        cache.store(os.path.relpath(filepath, self.bag_directory),
+                                    stats[filepath], alg, csum)
+            cache.save()
+        checksums.update(results)
+        failures.update(read_failures)
+
+        return (checksums, failures)
+
+    def _checksum_archive(self, algorithms, tracker=None, only=None):
+        """ Checksums the payload of a bag read from its package, streaming
+            each file out of the package in turn. If only is given, just the
+            files with those paths in the bag are checksummed.
+
+            Returns a tuple of the payload paths (as though the package were
+            a directory), {filepath: {algorithm: checksum}} and
+            {filepath: error}.
+        """
+        payload = []
+        checksums = dict()
+        failures = dict()
+        start = time.time()
+        if only is not None:
+            only = set(only)
+        for name, member, size in self._archive.payload():
+            relpath = os.path.normpath(name.decode(self.tag_file_encoding))
+            if only is not None and relpath not in only:
+                continue
+            filepath = os.path.join(self.bag_directory, relpath)
+            payload.append(filepath)
+            if self.metrics is not None:
+                file_start = time.time()
+            try:
+                checksums[filepath] = multichecksum.csumstream(member, algorithms)
+            except (IOError, zipfile.BadZipfile, zlib.error), e:
+                failures[filepath] = str(e)
+            if self.metrics is not None:
+                self.metrics.record_file(filepath, size, time.time() - file_start)
+            if tracker is not None:
+                tracker.advance(filepath, size)
+        if self.metrics is not None:
+            self.metrics.record_workers(1, time.time() - start)
+        return (payload, checksums, failures)
+
+    def _check_completeness(self):
+        """ The checks of validate(fast=True), which only need the sizes
+            of the payload files.
+        """
+        errors = []
+        sizes = dict()
+        if self._archive is not None:
+            for name, member, size in self._archive.payload():
+                sizes[os.path.join(self.bag_directory, os.path.normpath(name.decode(self.tag_file_encoding)))] = size
+        else:
+            scan = scan_tree(u"{0}".format(self.data_directory), self.scan_threads)
+            for filepath in scan.files:
+                if scan.stats[filepath] is None:
+                    errors.append((os.path.relpath(filepath, self.bag_directory), 'File could not be read'))
+                else:
+                    sizes[filepath] = scan.stats[filepath].st_size
+
+        algorithms = [self.hash_encoding] + sorted(a for a in self.manifests if a != self.hash_encoding)
+        present = set()
+        for filepath in sorted(sizes):
+            relpath = os.path.relpath(filepath, self.bag_directory)
+            present.add(relpath)
+            for algorithm in algorithms:
+                if algorithm == self.hash_encoding:
+                    manifest, mname = self.manifest_contents, 'manifest'
+                else:
+                    manifest, mname = self.manifests[algorithm], 'manifest-{0}.txt'.format(algorithm)
+                if relpath not in manifest:
+                    errors.append((relpath, 'File is not correct in {0}'.format(mname)))
+
+        listed = set(self.manifest_contents)
+        for manifest in self.manifests.itervalues():
+            listed.update(manifest)
+        for relpath in sorted(listed - present):
+            errors.append((relpath, 'File listed in the manifest is missing'))
+
+        oxum = (self.baginfo_contents or {}).get('Payload-Oxum')
+        if oxum is not None:
+            try:
+                octets, count = [int(n) for n in oxum.split('.')]
+            except ValueError:
+                errors.append(('bag-info.txt', 'Payload-Oxum is malformed: {0}'.format(oxum)))
+            else:
+                if (octets, count) != (sum(sizes.itervalues()), len(sizes)):
+                    errors.append(('bag-info.txt', 'Payload-Oxum is {0}, but the payload has {1} bytes in {2} files'.format(
+                                   oxum, sum(sizes.itervalues()), len(sizes))))
+        return errors
+
+    def _sample_manifest(self, sample, seed=None, weight=None):
+        """ Returns the manifest entries that validate(sample=...) checks,
+            in manifest order.
+        """
+        entries = sorted(self.manifest_contents or {})
+        if weight == 'size':
+            if self._archive is not None:
+                sizes = dict((os.path.normpath(name.decode(self.tag_file_encoding)), size)
+                             for name, member, size in self._archive.payload())
+            else:
+                sizes = dict()
+                for relpath in entries:
+                    try:
+                        sizes[relpath] = os.path.getsize(os.path.join(self.bag_directory, relpath))
+                    except OSError:
+                        pass
+            # empty and missing files still have a chance of being picked.
+            weigh = lambda relpath: sizes.get(relpath, 0) + 1
+        elif weight == 'age':
+            cache = self._get_checksum_cache()
+            if cache is None:
+                raise BagError("Weighting a sample by age needs a checksum cache.")
+            now = time.time()
+            weigh = lambda relpath: now - (cache.last_checked(relpath) or 0)
+        elif weight is None or callable(weight):
+            weigh = weight
+        else:
+            raise BagError("weight must be 'size', 'age' or a function; got {0!r}".format(weight))
+
+        return weighted_sample(entries, sample_size(sample, len(entries)), weigh, seed)
+
+    def _progress_tracker(self, operation, filenames=None, files_total=None, sizes=None):
+        """ Returns a ProgressTracker for operation on filenames, or None if
+            nobody is listening for progress. sizes may give their
+            {filename: size}, if they are already known.
+        """
+        if self.progress is None:
+            return None
+        if filenames is not None:
+            if sizes is None:
+                sizes = file_sizes(filenames)
+            return ProgressTracker(self.progress, operation, len(filenames), sizes)
+        return ProgressTracker(self.progress, operation, files_total)
+
+    def _stat(self, path):
+        """ os.stat(), returning None for files that can't be stat()ed. """
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _check_writable(self):
+        if self._archive is not None:
+            raise BagError("{0} was opened without being extracted, and cannot be changed. "
+                           "Open it with extract=True to change it.".format(self._bag))
+
+    def _open_tag_file(self, path):
+        """ Opens a tag file, given its path in the bag directory, for reading
+            in binary mode. Works for bags read from their package too.
+        """
+        if self._archive is not None:
+            return self._archive.open_tag_file(os.path.relpath(path, self.bag_directory))
+        return open(path, 'rb')
+
+    def _has_tag_file(self, path):
+        if self._archive is not None:
+            return os.path.relpath(path, self.bag_directory) in self._archive.tag_files
+        return os.path.exists(path)
+
+    def _has_data_directory(self):
+        if self._archive is not None:
+            return self._archive.has_payload_directory
+        return os.path.exists(self.data_directory)
+
+    def _calculate_checksum(self, filepath):
+        """ Returns the checksum of filepath in the bag's hash encoding,
+            read as multichecksum.csumfile() reads it.
+        """
+        return multichecksum.csumfile(filepath, self.hash_encoding)[0]
 
     def _open_bag(self):
         """ This does its best to open a bag, even if the bag is malformed.
@@ -482,10 +1314,14 @@ class BagIt:
             so that we can deal with them gracefully.
         """
 
-        if self._is_compressed() is True:
+        if self._is_compressed() is True and not self.extract:
+            # the package stands in for the bag directory.
+            self._archive = BagArchive(self._bag, self.bag_compression)
+            self.bag_directory = os.path.abspath(self._bag)
+        elif self.bag_compression is not None:
             # TODO: combine this with the more robust regex from the sanitize filenames method...
             names = re.match(r"^(?P<basename>.*)\.(?P<ext>(zip|tar\.gz|tgz))", self._bag)
-            base = names.group('basename')
+            base = os.path.basename(names.group('basename'))
             bdir = self._uncompress_bag(base)
             self.bag_directory = bdir
         else:
@@ -493,7 +1329,7 @@ class BagIt:
 
         try:
             self.bagit_file = os.path.join(self.bag_directory, 'bagit.txt')
-            bfile = codecs.open(self.bagit_file, 'r', self.tag_file_encoding)
+            bfile = codecs.getreader(self.tag_file_encoding)(self._open_tag_file(self.bagit_file))
             bfile_contents = bfile.read()
             bfile.close()
 
@@ -502,36 +1338,55 @@ class BagIt:
         except:
             self.bag_errors.append(('bagit', 'Had problems reading the Bagit.txt file.'))
 
-        filelist = os.listdir(self.bag_directory)
+        if self._archive is not None:
+            filelist = self._archive.tag_files.keys()
+        else:
+            filelist = os.listdir(self.bag_directory)
 
         if len(filelist) > 0:
-            manifest = filter(lambda f: re.match(r"^manifest-(sha1|md5)\.txt", f), filelist)  # search for the right manifest file.
+            # search for the manifest files. The most preferred algorithm
+            # becomes the bag's hash encoding.
+            manifest = [MANIFEST_RE.match(f).group('algorithm') for f in filelist if MANIFEST_RE.match(f)]
             if manifest:
                 try:
-                    self.hash_encoding = unicode(re.search(r"(?P<encoding>(sha1|md5))", manifest[0]).group('encoding'))
-                    self.manifest_file = os.path.join(self.bag_directory, manifest[0])
-                    self._read_manifest_to_dict()
+                    self.hash_encodings = [unicode(a) for a in PREFERRED_ALGORITHMS if a in manifest]
+                    self.hash_encoding = self.hash_encodings[0]
+                    for alg in self.hash_encodings:
+                        self._read_manifest_to_dict(algorithm=alg)
+                except BagManifestNotValid, e:
+                    self.bag_errors.append(('manifest', 'Had problems reading the manifest file: {0}'.format(e.message)))
                 except:
                     self.bag_errors.append(('manifest', 'Had problems reading the manifest file.'))
 
             self.data_directory = os.path.join(self.bag_directory, 'data')
 
-            tmanifest = filter(lambda f: re.match(r"^tagmanifest-(sha1|md5)\.txt", f), filelist)  # search for the right manifest file.
+            chunkname = "chunkmanifest-{0}.txt".format(self.hash_encoding)
+            if self._archive is None and chunkname in filelist:
+                try:
+                    self.chunk_manifest = ChunkManifest.read(os.path.join(self.bag_directory, chunkname),
+                                                             self.hash_encoding, self.tag_file_encoding)
+                    self.chunk_size = self.chunk_manifest.chunk_size
+                except BagManifestNotValid, e:
+                    self.bag_errors.append(('chunkmanifest', 'Had problems reading the chunk manifest: {0}'.format(e.message)))
+
+            tmanifest = [TAGMANIFEST_RE.match(f).group('algorithm') for f in filelist if TAGMANIFEST_RE.match(f)]
             if tmanifest:
                 try:
-                    self.tag_manifest_file = os.path.join(self.bag_directory, tmanifest[0])
-                    self._read_manifest_to_dict(mode='t')
+                    for alg in tmanifest:
+                        self._read_manifest_to_dict(mode='t', algorithm=unicode(alg))
+                except BagManifestNotValid, e:
+                    self.bag_errors.append(('tagmanifest', 'Had problems reading the tagmanifest file: {0}'.format(e.message)))
                 except:
                     self.bag_errors.append(('tagmanifest', 'Had problems reading the tagmanifest file.'))
 
-            if os.path.exists(os.path.join(self.bag_directory, 'fetch.txt')):
+            if self._has_tag_file(os.path.join(self.bag_directory, 'fetch.txt')):
                 try:
                     self.fetch_file = os.path.join(self.bag_directory, 'fetch.txt')
                     self._read_fetch_to_list()
                 except:
                     self.bag_errors.append(('fetch', 'Had problems reading fetching the files.'))
 
-            if os.path.exists(os.path.join(self.bag_directory, 'bag-info.txt')):
+            if self._has_tag_file(os.path.join(self.bag_directory, 'bag-info.txt')):
                 try:
                     self.baginfo_file = os.path.join(self.bag_directory, 'bag-info.txt')
                     self._read_baginfo_to_dict()
@@ -570,38 +1425,91 @@ class BagIt:
 
         return tdir
 
-    def _compress_bag(self, method="tgz", zip64=True):
-        """ Compresses a bag using a specified method.
-
-            Compresses in a temp directory. Returns a path to that file.
+    def _compress_bag(self, fileobj, method="tgz", zip64=True, processes=1, compresslevel=9):
+        """ Compresses a bag using a specified method, writing the archive
+            to fileobj as it goes. processes and compresslevel only apply to
+            tgz; see package().
         """
-
-        tdir = tempfile.mkdtemp(prefix='bagit_')
-        bagname = ".".join((os.path.basename(self.bag_directory), method))
-        compressed_file = os.path.join(tdir, bagname)
-
-        if method is "zip":
-            z = zipfile.ZipFile(compressed_file, mode='w',
-                                compression=zipfile.ZIP_DEFLATED,
-                                allowZip64=zip64)
-            for d in os.walk(self.bag_directory):
-                for f in d[2]:
-                    # zipfile write takes two arguments. The first is the
-                    # *absolute* path of the file to compress, and the second
-                    # is the *relative* path to the root of the zipfile.
-                    z.write(os.path.join(d[0], f),
-                            os.path.relpath(os.path.join(d[0], f),
-                                            self.bag_directory))
+        members = self._archive_members()
+        tracker = None
+        if self.progress is not None:
+            members = list(members)
+            tracker = self._progress_tracker('package', [p for p, a in members if os.path.isfile(p)])
+
+        if method == "zip":
+            if is_seekable(fileobj):
+                z = zipfile.ZipFile(fileobj, mode='w',
+                                    compression=zipfile.ZIP_DEFLATED,
+                                    allowZip64=zip64)
+            else:
+                z = StreamingZipFile(fileobj, compression=zipfile.ZIP_DEFLATED,
+                                     allowZip64=zip64)
+            for path, arcname in members:
+                if os.path.isdir(path):
+                    continue
+                # zipfile write takes two arguments. The first is the
+                # *absolute* path of the file to compress, and the second
+                # is the *relative* path to the root of the zipfile.
+                if self.metrics is not None:
+                    start = time.time()
+                z.write(path, arcname)
+                if self.metrics is not None:
+                    self.metrics.record_file(path, os.path.getsize(path), time.time() - start)
+                if tracker is not None:
+                    tracker.advance(path)
             z.close()
         else:
-            t = tarfile.open(name=compressed_file, mode='w:gz')
-            # why couldn't zipfile be like this?? So nice...
-            t.add(self.bag_directory,
-                  arcname=os.path.relpath(self.bag_directory,
-                                          self.bag_directory), recursive=True)
-            t.close()
-
-        return compressed_file
+            # a stream, rather than a seekable file, is all we need here.
+            if processes == 1:
+                gz = gzip.GzipFile(filename='', mode='wb', compresslevel=compresslevel, fileobj=fileobj)
+            else:
+                gz = ParallelGzipWriter(fileobj, processes, compresslevel)
+            try:
+                t = tarfile.open(fileobj=gz, mode='w|')
+                t.add(self.bag_directory, arcname=os.curdir, recursive=False)
+                for path, arcname in members:
+                    if self.metrics is not None:
+                        start = time.time()
+                    t.add(path, arcname=os.path.join(os.curdir, arcname), recursive=False)
+                    if self.metrics is not None and os.path.isfile(path):
+                        self.metrics.record_file(path, os.path.getsize(path), time.time() - start)
+                    if tracker is not None and os.path.isfile(path):
+                        tracker.advance(path)
+                t.close()
+            finally:
+                gz.close()
+
+        if tracker is not None:
+            tracker.finish()
+
+    def _archive_members(self):
+        """ Yields (path, relative path) for everything in the bag, in the
+            order it is archived: the tag files first, so that a reader
+            streaming the archive can read them before the payload, and
+            then everything else in sorted order.
+        """
+        root_files = []
+        root_dirs = []
+        for name in sorted(os.listdir(self.bag_directory)):
+            if os.path.isdir(os.path.join(self.bag_directory, name)):
+                root_dirs.append(name)
+            else:
+                root_files.append(name)
+
+        for name in root_files:
+            yield (os.path.join(self.bag_directory, name), name)
+
+        for name in root_dirs:
+            top = os.path.join(self.bag_directory, name)
+            yield (top, name)
+            tree = scan_tree(top, self.scan_threads).tree
+            pending = [top]
+            while pending:
+                dirnames, filenames = tree.get(pending.pop(), ([], []))
+                dirnames = sorted(dirnames)
+                for path in dirnames + sorted(filenames):
+                    yield (path, os.path.relpath(path, self.bag_directory))
+                pending.extend(path for path in reversed(dirnames) if path in tree)
 
     def _parse_encoding_string(self, string):
         re_vstring = re.compile(
@@ -619,7 +1527,7 @@ class BagIt:
         """ Format:
             URL LENGTH FILENAME = [{'url':'', 'length':'', filename:''},...]
         """
-        ffile = codecs.open(self.fetch_file, 'r', self.tag_file_encoding)
+        ffile = codecs.getreader(self.tag_file_encoding)(self._open_tag_file(self.fetch_file))
         fcontents = ffile.readlines()
         ffile.close()
         fetch = []
@@ -658,7 +1566,7 @@ class BagIt:
 
         """
         bag_info = {}
-        bifile = codecs.open(self.baginfo_file, 'r', self.tag_file_encoding)
+        bifile = codecs.getreader(self.tag_file_encoding)(self._open_tag_file(self.baginfo_file))
         bicontents = bifile.readlines()
         bifile.close()
 
@@ -678,23 +1586,75 @@ class BagIt:
 
         self.baginfo_contents = bag_info
 
+    def _set_baginfo_field(self, name, value):
+        """ Sets a field in bag-info.txt, replacing its value where it
+            stands and leaving every other line of the file as it was.
+        """
+        lines = []
+        if os.path.exists(self.baginfo_file):
+            bifile = codecs.open(self.baginfo_file, 'r', self.tag_file_encoding)
+            lines = bifile.readlines()
+            bifile.close()
+
+        field = u"{0}: {1}\n".format(name, value)
+        contents = []
+        replacing = False
+        for line in lines:
+            if line[:1] in (' ', '\t'):
+                # a continued line belongs to the field before it.
+                if not replacing:
+                    contents.append(line)
+                continue
+            replacing = line.split(':', 1)[0].strip().lower() == name.lower()
+            if not replacing:
+                contents.append(line)
+            elif field is not None:
+                contents.append(field)
+                field = None
+        if field is not None:
+            if contents and not contents[-1].endswith('\n'):
+                contents[-1] += '\n'
+            contents.append(field)
+
+        bifile = codecs.open(self.baginfo_file, 'w', self.tag_file_encoding)
+        bifile.writelines(contents)
+        bifile.close()
+
+        bag_info = self.baginfo_contents or {}
+        for key in [k for k in bag_info if k.lower() == name.lower()]:
+            del bag_info[key]
+        bag_info[name] = value
+        self.baginfo_contents = bag_info
+
     def _update_manifest_filenames(self):
         self.manifest_file = os.path.join(self.bag_directory, "manifest-{0}.txt".format(self.hash_encoding))
         self.tag_manifest_file = os.path.join(self.bag_directory, "tagmanifest-{0}.txt".format(self.hash_encoding))
 
-    def _write_dict_to_manifest(self, mode="d"):
+    def _write_dict_to_manifest(self, mode="d", algorithm=None):
+        """ Writes out the manifest for algorithm, which defaults to the
+            bag's hash encoding. The mode parameter works as in
+            _read_manifest_to_dict().
+        """
         # ensure we're working with the latest files.
         self._update_manifest_filenames()
+        algorithm = algorithm or self.hash_encoding
 
         if mode == "d":
-            mparse = self.manifest_file
-            contents = self.manifest_contents
+            mparse = os.path.join(self.bag_directory, "manifest-{0}.txt".format(algorithm))
+            if algorithm == self.hash_encoding:
+                self.manifests[algorithm] = self.manifest_contents
+            contents = self.manifests[algorithm]
         elif mode == "t":
-            mparse = self.tag_manifest_file
-            contents = self.tag_manifest_contents
-
-        mfile = codecs.open(mparse, 'w', self.tag_file_encoding)
-        for k, v in contents.iteritems():
+            mparse = os.path.join(self.bag_directory, "tagmanifest-{0}.txt".format(algorithm))
+            if algorithm == self.hash_encoding:
+                self.tag_manifests[algorithm] = self.tag_manifest_contents
+            contents = self.tag_manifests[algorithm]
+
+        # write next to the manifest and rename it over the old one once it
+        # is complete, so that the old one is never left half written.
+        partial = "{0}.part".format(mparse)
+        mfile = codecs.open(partial, 'w', self.tag_file_encoding)
+        for k, v in sorted(contents.iteritems()):
             # unix pathnames are the only ones acceptable in a manifest file.
             # this will ensure that if we're on Windows, we're still writing
             # unix/style/pathnames, even though the manifest contains windows\style\pathnames.
@@ -704,59 +1664,54 @@ class BagIt:
             # we write this to the manifest reversing the checksum & path.
             mfile.write(u"{0} {1}\n".format(v, k))
         mfile.close()
+        if self.platform == "win32" and os.path.exists(mparse):
+            os.remove(mparse)
+        os.rename(partial, mparse)
 
-    def _read_manifest_to_dict(self, mode="d"):
-        """ We munge the manifest entries like this:
-                - if we're in sha1, the keylen is 40
-                - if we're in md5, the keylen is 32
-            The manifest entries are split at the end of the key length
-            and then assigned to the manifest dictionary, indexed by path name
+    def _read_manifest_to_dict(self, mode="d", algorithm=None):
+        """ The manifest is streamed through read_manifest(), which splits
+            each entry at the first whitespace, and the entries are assigned
+            to the manifest dictionary, indexed by path name.
 
             The mode parameter switches the manifest file that we are parsing.
                 - "d" is for the data manifest file ('manifest.??.txt')
                 - "t" is for the tag manifest file ('tagmanifest.??.txt')
 
-            *PHEW!* """
+            The algorithm defaults to the bag's hash encoding. Malformed
+            manifests raise BagManifestNotValid.
+        """
 
-        keylen = '40' if self.hash_encoding == u'sha1' else '32'
+        algorithm = algorithm or self.hash_encoding
 
         # ensure we're always getting the latest file.
         self._update_manifest_filenames()
 
         if mode == "d":
-            mparse = self.manifest_file
+            mparse = os.path.join(self.bag_directory, "manifest-{0}.txt".format(algorithm))
         elif mode == "t":
-            mparse = self.tag_manifest_file
+            mparse = os.path.join(self.bag_directory, "tagmanifest-{0}.txt".format(algorithm))
 
-        mfile = codecs.open(mparse, 'r', self.tag_file_encoding)
-        mcontents = mfile.readlines()
-        mfile.close()
-        manifest = {}
-        # we have to use old-style string formatting here.
-        splitreg = re.compile(r"^([a-f0-9]{%s})" % (keylen,))
-        if len(mcontents) > 0:
-            for line in mcontents:
-                # we index by pathname, since that's almost certainly
-                # unique (checksums can be the same for duplicate files...)
-                # this is contrary to the way it's stored in the manifest,
-                # so we simply reverse the input.
-                ent = re.split(splitreg, line)
-                # clean up the entries: discard empty items and strip whitespace
-                # from the beginning of the file path.
-                v, k = [x.strip() for x in ent if x.strip()]
-
-                # for Windows compatibility when *reading* a bag we need to ensure
-                # that it can resolve the paths. This will set any forward slashes to back
-                # slashes so that Windows can figure out where the file is.
-                if self.platform == "win32":
-                    k = os.path.normpath(k)
-
-                manifest[k] = v
+        # we index by pathname, since that's almost certainly
+        # unique (checksums can be the same for duplicate files...)
+        # this is contrary to the way it's stored in the manifest,
+        # so read_manifest() reverses the input for us.
+        entries = read_manifest(self._open_tag_file(mparse), self.tag_file_encoding)
+        if self.platform == "win32":
+            # for Windows compatibility when *reading* a bag we need to ensure
+            # that it can resolve the paths. This will set any forward slashes to back
+            # slashes so that Windows can figure out where the file is.
+            entries = ((os.path.normpath(k), v) for k, v in entries)
+
+        manifest = Manifest(algorithm, entries)
 
         if mode == "d":
-            self.manifest_contents = manifest
+            self.manifests[algorithm] = manifest
+            if algorithm == self.hash_encoding:
+                self.manifest_contents = manifest
         elif mode == "t":
-            self.tag_manifest_contents = manifest
+            self.tag_manifests[algorithm] = manifest
+            if algorithm == self.hash_encoding:
+                self.tag_manifest_contents = manifest
 
     def _sanitize_filename(self, filename):
         """ Replaces or removes characters from filenames to make them
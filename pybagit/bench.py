@@ -1,10 +1,299 @@
-import os
-import timeit
+#!/usr/bin/env python
+
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
 
-pyb_statement = """
-    import os
-    os.system("~/Documents/code/git/pybagit/pybagit/multichecksum.py ~/Documents/code/git/edsu-bagit/newbag/data")
+
+""" Benchmarks for PyBagIt.
+
+    Generates synthetic bags of several shapes and times the common bag
+    operations on them, e.g.
+
+        python -m pybagit.bench --shapes tiny,huge --repeat 5 --scale 0.5
+
+    Run it against two releases with the same options (and --seed) to
+    compare them. Files are generated once per shape and then read from the
+    page cache, so the results measure pybagit rather than the disk.
 """
 
-t = timeit.Timer(pyb_statement)
-print "pybagit took %.2f seconds" % (10 * t.timeit(number=10) / 10)
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from pybagit.bagit import BagIt
+
+POOL_SIZE = 1024 * 1024
+
+# name: (description, number of files, (smallest, largest) file size, directory layout)
+SHAPES = {
+    'tiny': ("many tiny files", 10000, (0, 4096), 'spread'),
+    'huge': ("a few huge files", 4, (32 * 1024 * 1024, 32 * 1024 * 1024), 'flat'),
+    'deep': ("a deep directory tree", 2000, (1024, 64 * 1024), 'deep'),
+    'wide': ("one wide directory", 5000, (1024, 16 * 1024), 'flat'),
+}
+SHAPE_ORDER = ('tiny', 'huge', 'deep', 'wide')
+
+OPERATIONS = ('create', 'update-full', 'update-partial', 'validate',
+              'package-zip', 'package-tgz', 'open-zip', 'open-tgz',
+              'validate-zip-inplace', 'validate-tgz-inplace')
+
+
+class Payload(object):
+    """ Writes reproducible file contents: slices of a pool of random bytes,
+        which is generated once from the seed.
+    """
+    def __init__(self, rng):
+        self.rng = rng
+        self.pool = "".join(chr(rng.getrandbits(8)) for i in xrange(POOL_SIZE))
+
+    def write(self, filename, size):
+        fl = open(filename, 'wb')
+        try:
+            while size > 0:
+                start = self.rng.randrange(POOL_SIZE)
+                block = self.pool[start:start + size]
+                fl.write(block)
+                size -= len(block)
+        finally:
+            fl.close()
+
+
+def generate_payload(datadir, shape, scale, payload):
+    """ Fills datadir with the files for shape. Returns (files, bytes). """
+    description, count, (smallest, largest), layout = SHAPES[shape]
+    count = max(1, int(count * scale))
+    if layout == 'flat' and shape == 'huge':
+        # scale the size of huge files, rather than their number.
+        count = SHAPES[shape][1]
+        smallest = largest = max(1, int(largest * scale))
+
+    total = 0
+    for i in xrange(count):
+        if layout == 'spread':
+            directory = os.path.join(datadir, "dir{0:03d}".format(i % 100))
+        elif layout == 'deep':
+            # a chain of directories, 50 levels deep, with files at every level.
+            directory = os.path.join(datadir, *["level{0}".format(d) for d in xrange(i % 50 + 1)])
+        else:
+            directory = datadir
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        size = payload.rng.randint(smallest, largest)
+        payload.write(os.path.join(directory, "file{0:06d}.bin".format(i)), size)
+        total += size
+    return (count, total)
+
+
+class Benchmark(object):
+    def __init__(self, workdir, shape, scale, seed, processes):
+        self.workdir = workdir
+        self.shape = shape
+        self.scale = scale
+        self.processes = processes
+        self.payload = Payload(random.Random("{0}-{1}".format(seed, shape)))
+        self.bagdir = os.path.join(workdir, shape)
+        self.files = 0  # the files and bytes in the bag's payload
+        self.bytes = 0
+        self.processed = None  # the (files, bytes) the last operation read, if not the whole payload
+        self._extra = 0
+
+    def setup(self):
+        """ Generates the payload, outside of any timing. """
+        self.source = os.path.join(self.workdir, "{0}-payload".format(self.shape))
+        os.makedirs(self.source)
+        self.files, self.bytes = generate_payload(self.source, self.shape, self.scale, self.payload)
+
+    def run(self, operation):
+        """ Runs operation once. Returns the seconds it took, and the
+            number of files and bytes it processed.
+        """
+        self.processed = None
+        prepare = getattr(self, "prepare_{0}".format(operation.replace('-', '_')), None)
+        if prepare is not None:
+            prepare()
+        method = getattr(self, "time_{0}".format(operation.replace('-', '_')))
+        start = time.time()
+        method()
+        elapsed = time.time() - start
+        cleanup = getattr(self, "cleanup_{0}".format(operation.replace('-', '_')), None)
+        if cleanup is not None:
+            cleanup()
+        files, nbytes = self.processed or (self.files, self.bytes)
+        return (elapsed, files, nbytes)
+
+    def _archive(self, method):
+        return os.path.join(self.workdir, "{0}.{1}".format(self.shape, method))
+
+    def prepare_create(self):
+        if os.path.exists(self.bagdir):
+            shutil.rmtree(self.bagdir)
+        self.staging = os.path.join(self.workdir, "{0}-staging".format(self.shape))
+        shutil.copytree(self.source, self.staging)
+
+    def time_create(self):
+        bag = BagIt(self.bagdir)
+        os.rmdir(bag.data_directory)
+        os.rename(self.staging, bag.data_directory)
+        bag.update(processes=self.processes)
+
+    def time_update_full(self):
+        BagIt(self.bagdir).update(full=True, processes=self.processes)
+
+    def prepare_update_partial(self):
+        # add one percent more files for the update to find.
+        # only these are read, so they are what the throughput is of.
+        datadir = os.path.join(self.bagdir, 'data')
+        count = max(1, self.files // 100)
+        for i in xrange(count):
+            self._extra += 1
+            self.payload.write(os.path.join(datadir, "extra{0:06d}.bin".format(self._extra)), 4096)
+        self.files += count
+        self.bytes += count * 4096
+        self.processed = (count, count * 4096)
+
+    def time_update_partial(self):
+        BagIt(self.bagdir).update(full=False, processes=self.processes)
+
+    def time_validate(self):
+        errors = BagIt(self.bagdir).validate(processes=self.processes)
+        if errors:
+            raise RuntimeError("The {0} bag did not validate: {1}".format(self.shape, errors[:5]))
+
+    def time_package_zip(self):
+        BagIt(self.bagdir).package(self._archive('zip'), method='zip')
+
+    def time_package_tgz(self):
+        BagIt(self.bagdir).package(self._archive('tgz'), method='tgz')
+
+    def prepare_open_zip(self):
+        if not os.path.exists(self._archive('zip')):
+            self.time_package_zip()
+
+    def time_open_zip(self):
+        self._opened = BagIt(self._archive('zip'))
+
+    def cleanup_open_zip(self):
+        # opening a package extracts it to a temporary directory.
+        shutil.rmtree(os.path.dirname(self._opened.bag_directory))
+
+    def prepare_open_tgz(self):
+        if not os.path.exists(self._archive('tgz')):
+            self.time_package_tgz()
+
+    def time_open_tgz(self):
+        self._opened = BagIt(self._archive('tgz'))
+
+    cleanup_open_tgz = cleanup_open_zip
+
+    # validating a package in place, without extracting it.
+    prepare_validate_zip_inplace = prepare_open_zip
+    prepare_validate_tgz_inplace = prepare_open_tgz
+
+    def time_validate_zip_inplace(self):
+        self._validate_inplace('zip')
+
+    def time_validate_tgz_inplace(self):
+        self._validate_inplace('tgz')
+
+    def _validate_inplace(self, method):
+        errors = BagIt(self._archive(method), extract=False).validate()
+        if errors:
+            raise RuntimeError("The {0} {1} package did not validate: {2}".format(self.shape, method, errors[:5]))
+
+
+def report(shape, operation, files, nbytes, timings, out):
+    """ Writes a line of results. files and nbytes are what each run of
+        the operation processed, which the throughput is worked out from.
+    """
+    timings = sorted(timings)
+    best = timings[0]
+    median = timings[len(timings) // 2]
+    mbs = (nbytes / (1024.0 * 1024.0)) / best if best else float('inf')
+    fps = files / best if best else float('inf')
+    out.write("{0:<6} {1:<20} {2:>8} {3:>9.1f} {4:>9.3f} {5:>9.3f} {6:>9.1f} {7:>10.1f}\n".format(
+        shape, operation, files, nbytes / (1024.0 * 1024.0), best, median, mbs, fps))
+    out.flush()
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-s", "--shapes", action="store", default=",".join(SHAPE_ORDER),
+                      help="bag shapes to benchmark, separated by commas ({0})".format("|".join(SHAPE_ORDER)))
+    parser.add_option("-o", "--operations", action="store", default=",".join(OPERATIONS),
+                      help="operations to time, separated by commas ({0})".format("|".join(OPERATIONS)))
+    parser.add_option("-r", "--repeat", action="store", type="int", default=3,
+                      help="times to run each operation; the best and median times are reported (default: 3)")
+    parser.add_option("-x", "--scale", action="store", type="float", default=1.0,
+                      help="multiply the number of files (or, for huge, their size) by this (default: 1.0)")
+    parser.add_option("--seed", action="store", type="int", default=0,
+                      help="seed for the generated payloads (default: 0)")
+    parser.add_option("-p", "--processes", action="store", type="int",
+                      help="number of worker processes to checksum with (default: one per CPU)")
+    parser.add_option("-d", "--directory", action="store",
+                      help="directory to build the bags in (default: a temporary directory)")
+    parser.add_option("-k", "--keep", action="store_true", help="keep the generated bags")
+    (options, args) = parser.parse_args(argv)
+
+    shapes = options.shapes.split(",")
+    operations = options.operations.split(",")
+    for shape in shapes:
+        if shape not in SHAPES:
+            parser.error("Unknown shape {0}".format(shape))
+    for operation in operations:
+        if operation not in OPERATIONS:
+            parser.error("Unknown operation {0}".format(operation))
+    if options.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    workdir = tempfile.mkdtemp(prefix='bagit_bench_', dir=options.directory)
+    out = sys.stdout
+    out.write("{0:<6} {1:<20} {2:>8} {3:>9} {4:>9} {5:>9} {6:>9} {7:>10}\n".format(
+        "shape", "operation", "files", "MB", "best(s)", "median(s)", "MB/s", "files/s"))
+    try:
+        for shape in shapes:
+            bench = Benchmark(workdir, shape, options.scale, options.seed, options.processes)
+            bench.setup()
+            # every operation but create needs the bag to exist.
+            if 'create' not in operations:
+                bench.run('create')
+            for operation in sorted(operations, key=OPERATIONS.index):
+                runs = [bench.run(operation) for i in xrange(options.repeat)]
+                elapsed, files, nbytes = runs[-1]
+                report(shape, operation, files, nbytes, [r[0] for r in runs], out)
+    finally:
+        if options.keep:
+            out.write("The bags are in {0}\n".format(workdir))
+        else:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
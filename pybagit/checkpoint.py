@@ -0,0 +1,135 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Checkpoints that let an interrupted validation resume for PyBagIt """
+
+import json
+import os
+import sys
+import time
+
+from pybagit.checksumcache import stat_key
+from pybagit.exceptions import *
+
+CHECKPOINT_VERSION = 1
+
+
+class ValidationCheckpoint(object):
+    """ Remembers the payload files a validation has read so far, with the
+        size, modification time and inode each had when it was read, its
+        checksums or the error reading it. A validation that is interrupted
+        and run again takes up where it left off, and reads only the files
+        that it had not read yet or that have changed since.
+
+        The checkpoint is a JSON file, written at most every interval
+        seconds while files are being recorded. It is replaced atomically,
+        so an interrupted write leaves the previous checkpoint in place.
+    """
+    def __init__(self, filename, bag_directory, algorithms, interval=60):
+        self.filename = filename
+        if not isinstance(bag_directory, unicode):
+            # JSON gives it back as unicode.
+            bag_directory = bag_directory.decode(sys.getfilesystemencoding())
+        self.bag_directory = bag_directory
+        self.algorithms = list(algorithms)
+        self.interval = interval
+        self._files = {}  # path -> [size, mtime_ns, inode, {algorithm: checksum} or None, error or None]
+        self._saved_at = time.time()
+        self._modified = False
+        self.load()
+
+    def __len__(self):
+        return len(self._files)
+
+    def lookup(self, path, st):
+        """ Returns the ({algorithm: checksum}, error) that were recorded
+            for path, or None if it has not been read with every algorithm
+            or has changed since.
+        """
+        entry = self._files.get(path)
+        if entry is None or tuple(entry[:3]) != stat_key(st):
+            return None
+        checksums, error = entry[3], entry[4]
+        if error is None and [a for a in self.algorithms if a not in checksums]:
+            return None
+        return (checksums, error)
+
+    def record(self, path, st, checksums, error=None):
+        """ Records that path was read, and saves the checkpoint if it has
+            not been saved for interval seconds.
+        """
+        self._files[path] = list(stat_key(st)) + [checksums, error]
+        self._modified = True
+        if time.time() - self._saved_at >= self.interval:
+            self.save()
+
+    def load(self):
+        self._files = {}
+        if not os.path.exists(self.filename):
+            return
+
+        cfile = open(self.filename, 'rb')
+        try:
+            try:
+                contents = json.load(cfile)
+            except ValueError:
+                raise BagError("The validation checkpoint {0} may be malformed.".format(self.filename))
+        finally:
+            cfile.close()
+
+        if not isinstance(contents, dict) or contents.get('version') != CHECKPOINT_VERSION:
+            raise BagError("{0} is not a validation checkpoint.".format(self.filename))
+        if contents.get('bag') != self.bag_directory:
+            # a checkpoint of another bag; start again.
+            return
+        self._files = contents.get('files', {})
+
+    def save(self):
+        """ Writes the checkpoint out, if anything was recorded since it
+            was last saved.
+        """
+        self._saved_at = time.time()
+        if not self._modified:
+            return
+
+        tmpname = "{0}.tmp".format(self.filename)
+        cfile = open(tmpname, 'wb')
+        try:
+            json.dump({'version': CHECKPOINT_VERSION,
+                       'bag': self.bag_directory,
+                       'files': self._files}, cfile)
+        finally:
+            cfile.close()
+        os.rename(tmpname, self.filename)
+        self._modified = False
+
+    def remove(self):
+        """ Deletes the checkpoint, once the validation it was for is done. """
+        self._files = {}
+        self._modified = False
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
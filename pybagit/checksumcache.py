@@ -0,0 +1,172 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+""" A persistent, stat-keyed checksum cache for PyBagIt """
+
+import os
+import time
+
+from pybagit.exceptions import *
+
+CACHE_HEADER = "# pybagit checksum cache 2"
+OLD_CACHE_HEADERS = ("# pybagit checksum cache 1",)
+
+
+def stat_key(st):
+    """ Returns the (size, mtime_ns, inode) tuple that a cached checksum
+        is valid for.
+    """
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return (st.st_size, mtime_ns, st.st_ino)
+
+
+class ChecksumCache(object):
+    """ Remembers the checksums of files along with the size, modification
+        time and inode they had when they were read, so that unchanged
+        files do not need to be read again.
+
+        It also remembers when each file was last read, for sampled
+        validation to favour the files that have gone longest unchecked.
+
+        The cache is a plain text file with one line per file and
+        algorithm:
+
+            ALGORITHM CHECKSUM SIZE MTIME_NS INODE CHECKED PATH
+
+        where CHECKED is the time the file was read, in seconds since the
+        epoch. Caches written before it was recorded are still read.
+
+        Entries for files modified in the same second the cache was saved
+        are dropped when it is loaded, since a later write in that second
+        would not have changed the modification time.
+    """
+    def __init__(self, filename, encoding='utf-8'):
+        self.filename = filename
+        self.encoding = encoding
+        self._entries = {}  # path -> ((size, mtime_ns, inode), {algorithm: checksum})
+        self._checked = {}  # path -> when it was last read
+        self._modified = False
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, path, st, algorithm):
+        """ Returns the cached checksum for path, or None if there is none
+            or the file has changed since it was cached.
+        """
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != stat_key(st):
+            return None
+        return entry[1].get(algorithm)
+
+    def last_checked(self, path):
+        """ Returns when path was last read, in seconds since the epoch,
+            or None if that isn't known.
+        """
+        return self._checked.get(path)
+
+    def store(self, path, st, algorithm, checksum, checked=None):
+        """ Caches the checksum of path, which was read at checked (by
+            default, now).
+        """
+        key = stat_key(st)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != key:
+            entry = (key, {})
+            self._entries[path] = entry
+        entry[1][algorithm] = checksum
+        self._checked[path] = int(time.time() if checked is None else checked)
+        self._modified = True
+
+    def prune(self, paths):
+        """ Drops the entries for any path not in paths. """
+        paths = set(paths)
+        for path in self._entries.keys():
+            if path not in paths:
+                del self._entries[path]
+                self._checked.pop(path, None)
+                self._modified = True
+
+    def load(self):
+        self._entries = {}
+        self._checked = {}
+        if not os.path.exists(self.filename):
+            return
+
+        cfile = open(self.filename, 'rb')
+        try:
+            header = cfile.readline().rstrip("\n").split(" ")
+            version = " ".join(header[:-1])
+            if version != CACHE_HEADER and version not in OLD_CACHE_HEADERS:
+                raise BagError("{0} is not a checksum cache.".format(self.filename))
+            saved_at = int(header[-1])
+
+            for line in cfile:
+                if version == CACHE_HEADER:
+                    algorithm, checksum, size, mtime_ns, inode, checked, path = line.rstrip("\n").split(" ", 6)
+                else:
+                    algorithm, checksum, size, mtime_ns, inode, path = line.rstrip("\n").split(" ", 5)
+                    checked = None
+                key = (int(size), int(mtime_ns), int(inode))
+                if key[1] // 1000000000 >= saved_at // 1000000000:
+                    continue
+                path = path.decode(self.encoding)
+                if checked is not None:
+                    self._checked[path] = int(checked)
+                entry = self._entries.get(path)
+                if entry is None or entry[0] != key:
+                    entry = (key, {})
+                    self._entries[path] = entry
+                entry[1][algorithm] = checksum
+        except ValueError:
+            raise BagError("The checksum cache {0} may be malformed.".format(self.filename))
+        finally:
+            cfile.close()
+        self._modified = False
+
+    def save(self):
+        """ Writes the cache out, if it has changed since it was loaded. """
+        if not self._modified:
+            return
+
+        # write to a temporary file first, so that an interrupted save
+        # never leaves a truncated cache behind.
+        tmpname = "{0}.tmp".format(self.filename)
+        cfile = open(tmpname, 'wb')
+        try:
+            cfile.write("{0} {1}\n".format(CACHE_HEADER, int(time.time() * 1000000000)))
+            for path, (key, checksums) in self._entries.iteritems():
+                checked = self._checked.get(path, 0)
+                path = path.encode(self.encoding)
+                for algorithm, checksum in checksums.iteritems():
+                    cfile.write("{0} {1} {2} {3} {4} {5} {6}\n".format(algorithm, checksum, key[0], key[1],
+                                                                       key[2], checked, path))
+        finally:
+            cfile.close()
+        os.rename(tmpname, self.filename)
+        self._modified = False
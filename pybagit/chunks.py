@@ -0,0 +1,123 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Chunk digests of large payload files for PyBagIt """
+
+import codecs
+import os
+import re
+
+from pybagit.exceptions import *
+from pybagit.multichecksum import ALGORITHMS, ensure_unix_pathname
+
+CHUNKMANIFEST_RE = re.compile(r"^chunkmanifest-(?P<algorithm>{0})\.txt$".format("|".join(ALGORITHMS)))
+CHUNKMANIFEST_HEADER = "# chunk size"
+
+
+def chunk_ranges(size, chunk_size):
+    """ Returns the (offset, length) of each chunk of a file of size bytes. """
+    return [(offset, min(chunk_size, size - offset)) for offset in xrange(0, size, chunk_size)]
+
+
+class ChunkManifest(object):
+    """ The checksums of the fixed-size chunks of a bag's large payload
+        files, kept in a 'chunkmanifest-<algorithm>.txt' tag file. It starts
+        with a '# chunk size <bytes>' line; then for each file there is a
+        line
+
+            CHECKSUM - SIZE PATH
+
+        with the file's checksum from manifest-<algorithm>.txt, which its
+        chunks roll up into, followed by a line for each of its chunks:
+
+            CHECKSUM OFFSET LENGTH PATH
+
+        The chunks of a file are only of use while the checksum they roll
+        up into is still the one in the manifest; get() ignores them once
+        it isn't.
+    """
+    def __init__(self, algorithm, chunk_size=None):
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.files = {}  # path -> (checksum, size, [(offset, length, checksum)])
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def get(self, path, checksum=None):
+        """ Returns (size, [(offset, length, checksum)]) for path, or None
+            if there are no chunks for it, or they roll up into a checksum
+            other than checksum.
+        """
+        entry = self.files.get(path)
+        if entry is None or (checksum is not None and entry[0] != checksum):
+            return None
+        return entry[1:]
+
+    def set(self, path, checksum, size, chunks):
+        self.files[path] = (checksum, size, list(chunks))
+
+    @classmethod
+    def read(cls, filename, algorithm, encoding='utf-8'):
+        """ Reads a chunk manifest. """
+        chunks = cls(algorithm)
+        mfile = codecs.open(filename, 'rb', encoding)
+        try:
+            for lineno, line in enumerate(mfile):
+                line = line.rstrip("\r\n")
+                if not line:
+                    continue
+                try:
+                    if line.startswith(CHUNKMANIFEST_HEADER):
+                        chunks.chunk_size = int(line[len(CHUNKMANIFEST_HEADER):])
+                        continue
+                    checksum, offset, length, path = line.split(" ", 3)
+                    path = os.path.normpath(path)
+                    if offset == '-':
+                        chunks.files[path] = (checksum.lower(), int(length), [])
+                    else:
+                        chunks.files[path][2].append((int(offset), int(length), checksum.lower()))
+                except (ValueError, KeyError):
+                    raise BagManifestNotValid("{0}, line {1}: expected a checksum, offset, length and path".format(filename, lineno + 1))
+        finally:
+            mfile.close()
+        return chunks
+
+    def write(self, filename, encoding='utf-8'):
+        mfile = codecs.open(filename, 'wb', encoding)
+        try:
+            mfile.write(u"{0} {1}\n".format(CHUNKMANIFEST_HEADER, self.chunk_size))
+            for path, (checksum, size, chunks) in sorted(self.files.iteritems()):
+                path = ensure_unix_pathname(path)
+                mfile.write(u"{0} - {1} {2}\n".format(checksum, size, path))
+                for offset, length, csum in chunks:
+                    mfile.write(u"{0} {1} {2} {3}\n".format(csum, offset, length, path))
+        finally:
+            mfile.close()
@@ -0,0 +1,208 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Validating many bags at once for PyBagIt """
+
+import collections
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from optparse import OptionParser
+
+from pybagit.bagit import BagIt
+from pybagit.exceptions import *
+
+
+def find_bags(root):
+    """ Returns the bag directories under root (those with a bagit.txt),
+        in sorted order. Bags are not searched for bags inside them.
+    """
+    bags = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if 'bagit.txt' in filenames:
+            bags.append(dirpath)
+            del dirnames[:]
+        else:
+            dirnames.sort()
+    return bags
+
+
+class CollectionReport(object):
+    """ The outcome of validating a collection of bags.
+
+        results is an ordered {bag: errors} dictionary, in the order the
+        bags were given, where errors is the bag's list of (path, message)
+        tuples. elapsed is the seconds the validation took.
+    """
+    def __init__(self, bags):
+        self.results = collections.OrderedDict((bag, None) for bag in bags)
+        self.elapsed = None
+
+    def is_valid(self):
+        return not self.invalid()
+
+    def valid(self):
+        return [bag for bag, errors in self.results.iteritems() if not errors]
+
+    def invalid(self):
+        return [bag for bag, errors in self.results.iteritems() if errors]
+
+    def report(self, invalid_only=False):
+        """ Returns the results as text: a line per bag, followed by its
+            errors, and a total. With invalid_only, the valid bags are
+            only counted in the total.
+        """
+        lines = []
+        for bag, errors in self.results.iteritems():
+            if invalid_only and not errors:
+                continue
+            lines.append(u"{0} {1}".format("INVALID" if errors else "VALID", bag))
+            for path, message in errors or ():
+                lines.append(u"    {0}: {1}".format(path, message))
+        lines.append(u"{0} bags, {1} invalid, in {2:.1f}s".format(
+            len(self.results), len(self.invalid()), self.elapsed or 0.0))
+        return u"\n".join(lines)
+
+    def as_dict(self):
+        return {'bags': dict((bag, [list(e) for e in errors or ()]) for bag, errors in self.results.iteritems()),
+                'valid': len(self.valid()),
+                'invalid': len(self.invalid()),
+                'elapsed': self.elapsed}
+
+
+class BagCollection(object):
+    """ A set of bags to validate together.
+
+        bags may be a directory to search for bags (see find_bags()) or a
+        list of bag paths. Their files are all checksummed by one pool of
+        processes worker processes (one per CPU if None), which lasts for
+        the whole validation, and bags_at_once bags are validated at a time
+        so that the pool is kept busy across the ends of bags. Any other
+        keyword arguments are passed to BagIt() for each bag, e.g.
+        checksum_cache or extract.
+    """
+    def __init__(self, bags, processes=None, bags_at_once=None, **bag_options):
+        if isinstance(bags, basestring):
+            bags = find_bags(bags)
+        self.bags = list(bags)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.bags_at_once = bags_at_once or self.processes * 2
+        if self.bags_at_once < 1:
+            raise BagError("bags_at_once must be a positive number.")
+        self.bag_options = bag_options
+
+    def __len__(self):
+        return len(self.bags)
+
+    def validate(self, callback=None, **kwargs):
+        """ Validates every bag, and returns a CollectionReport. Keyword
+            arguments are passed to each bag's validate(), e.g. strict or
+            fast. callback, if given, is called with (bag, errors) as each
+            bag is finished; an exception it raises stops the validation.
+        """
+        report = CollectionReport(self.bags)
+        start = time.time()
+        pool = None
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes)
+        threads = ThreadPool(min(self.bags_at_once, len(self.bags)) or 1)
+        lock = threading.Lock()
+
+        def validate_one(path):
+            errors = self._validate_bag(path, pool or 1, kwargs)
+            with lock:
+                report.results[path] = errors
+                if callback is not None:
+                    callback(path, errors)
+
+        try:
+            # map() raises the first exception any of the bags raised.
+            threads.map(validate_one, self.bags, 1)
+            threads.close()
+            if pool is not None:
+                pool.close()
+        except:
+            threads.terminate()
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            threads.join()
+            if pool is not None:
+                pool.join()
+
+        report.elapsed = time.time() - start
+        return report
+
+    def _validate_bag(self, path, processes, kwargs):
+        if not os.path.exists(path):
+            return [('bag', 'Bag does not exist')]
+        try:
+            bag = BagIt(path, **self.bag_options)
+            return list(bag.validate(processes=processes, **kwargs))
+        except Exception, e:
+            # one unreadable bag shouldn't stop the rest.
+            message = e.message if isinstance(e, BagError) else e
+            return [('bag', 'Could not be validated: {0}'.format(message))]
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] root-or-bag [bag ...]")
+    parser.add_option("-p", "--processes", action="store", type="int",
+                      help="number of worker processes to checksum with (default: one per CPU)")
+    parser.add_option("-b", "--bags-at-once", action="store", type="int",
+                      help="number of bags to validate at a time (default: twice the processes)")
+    parser.add_option("-f", "--fast", action="store_true",
+                      help="only check that the files are present and the right size")
+    parser.add_option("-s", "--strict", action="store_true",
+                      help="read every file, even if the checksum cache knows it")
+    parser.add_option("-c", "--checksum-cache", action="store_true",
+                      help="use and update each bag's checksum cache")
+    parser.add_option("-q", "--quiet", action="store_true", help="only report invalid bags")
+    (options, args) = parser.parse_args(argv)
+
+    if not args:
+        parser.error("You must specify a directory of bags, or the bags")
+    if len(args) == 1 and not os.path.exists(os.path.join(args[0], 'bagit.txt')):
+        bags = args[0]
+    else:
+        bags = args
+
+    collection = BagCollection(bags, options.processes, options.bags_at_once,
+                               checksum_cache=options.checksum_cache)
+    result = collection.validate(fast=bool(options.fast), strict=bool(options.strict))
+    sys.stdout.write(result.report(invalid_only=bool(options.quiet)).encode('utf-8'))
+    sys.stdout.write("\n")
+    if not result.is_valid():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -57,3 +57,11 @@ class BagCheckSumNotValid(BagError):
 
 class BagFileDownloadError(BagError):
     pass
+
+
+class BagManifestNotValid(BagError):
+    pass
+
+
+class BagOperationCancelled(BagError):
+    pass
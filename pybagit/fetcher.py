@@ -0,0 +1,323 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Concurrent, resumable downloads of fetch.txt entries for PyBagIt """
+
+import errno
+import hashlib
+import httplib
+import os
+import Queue
+import socket
+import sys
+import threading
+import time
+import urllib
+import urlparse
+
+from pybagit.exceptions import *
+
+# responses worth asking for again.
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    """ A download that failed. retry is True if trying again may help. """
+    def __init__(self, message, retry=True):
+        Exception.__init__(self, message)
+        self.retry = retry
+
+
+class ConnectionPool(object):
+    """ Keeps idle HTTP connections open for reuse, and limits the number
+        of connections to each host.
+    """
+    def __init__(self, per_host=2, timeout=60):
+        self.per_host = per_host
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}  # (scheme, host, port) -> [connection, ...]
+        self._slots = {}  # (scheme, host, port) -> Semaphore
+
+    def acquire(self, scheme, netloc):
+        """ Returns a (connection, fresh) tuple for netloc, waiting while the
+            host already has per_host connections in use. fresh is False if
+            the connection has been used before.
+        """
+        key = (scheme, netloc)
+        with self._lock:
+            slots = self._slots.setdefault(key, threading.Semaphore(self.per_host))
+        slots.acquire()
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return (idle.pop(), False)
+        if scheme == 'https':
+            return (httplib.HTTPSConnection(netloc, timeout=self.timeout), True)
+        return (httplib.HTTPConnection(netloc, timeout=self.timeout), True)
+
+    def release(self, scheme, netloc, conn, reuse=True):
+        """ Hands a connection back. Connections that may be in an unknown
+            state (reuse=False) are closed rather than kept.
+        """
+        key = (scheme, netloc)
+        if reuse:
+            with self._lock:
+                self._idle.setdefault(key, []).append(conn)
+        else:
+            conn.close()
+        self._slots[key].release()
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.itervalues():
+                for conn in conns:
+                    conn.close()
+            self._idle = {}
+
+
+class Fetcher(object):
+    """ Downloads files with a bounded pool of worker threads.
+
+        HTTP(S) downloads reuse keep-alive connections, with at most
+        per_host connections to any one host. A download is written to
+        '<destination>.part' and renamed once it is complete; if it fails
+        part way through, the next attempt (or the next run) resumes from
+        where it stopped with a Range request. Failed downloads are retried
+        up to retries times, waiting backoff, 2 * backoff, 4 * backoff, ...
+        seconds in between. Other URL schemes are read through urllib.
+
+        Each download is checksummed with algorithms as it arrives. If an
+        entry comes with the checksums it should have, a download that
+        doesn't match them is deleted instead of being moved into place.
+    """
+    def __init__(self, workers=4, per_host=2, retries=3, backoff=1.0, timeout=60, algorithms=(), metrics=None, progress=None):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.algorithms = list(algorithms)
+        self.metrics = metrics  # a pybagit.metrics.Metrics, if each download should be timed
+        self.progress = progress  # called with (destination, size) as each download finishes
+        self.blocksize = 0x10000
+        self.pool = ConnectionPool(per_host, timeout)
+
+    def fetch(self, entries):
+        """ Downloads each entry, which is either a (url, destination) or a
+            (url, destination, {algorithm: expected checksum}) tuple.
+
+            If the fetcher has a progress callable, it is called with each
+            destination and the size downloaded (0 for a failure) from the
+            worker threads as they finish. If it raises an exception, no
+            more downloads are started, and the exception is passed on.
+
+            Returns a tuple of two dictionaries, both keyed by destination:
+            {destination: {algorithm: checksum}} for the files that were
+            downloaded, and {destination: error message} for those that
+            could not be.
+        """
+        tasks = Queue.Queue()
+        for entry in entries:
+            tasks.put(entry)
+
+        checksums = dict()
+        failures = dict()
+        lock = threading.Lock()
+        aborted = []
+
+        def work():
+            while not aborted:
+                try:
+                    entry = tasks.get_nowait()
+                except Queue.Empty:
+                    return
+                start = time.time()
+                size = 0
+                try:
+                    csums = self.fetch_one(*entry)
+                    with lock:
+                        checksums[entry[1]] = csums
+                    size = os.path.getsize(entry[1])
+                    if self.metrics is not None:
+                        self.metrics.record_file(entry[1], size, time.time() - start)
+                except Exception, e:
+                    with lock:
+                        failures[entry[1]] = str(e)
+                if self.progress is not None:
+                    try:
+                        self.progress(entry[1], size)
+                    except BaseException, e:
+                        aborted.append(sys.exc_info())
+
+        threads = [threading.Thread(target=work) for i in xrange(max(1, min(self.workers, tasks.qsize())))]
+        start = time.time()
+        for t in threads:
+            t.daemon = True
+            t.start()
+        try:
+            for t in threads:
+                # join with a timeout, so that KeyboardInterrupt gets through.
+                while t.is_alive():
+                    t.join(1)
+        finally:
+            self.pool.close()
+
+        if aborted:
+            raise aborted[0][0], aborted[0][1], aborted[0][2]
+        if self.metrics is not None:
+            self.metrics.record_workers(len(threads), time.time() - start)
+        return (checksums, failures)
+
+    def fetch_one(self, url, destination, expected=None):
+        """ Downloads url to destination, retrying as configured, and returns
+            its {algorithm: checksum} dictionary. Raises FetchError if it
+            could not be downloaded, or did not match the expected checksums.
+        """
+        _makedirs(os.path.dirname(destination))
+        attempt = 0
+        while True:
+            try:
+                return self._download(url, destination, expected or {})
+            except (FetchError, IOError, socket.error, httplib.HTTPException), e:
+                if attempt >= self.retries or not getattr(e, 'retry', True):
+                    raise FetchError(str(e) or repr(e), retry=False)
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def _download(self, url, destination, expected):
+        partial = "{0}.part".format(destination)
+        algorithms = sorted(set(self.algorithms) | set(expected))
+        scheme = urlparse.urlsplit(url)[0].lower()
+        if scheme in ('http', 'https'):
+            checksums = self._download_http(url, partial, algorithms)
+        else:
+            response = urllib.urlopen(url)
+            try:
+                checksums = self._save(response, partial, 'wb', algorithms)
+            finally:
+                response.close()
+
+        for alg, csum in sorted(expected.iteritems()):
+            if checksums[alg] != csum.lower():
+                # there's no point resuming from a bad download.
+                os.remove(partial)
+                raise FetchError("{0} checksum {1} does not match the manifest ({2})".format(alg, checksums[alg], csum),
+                                 retry=False)
+
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(partial, destination)
+        return checksums
+
+    def _download_http(self, url, partial, algorithms):
+        for redirect in xrange(MAX_REDIRECTS + 1):
+            scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+            path = path or '/'
+            if query:
+                path = "{0}?{1}".format(path, query)
+
+            offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+            headers = {}
+            if offset:
+                headers['Range'] = "bytes={0}-".format(offset)
+
+            conn, response = self._request(scheme.lower(), netloc, path, headers)
+            reuse = False
+            try:
+                status = response.status
+                location = response.getheader('location')
+
+                if status in (200, 206):
+                    # a server that ignores Range sends the whole file again.
+                    mode = 'ab' if status == 206 else 'wb'
+                    checksums = self._save(response, partial, mode, algorithms)
+                    reuse = not response.will_close
+                    return checksums
+
+                response.read()
+                reuse = not response.will_close
+            finally:
+                self.pool.release(scheme.lower(), netloc, conn, reuse)
+
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urlparse.urljoin(url, location)
+                continue
+            if status == 416 and offset:
+                # the partial file is no good; start it again.
+                os.remove(partial)
+                raise FetchError("HTTP 416 resuming at byte {0}".format(offset))
+            raise FetchError("HTTP {0} {1}".format(status, response.reason),
+                             retry=status in RETRY_STATUSES)
+
+        raise FetchError("Too many redirects", retry=False)
+
+    def _request(self, scheme, netloc, path, headers):
+        """ Sends a GET request, returning the connection and its response. """
+        while True:
+            conn, fresh = self.pool.acquire(scheme, netloc)
+            try:
+                conn.request('GET', path, headers=headers)
+                return (conn, conn.getresponse())
+            except (socket.error, httplib.HTTPException):
+                self.pool.release(scheme, netloc, conn, reuse=False)
+                if fresh:
+                    raise
+                # the server closed the idle connection; try a new one.
+
+    def _save(self, response, partial, mode, algorithms):
+        """ Writes the body of response to partial, appending to it if mode
+            is 'ab'. Returns the {algorithm: checksum} of the whole file.
+        """
+        hashes = [hashlib.new(alg) for alg in algorithms]
+        pfile = open(partial, mode + '+')
+        try:
+            if mode == 'ab':
+                # the resumed part is the only thing we have to read back.
+                pfile.seek(0)
+                for data in iter(lambda: pfile.read(self.blocksize), ""):
+                    for m in hashes:
+                        m.update(data)
+                pfile.seek(0, os.SEEK_END)
+            for data in iter(lambda: response.read(self.blocksize), ""):
+                pfile.write(data)
+                for m in hashes:
+                    m.update(data)
+        finally:
+            pfile.close()
+        if getattr(response, 'length', None):
+            # the connection was closed before the whole body arrived.
+            raise FetchError("Connection closed with {0} bytes left to read".format(response.length))
+        return dict((alg, m.hexdigest()) for alg, m in zip(algorithms, hashes))
+
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,266 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Manifest file handling for PyBagIt """
+
+import binascii
+import codecs
+import collections
+import hashlib
+import itertools
+import os
+
+from pybagit.exceptions import *
+
+LOWER_HEXDIGITS = "0123456789abcdef"
+
+
+def read_manifest(filename, encoding='utf-8'):
+    """ Reads a manifest (or tag manifest) file one line at a time,
+        yielding a (path, checksum) tuple for each entry.
+
+        Each line is split at the first run of whitespace, so checksums of
+        any length are accepted. Checksums are returned in lower case.
+        Raises BagManifestNotValid, naming the file and line, if a line
+        does not contain a hexadecimal checksum followed by a path.
+
+        filename may also be a file object opened in binary mode, which is
+        closed once it has been read.
+    """
+    if hasattr(filename, 'read'):
+        mfile = filename
+        filename = getattr(mfile, 'name', '<manifest>')
+    else:
+        mfile = open(filename, 'rb')
+    try:
+        first = mfile.readline()
+        if first.startswith(codecs.BOM_UTF8):
+            first = first[len(codecs.BOM_UTF8):]
+
+        lineno = 0
+        for line in itertools.chain((first,), mfile):
+            lineno += 1
+            entry = line.split(None, 1)
+            if len(entry) != 2:
+                if not entry:
+                    # skip blank lines
+                    continue
+                raise BagManifestNotValid("{0}, line {1}: expected a checksum and a path".format(filename, lineno))
+
+            checksum, path = entry
+            if checksum.translate(None, LOWER_HEXDIGITS):
+                checksum = checksum.lower()
+                if checksum.translate(None, LOWER_HEXDIGITS):
+                    raise BagManifestNotValid("{0}, line {1}: {2!r} is not a checksum".format(filename, lineno, checksum))
+
+            try:
+                path = path.rstrip("\r\n").decode(encoding)
+            except UnicodeDecodeError, e:
+                raise BagManifestNotValid("{0}, line {1}: path is not valid {2}: {3}".format(filename, lineno, encoding, e))
+
+            yield (path, checksum)
+    finally:
+        mfile.close()
+
+
+def find_duplicates(entries):
+    """ Groups (path, checksum) entries, such as read_manifest() yields,
+        by checksum. Returns {checksum: [paths]}, in sorted order, for the
+        checksums that more than one path has.
+    """
+    paths = collections.defaultdict(list)
+    for path, checksum in entries:
+        paths[checksum].append(path)
+    return dict((checksum, sorted(p)) for checksum, p in paths.iteritems() if len(p) > 1)
+
+
+class Manifest(collections.MutableMapping):
+    """ A compact, dictionary-like store of {path: checksum} entries.
+
+        Checksums are kept as binary digests in one contiguous buffer, and
+        paths are split into a directory, stored once and shared by every
+        file in it, and a UTF-8 encoded file name. Lookups and iteration
+        work as they do for a dict of hex checksums, so a Manifest can be
+        used wherever the plain manifest dictionaries were.
+
+        Checksums that are not the algorithm's length (or are not valid hex)
+        are kept as they are in a small overflow dictionary.
+    """
+    def __init__(self, algorithm=None, entries=None):
+        self.algorithm = algorithm
+        self._digest_size = hashlib.new(algorithm).digest_size if algorithm else None
+        self._dirs = {}  # directory -> {file name: slot in _digests}
+        self._digests = bytearray()
+        self._free = []  # slots freed by deleted entries
+        self._odd = {}  # path -> checksum, for checksums we can't pack
+        self._len = 0
+        if entries is not None:
+            self.update(entries)
+
+    def update(self, other=(), **kwds):
+        """ As dict.update(). New entries are appended to the digest buffer
+            directly, since loading whole manifests is the common case.
+        """
+        if hasattr(other, 'iteritems'):
+            other = other.iteritems()
+        elif hasattr(other, 'keys'):
+            other = ((k, other[k]) for k in other.keys())
+
+        dirs = self._dirs
+        digests = self._digests
+        unhexlify = binascii.unhexlify
+        sep = os.sep
+        for path, checksum in itertools.chain(other, kwds.iteritems()):
+            head, found, tail = path.rpartition(sep)
+            if isinstance(tail, unicode):
+                tail = tail.encode('utf-8')
+            files = dirs.get(head if found else None)
+            if self._free or path in self._odd or (files is not None and tail in files):
+                # replacing or reusing a slot; take the careful route.
+                self[path] = checksum
+                continue
+            try:
+                digest = unhexlify(checksum)
+            except (TypeError, ValueError):
+                digest = None
+            if self._digest_size is None and digest is not None:
+                self._digest_size = len(digest)
+            if digest is None or len(digest) != self._digest_size:
+                self._odd[path] = checksum
+                self._len += 1
+                continue
+
+            if files is None:
+                files = dirs[head if found else None] = {}
+            files[tail] = len(digests) // self._digest_size
+            digests.extend(digest)
+            self._len += 1
+
+    def _split(self, path):
+        head, sep, tail = path.rpartition(os.sep)
+        if isinstance(tail, unicode):
+            tail = tail.encode('utf-8')
+        if not sep:
+            return (None, tail)
+        return (head, tail)
+
+    def _pack(self, checksum):
+        try:
+            digest = binascii.unhexlify(checksum)
+        except (TypeError, ValueError):
+            return None
+        if self._digest_size is None:
+            self._digest_size = len(digest)
+        if len(digest) != self._digest_size:
+            return None
+        return digest
+
+    def __getitem__(self, path):
+        head, tail = self._split(path)
+        files = self._dirs.get(head)
+        if files is None or tail not in files:
+            return self._odd[path]
+        slot = files[tail] * self._digest_size
+        return binascii.hexlify(self._digests[slot:slot + self._digest_size])
+
+    def __setitem__(self, path, checksum):
+        head, tail = self._split(path)
+        files = self._dirs.get(head)
+        digest = self._pack(checksum)
+
+        if files is not None and tail in files:
+            if digest is not None:
+                # overwrite the existing digest in place.
+                slot = files[tail] * self._digest_size
+                self._digests[slot:slot + self._digest_size] = digest
+                return
+            del self[path]
+        elif path in self._odd:
+            del self._odd[path]
+            self._len -= 1
+
+        if digest is None:
+            self._odd[path] = checksum
+            self._len += 1
+            return
+
+        if self._free:
+            slot = self._free.pop()
+            self._digests[slot * self._digest_size:(slot + 1) * self._digest_size] = digest
+        else:
+            slot = len(self._digests) // self._digest_size
+            self._digests.extend(digest)
+
+        if files is None:
+            files = self._dirs[head] = {}
+        files[tail] = slot
+        self._len += 1
+
+    def __delitem__(self, path):
+        head, tail = self._split(path)
+        files = self._dirs.get(head)
+        if files is None or tail not in files:
+            del self._odd[path]
+        else:
+            self._free.append(files.pop(tail))
+            if not files:
+                del self._dirs[head]
+        self._len -= 1
+
+    def __contains__(self, path):
+        head, tail = self._split(path)
+        files = self._dirs.get(head)
+        return (files is not None and tail in files) or path in self._odd
+
+    def __iter__(self):
+        for head, files in self._dirs.iteritems():
+            prefix = u"" if head is None else head + os.sep
+            for tail in files:
+                yield prefix + tail.decode('utf-8')
+        for path in self._odd:
+            yield path
+
+    def __len__(self):
+        return self._len
+
+    def iteritems(self):
+        size = self._digest_size
+        digests = buffer(self._digests)
+        hexlify = binascii.hexlify
+        for head, files in self._dirs.iteritems():
+            prefix = u"" if head is None else head + os.sep
+            for tail, slot in files.iteritems():
+                start = slot * size
+                yield (prefix + tail.decode('utf-8'), hexlify(digests[start:start + size]))
+        for item in self._odd.iteritems():
+            yield item
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __repr__(self):
+        return "Manifest({0!r}, {1!r})".format(self.algorithm, dict(self.iteritems()))
@@ -0,0 +1,159 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Timing and throughput instrumentation for PyBagIt """
+
+import collections
+import heapq
+import threading
+import time
+
+
+class Metrics(object):
+    """ Records where the time goes in update(), validate(), fetch() and
+        package(). Pass one to BagIt(metrics=...) to collect:
+
+            - phases: wall time per phase, e.g. 'update.walk' or
+              'validate.hash', in the order they first ran;
+            - files and bytes_read: the files checksummed, downloaded or
+              compressed, and their total size;
+            - the utilisation of the checksum and download workers: the
+              time they spent busy, as a fraction of the time they were
+              available;
+            - the slowest files, with their size and time.
+
+        Figures accumulate over every operation until reset() is called.
+        Without a Metrics object, none of this is measured.
+    """
+    def __init__(self, slowest=10):
+        self.slowest_count = slowest
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.phases = collections.OrderedDict()
+        self.files = 0
+        self.bytes_read = 0
+        self.worker_seconds = 0.0  # time workers spent on files
+        self.worker_capacity = 0.0  # time workers were available, i.e. workers * wall time
+        self._slowest = []  # a heap of (seconds, path, size)
+
+    def phase(self, name):
+        """ Returns a context manager that adds the time spent inside it to
+            phase name.
+        """
+        return _Phase(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record_file(self, path, size, seconds):
+        """ Records that a worker spent seconds on path, of size bytes. """
+        with self._lock:
+            self.files += 1
+            self.bytes_read += size
+            self.worker_seconds += seconds
+            entry = (seconds, path, size)
+            if len(self._slowest) < self.slowest_count:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def record_workers(self, workers, seconds):
+        """ Records that workers workers were available for seconds. """
+        with self._lock:
+            self.worker_capacity += workers * seconds
+
+    def slowest_files(self):
+        """ Returns [(path, size, seconds), ...], slowest first. """
+        return [(path, size, seconds) for seconds, path, size in sorted(self._slowest, reverse=True)]
+
+    def utilisation(self):
+        """ Returns the fraction of the available worker time that was spent
+            on files, or None if no workers have run.
+        """
+        if not self.worker_capacity:
+            return None
+        return min(1.0, self.worker_seconds / self.worker_capacity)
+
+    def as_dict(self):
+        return {'phases': dict(self.phases),
+                'files': self.files,
+                'bytes_read': self.bytes_read,
+                'utilisation': self.utilisation(),
+                'slowest_files': self.slowest_files()}
+
+    def report(self):
+        """ Returns the figures as a human readable string. """
+        lines = ["Phase" + " " * 27 + "Seconds"]
+        for name, seconds in self.phases.iteritems():
+            lines.append("{0:<30} {1:>9.3f}".format(name, seconds))
+        lines.append("")
+        lines.append("Files: {0}, {1:.1f} MB".format(self.files, self.bytes_read / (1024.0 * 1024.0)))
+        utilisation = self.utilisation()
+        if utilisation is not None:
+            lines.append("Worker utilisation: {0:.0%}".format(utilisation))
+        if self._slowest:
+            lines.append("Slowest files:")
+            for path, size, seconds in self.slowest_files():
+                lines.append("  {0:>9.3f}s {1:>12} {2}".format(seconds, size, path))
+        return "\n".join(lines)
+
+
+class _Phase(object):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.name, time.time() - self.start)
+        return False
+
+
+class _NoPhase(object):
+    """ Stands in for _Phase when no metrics are being collected. """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_PHASE = _NoPhase()
+
+
+def phase(metrics, name):
+    """ metrics.phase(name), or a context manager that does nothing if
+        metrics is None.
+    """
+    if metrics is None:
+        return NO_PHASE
+    return metrics.phase(name)
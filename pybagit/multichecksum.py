@@ -25,77 +25,480 @@ __license__ = """The MIT License
                 THE SOFTWARE."""
 
 import multiprocessing
+import multiprocessing.pool
 from optparse import OptionParser
 import os
 import sys
 import hashlib
+import itertools
 import codecs
+import ctypes
+import ctypes.util
+import mmap
 import re
+import time
 from pybagit.exceptions import *
+from pybagit.manifest import read_manifest, find_duplicates
+from pybagit.scan import scan_tree
 
 # declare a default hashalgorithm
 HASHALG = 'sha1'
 ENCODING = "utf-8"
 
-def write_manifest(datadir, encoding, update=False):
+# the checksum algorithms we can write manifests for.
+ALGORITHMS = ('md5', 'sha1', 'sha256', 'sha512')
+
+# how much of a file is read at once, the size from which files are mapped
+# into memory instead of read (None to never map them), and whether to tell
+# the kernel how files are being read. See csumfile().
+BLOCKSIZE = 0x100000
+MMAP_THRESHOLD = None
+FADVISE = False
+
+# how many directories dirwalk() lists at once. More than one helps on
+# network filesystems; see pybagit.scan.scan_tree().
+SCAN_THREADS = 1
+
+POSIX_FADV_SEQUENTIAL = getattr(os, 'POSIX_FADV_SEQUENTIAL', 2)
+POSIX_FADV_DONTNEED = getattr(os, 'POSIX_FADV_DONTNEED', 4)
+_fadvise = None
+
+
+def write_manifest(datadir, encoding, update=False, algorithm=None, processes=None):
+    """ Writes a manifest for the files in datadir, next to datadir.
+
+        algorithm may be a list of algorithms, in which case one manifest is
+        written for each of them, from a single read of every file.
+
+        Returns a dictionary of {filename: error message} for any files
+        that could not be checksummed. These are left out of the manifest.
+    """
+    algorithms = _as_algorithm_list(algorithm)
     bag_root = os.path.split(os.path.abspath(datadir))[0]
-    manifest_file = os.path.join(bag_root, "manifest-{0}.txt".format(HASHALG))
+    manifest_files = dict((alg, os.path.join(bag_root, "manifest-{0}.txt".format(alg)))
+                          for alg in algorithms)
 
     checksums = dict()
-    files_to_checksum = set(dirwalk(datadir))
-    if update and os.path.isfile(manifest_file):
-        for line in codecs.open(manifest_file, 'rb', encoding):
-            checksum, file_ = line.strip().split(' ', 1)
-            full_file = os.path.join(bag_root, file_)
-            if full_file in files_to_checksum:
+    scan = scan_tree(u"{0}".format(datadir), SCAN_THREADS)
+    files_to_checksum = set(scan.files)
+    if update and all(os.path.isfile(m) for m in manifest_files.itervalues()):
+        known = dict()
+        for alg, manifest_file in manifest_files.iteritems():
+            for file_, checksum in read_manifest(manifest_file, encoding):
+                known.setdefault(os.path.join(bag_root, file_), {})[alg] = checksum
+
+        # we can only skip a file if every manifest already lists it.
+        for full_file, csums in known.iteritems():
+            if full_file in files_to_checksum and len(csums) == len(algorithms):
                 files_to_checksum.remove(full_file)
-                checksums[os.path.join(bag_root, file_)] = checksum
+                checksums[full_file] = csums
+
+    results, failures = checksum_files(files_to_checksum, algorithms, processes, stats=scan.stats)
+    checksums.update(results)
+
+    for alg, manifest_file in manifest_files.iteritems():
+        mfile = codecs.open(manifest_file, 'wb', encoding)
 
-    p = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-    result = p.map_async(csumfile, files_to_checksum)
-    checksums.update((k, v) for v, k in result.get())
-    p.close()
-    p.join()
+        for file_, csums in sorted(checksums.iteritems()):
+            rp = os.path.relpath(file_, bag_root)
+            fl = ensure_unix_pathname(rp)
+            mfile.write(u"{0} {1}\n".format(csums[alg], fl))
 
-    mfile = codecs.open(manifest_file, 'wb', encoding)
+        mfile.close()
 
-    for file_, checksum in sorted(checksums.iteritems()):
-        rp = os.path.relpath(file_, bag_root)
-        fl = ensure_unix_pathname(rp)
-        mfile.write(u"{0} {1}\n".format(checksum, fl))
+    return failures
 
-    mfile.close()
 
+def dirwalk(datadir, threads=None):
+    if threads is None:
+        threads = SCAN_THREADS
+    return scan_tree(u"{0}".format(datadir), threads).files
 
-def dirwalk(datadir):
-    datafiles = []
 
-    for dirpath, dirnames, filenames in os.walk(u"{0}".format(datadir)):
-        for fn in filenames:
-            datafiles.append(os.path.join(dirpath, fn))
-    return datafiles
+def checksum_files(filenames, algorithm=None, processes=None, metrics=None, progress=None, callback=None,
+                   stats=None, chunk_size=None, chunks=None):
+    """ Checksums a list of files, spreading the work over a pool of
+        worker processes.
+
+        If processes is None, one worker per CPU is started. With one worker
+        (or only one file to checksum) the files are checksummed in the
+        calling process. processes may also be a multiprocessing Pool to
+        hand the files to, which is left running afterwards; several
+        threads can share one pool this way.
+
+        Returns a tuple of two dictionaries: {filename: checksum} for the
+        files that could be read, and {filename: error message} for those
+        that could not. As with csumfile(), if algorithm is a list the
+        checksums are {algorithm: checksum} dictionaries.
+
+        If metrics (a pybagit.metrics.Metrics) is given, the time spent on
+        each file and the workers' utilisation are recorded in it. If
+        progress is given, it is called with each filename as soon as that
+        file is finished, in this process; an exception it raises stops
+        the workers and is passed on. callback works the same way, but is
+        called with (filename, checksum, error), error being None for the
+        files that could be read.
+
+        stats may give the {filename: stat result} of the files, if they
+        are already known. Files that are hard links to the same inode are
+        then only read once, and share its checksum.
+
+        If chunk_size is given, files larger than it are also checksummed a
+        chunk at a time in the same read (see csumchunks()), and their
+        chunks are put in the chunks dictionary as {filename: [(offset,
+        length, checksum)]}.
+    """
+    shared, processes = _shared_pool(processes)
+    filenames, links = _hardlinks(filenames, stats)
+    tasks = [(f, algorithm, chunk_size) for f in filenames]
+    checksums = dict()
+    failures = dict()
+    worker = _csumfile_worker if metrics is None else _timed_csumfile_worker
+    start = time.time()
+
+    if shared is None and (processes <= 1 or len(tasks) <= 1):
+        results = itertools.imap(worker, tasks)
+        _collect_results(results, checksums, failures, metrics, progress, callback, links, chunks)
+        if metrics is not None:
+            metrics.record_workers(1, time.time() - start)
+        return (checksums, failures)
+
+    # hand out files in small batches so that bags of many tiny files do
+    # not spend all of their time passing single filenames between processes.
+    chunksize = max(1, min(64, len(tasks) // (processes * 4)))
+    p = shared or multiprocessing.Pool(processes=processes)
+    try:
+        results = p.imap_unordered(worker, tasks, chunksize)
+        _collect_results(results, checksums, failures, metrics, progress, callback, links, chunks)
+        if shared is None:
+            p.close()
+    except:
+        if shared is None:
+            p.terminate()
+        raise
+    finally:
+        if shared is None:
+            p.join()
 
+    if metrics is not None:
+        metrics.record_workers(processes, time.time() - start)
+    return (checksums, failures)
 
-def csumfile(filename):
+
+def _shared_pool(processes):
+    """ Returns (pool, workers) for the processes argument of
+        checksum_files(): the pool if it is one (or None), and how many
+        workers to plan for.
+    """
+    if isinstance(processes, multiprocessing.pool.Pool):
+        return (processes, multiprocessing.cpu_count())
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    return (None, processes)
+
+
+def _hardlinks(filenames, stats):
+    """ Returns the filenames that need to be read, leaving out all but
+        the first link to each inode, and {filename: [its other links]}.
+    """
+    if stats is None:
+        return (filenames, None)
+    to_read = []
+    links = dict()
+    inodes = dict()
+    for filename in filenames:
+        st = stats.get(filename)
+        # st_nlink is 0 on platforms without inode numbers.
+        if st is not None and st.st_nlink > 1:
+            first = inodes.setdefault((st.st_dev, st.st_ino), filename)
+            if first != filename:
+                links.setdefault(first, []).append(filename)
+                continue
+        to_read.append(filename)
+    return (to_read, links)
+
+
+def _collect_results(results, checksums, failures, metrics=None, progress=None, callback=None, links=None,
+                     chunks=None):
+    for result in results:
+        checksum, filename, error = result[:3]
+        if metrics is not None:
+            metrics.record_file(filename, result[5], result[4])
+        for name in [filename] + (links.get(filename, []) if links else []):
+            if error is None:
+                checksums[name] = checksum
+                if chunks is not None and result[3] is not None:
+                    chunks[name] = result[3]
+            else:
+                failures[name] = error
+            if callback is not None:
+                callback(name, checksum, error)
+            if progress is not None:
+                progress(name)
+
+
+def _csumfile_worker(task):
+    # module-level so that it can be handed to a multiprocessing pool.
+    filename, algorithm, chunk_size = task
+    chunks = None
+    try:
+        if chunk_size is not None and os.path.getsize(filename) > chunk_size:
+            checksum, chunks, filename = csumchunks(filename, algorithm, chunk_size)
+        else:
+            checksum, filename = csumfile(filename, algorithm)
+    except (IOError, OSError), e:
+        return (None, filename, str(e), None)
+    return (checksum, filename, None, chunks)
+
+
+def _timed_csumfile_worker(task):
+    # _csumfile_worker, also returning the seconds it took and the file size.
+    start = time.time()
+    result = _csumfile_worker(task)
+    elapsed = time.time() - start
+    try:
+        size = os.path.getsize(result[1])
+    except OSError:
+        size = 0
+    return result + (elapsed, size)
+
+
+def csumfile(filename, algorithm=None, blocksize=None, mmap_threshold=None, fadvise=None):
     """ Based on
         http://abstracthack.wordpress.com/2007/10/19/calculating-md5-checksum/
+
+        algorithm may be a single algorithm, in which case the checksum is
+        returned as a hex string, or a list of algorithms. In that case
+        every hash is fed from the same read of the file, and the checksums
+        are returned as an {algorithm: checksum} dictionary.
+
+        The file is read blocksize bytes at a time into a single buffer,
+        which is reused for every block. Files of mmap_threshold bytes or
+        more are mapped into memory and hashed in place instead. If fadvise
+        is True, the kernel is told that the file is read front to back,
+        and once it has been, that its pages need not stay cached, so that
+        hashing a large bag doesn't push everything else out of the page
+        cache. That drops the pages of files that were cached already too
+        (say, a bag that has just been written), so it is off by default.
+        They default to the module's BLOCKSIZE, MMAP_THRESHOLD and
+        FADVISE.
+    """
+    if mmap_threshold is None:
+        mmap_threshold = MMAP_THRESHOLD
+    if fadvise is None:
+        fadvise = FADVISE
+
+    # unbuffered, so that readinto() reads straight into our buffer.
+    fd = open(filename, 'rb', 0)
+
+    try:
+        if fadvise:
+            _advise(fd.fileno(), POSIX_FADV_SEQUENTIAL)
+        size = os.fstat(fd.fileno()).st_size
+        if mmap_threshold is not None and size and size >= mmap_threshold:
+            checksum = _csummap(fd, algorithm, blocksize)
+        else:
+            checksum = csumstream(fd, algorithm, blocksize)
+        if fadvise:
+            _advise(fd.fileno(), POSIX_FADV_DONTNEED)
+    finally:
+        fd.close()
+
+    return (checksum, filename)
+
+
+def csumstream(fileobj, algorithm=None, blocksize=None, length=None):
+    """ Checksums everything that can be read from fileobj, which may be
+        a stream such as an archive member, or only the next length bytes
+        of it. algorithm and blocksize work as in csumfile().
     """
-    hashalg = getattr(hashlib, HASHALG)()  # == 'hashlib.md5' or 'hashlib.sha1'
-    blocksize = 0x10000
+    algorithms = _as_algorithm_list(algorithm)
+    hashes = [hashlib.new(alg) for alg in algorithms]
+    blocksize = blocksize or BLOCKSIZE
+    remaining = length
+
+    readinto = getattr(fileobj, 'readinto', None)
+    if readinto is not None:
+        buf = bytearray(blocksize)
+        view = memoryview(buf)
+    while remaining is None or remaining > 0:
+        want = blocksize if remaining is None else min(blocksize, remaining)
+        if readinto is not None:
+            n = readinto(buf if want == blocksize else view[:want])
+            block = view[:n]
+        else:
+            block = fileobj.read(want)
+            n = len(block)
+        if not n:
+            break
+        for m in hashes:
+            m.update(block)
+        if remaining is not None:
+            remaining -= n
+
+    return _hexdigests(algorithm, algorithms, hashes)
+
+
+def csumchunks(filename, algorithm, chunk_size, blocksize=None):
+    """ Checksums filename as csumfile() does, and in the same read each
+        chunk_size chunk of it, with the first of algorithm. Returns the
+        file's checksum(s), [(offset, length, checksum)] for its chunks and
+        the filename.
+    """
+    algorithms = _as_algorithm_list(algorithm)
+    hashes = [hashlib.new(alg) for alg in algorithms]
+    blocksize = blocksize or BLOCKSIZE
+    buf = bytearray(blocksize)
+    view = memoryview(buf)
+    chunks = []
+    offset = 0
+
+    fd = open(filename, 'rb', 0)
+    try:
+        if FADVISE:
+            _advise(fd.fileno(), POSIX_FADV_SEQUENTIAL)
+        while True:
+            chunk = hashlib.new(algorithms[0])
+            length = 0
+            while length < chunk_size:
+                n = fd.readinto(view[:min(blocksize, chunk_size - length)])
+                if not n:
+                    break
+                block = view[:n]
+                chunk.update(block)
+                for m in hashes:
+                    m.update(block)
+                length += n
+            if not length:
+                break
+            chunks.append((offset, length, chunk.hexdigest()))
+            offset += length
+            if length < chunk_size:
+                break
+        if FADVISE:
+            _advise(fd.fileno(), POSIX_FADV_DONTNEED)
+    finally:
+        fd.close()
 
-    def __upd(m, data):
-        m.update(data)
-        return m
+    return (_hexdigests(algorithm, algorithms, hashes), chunks, filename)
 
-    fd = open(filename, 'rb')
+
+def csumrange(filename, offset, length, algorithm=None, blocksize=None):
+    """ Checksums length bytes of filename, starting at offset. Works as
+        csumfile() does otherwise, but never maps the file into memory.
+    """
+    fd = open(filename, 'rb', 0)
 
     try:
-        contents = iter(lambda: fd.read(blocksize), "")
-        m = reduce(__upd, contents, hashalg)
+        if FADVISE:
+            _advise(fd.fileno(), POSIX_FADV_SEQUENTIAL, offset, length)
+        fd.seek(offset)
+        checksum = csumstream(fd, algorithm, blocksize, length)
+        if FADVISE:
+            _advise(fd.fileno(), POSIX_FADV_DONTNEED, offset, length)
     finally:
         fd.close()
 
-    return (m.hexdigest(), filename)
+    return checksum
+
+
+def checksum_ranges(ranges, algorithm=None, processes=None):
+    """ Checksums byte ranges of files, given as (filename, offset, length)
+        tuples, spreading them over a pool of worker processes as
+        checksum_files() does. The ranges of one large file can be
+        checksummed in parallel this way. processes may be a pool, as for
+        checksum_files().
+
+        Returns a tuple of two dictionaries, {(filename, offset): checksum}
+        and {(filename, offset): error message}.
+    """
+    shared, processes = _shared_pool(processes)
+    tasks = [(filename, offset, length, algorithm) for filename, offset, length in ranges]
+    checksums = dict()
+    failures = dict()
+
+    if shared is None and (processes <= 1 or len(tasks) <= 1):
+        _collect_results(itertools.imap(_csumrange_worker, tasks), checksums, failures)
+        return (checksums, failures)
+
+    p = shared or multiprocessing.Pool(processes=processes)
+    try:
+        _collect_results(p.imap_unordered(_csumrange_worker, tasks), checksums, failures)
+        if shared is None:
+            p.close()
+    except:
+        if shared is None:
+            p.terminate()
+        raise
+    finally:
+        if shared is None:
+            p.join()
+
+    return (checksums, failures)
+
+
+def _csumrange_worker(task):
+    filename, offset, length, algorithm = task
+    try:
+        checksum = csumrange(filename, offset, length, algorithm)
+    except (IOError, OSError), e:
+        return (None, (filename, offset), str(e))
+    return (checksum, (filename, offset), None)
+
+
+def _csummap(fileobj, algorithm=None, blocksize=None):
+    # csumstream() for a file that is mapped into memory rather than read.
+    algorithms = _as_algorithm_list(algorithm)
+    hashes = [hashlib.new(alg) for alg in algorithms]
+    blocksize = blocksize or BLOCKSIZE
+
+    mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        for offset in xrange(0, len(mapped), blocksize):
+            block = buffer(mapped, offset, blocksize)
+            for m in hashes:
+                m.update(block)
+    finally:
+        mapped.close()
+
+    return _hexdigests(algorithm, algorithms, hashes)
+
+
+def _hexdigests(algorithm, algorithms, hashes):
+    if algorithm is None or isinstance(algorithm, basestring):
+        return hashes[0].hexdigest()
+    return dict((alg, m.hexdigest()) for alg, m in zip(algorithms, hashes))
+
+
+def _advise(fd, advice, offset=0, length=0):
+    """ Passes advice on how fd will be read to posix_fadvise(), where
+        there is one; by default, for the whole file. It is only a hint, so
+        failures are ignored.
+    """
+    global _fadvise
+    if _fadvise is None:
+        # python 2 has no os.posix_fadvise, so fall back to the C library's.
+        _fadvise = getattr(os, 'posix_fadvise', False)
+        if not _fadvise and sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+                libc.posix_fadvise.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]
+                _fadvise = libc.posix_fadvise
+            except (OSError, AttributeError):
+                pass
+    if _fadvise:
+        try:
+            _fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def _as_algorithm_list(algorithm):
+    if algorithm is None:
+        return [HASHALG]
+    if isinstance(algorithm, basestring):
+        return [algorithm]
+    return list(algorithm)
 
 
 def ensure_unix_pathname(pathname):
@@ -110,15 +513,32 @@ def ensure_unix_pathname(pathname):
 if __name__ == "__main__":
     parser = OptionParser()
     usage = "%prog [options] arg1 arg2"
-    parser.add_option("-a", "--algorithm", action="store", help="checksum algorithm to use (sha1|md5)")
+    parser.add_option("-a", "--algorithm", action="store", help="checksum algorithm(s) to use, separated by commas (md5|sha1|sha256|sha512)")
     parser.add_option("-c", "--encoding", action="store", help="File encoding to write manifest")
     parser.add_option("-u", "--update", action="store_true", help="Only update new/removed files")
+    parser.add_option("-p", "--processes", action="store", type="int", help="Number of worker processes (default: one per CPU)")
+    parser.add_option("-b", "--blocksize", action="store", type="int", help="Bytes to read from a file at once (default: {0})".format(BLOCKSIZE))
+    parser.add_option("-m", "--mmap", action="store", type="int", help="Map files of this many bytes or more into memory instead of reading them")
+    parser.add_option("-t", "--scan-threads", action="store", type="int", help="Directories to list at once (default: 1; more helps on network filesystems)")
+    parser.add_option("-d", "--duplicates", action="store_true", help="List the files with the same contents")
+    parser.add_option("--fadvise", action="store_true", help="Tell the kernel that files are read once, front to back, and needn't stay cached")
     (options, args) = parser.parse_args()
 
+    if options.blocksize:
+        BLOCKSIZE = options.blocksize
+    if options.mmap is not None:
+        MMAP_THRESHOLD = options.mmap
+    if options.scan_threads:
+        SCAN_THREADS = options.scan_threads
+    if options.fadvise:
+        FADVISE = True
+
+    algorithms = [HASHALG]
     if options.algorithm:
-        if not options.algorithm in ('md5', 'sha1'):
-            raise BagCheckSumNotValid('You must specify either "md5" or "sha1" as the checksum algorithm')
-        HASHALG = options.algorithm
+        algorithms = options.algorithm.lower().split(",")
+        for alg in algorithms:
+            if alg not in ALGORITHMS:
+                raise BagCheckSumNotValid('You must specify one or more of {0} as the checksum algorithm'.format(", ".join(ALGORITHMS)))
 
     if options.encoding:
         ENCODING = options.encoding
@@ -126,4 +546,16 @@ if __name__ == "__main__":
     if len(args) < 1:
         parser.error("You must specify a data directory")
 
-    write_manifest(args[0], ENCODING, update=options.update)
+    failures = write_manifest(args[0], ENCODING, update=options.update,
+                              algorithm=algorithms, processes=options.processes)
+    for filename, error in sorted(failures.iteritems()):
+        sys.stderr.write(u"Could not checksum {0}: {1}\n".format(filename, error).encode(ENCODING))
+    if options.duplicates:
+        bag_root = os.path.split(os.path.abspath(args[0]))[0]
+        manifest_file = os.path.join(bag_root, "manifest-{0}.txt".format(algorithms[0]))
+        for checksum, paths in sorted(find_duplicates(read_manifest(manifest_file, ENCODING)).iteritems()):
+            sys.stdout.write("{0}\n".format(checksum))
+            for path in paths:
+                sys.stdout.write(u"    {0}\n".format(path).encode(ENCODING))
+    if failures:
+        sys.exit(1)
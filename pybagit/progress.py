@@ -0,0 +1,123 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Progress reporting for long-running PyBagIt operations """
+
+import os
+import threading
+import time
+
+
+class ProgressEvent(object):
+    """ What a progress callback is called with.
+
+        operation is 'update', 'validate', 'fetch' or 'package'.
+        files_total and bytes_total are None if they aren't known in
+        advance, and eta (in seconds) is None until it can be estimated.
+        current_file is the last file finished, and done is True for the
+        final event of an operation.
+    """
+    def __init__(self, operation, files_done, files_total, bytes_done, bytes_total,
+                 current_file, elapsed, eta, done):
+        self.operation = operation
+        self.files_done = files_done
+        self.files_total = files_total
+        self.bytes_done = bytes_done
+        self.bytes_total = bytes_total
+        self.current_file = current_file
+        self.elapsed = elapsed
+        self.eta = eta
+        self.done = done
+
+    def __repr__(self):
+        return "<ProgressEvent {0} {1}/{2} files, {3}/{4} bytes, eta {5}>".format(
+            self.operation, self.files_done, self.files_total, self.bytes_done, self.bytes_total, self.eta)
+
+
+class ProgressTracker(object):
+    """ Counts the files (and bytes) an operation has finished, and calls
+        callback with a ProgressEvent after each one. It may be advanced
+        from several threads.
+    """
+    def __init__(self, callback, operation, files_total=None, sizes=None):
+        self.callback = callback
+        self.operation = operation
+        self.files_total = files_total
+        self.sizes = sizes or {}  # {filename: size} of the files to be done
+        self.bytes_total = sum(self.sizes.itervalues()) if sizes is not None else None
+        self.files_done = 0
+        self.bytes_done = 0
+        self.raised = False  # True once the callback has raised an exception
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def advance(self, filename, size=None):
+        """ Records that filename is finished. Its size defaults to the one
+            the tracker was given for it.
+        """
+        with self._lock:
+            if size is None:
+                size = self.sizes.get(filename, 0)
+            self.files_done += 1
+            self.bytes_done += size
+            event = self._event(filename, False)
+        self._call(event)
+
+    def finish(self):
+        with self._lock:
+            event = self._event(None, True)
+        self._call(event)
+
+    def _call(self, event):
+        try:
+            self.callback(event)
+        except:
+            self.raised = True
+            raise
+
+    def _event(self, current_file, done):
+        elapsed = time.time() - self.start
+        eta = None
+        if done:
+            eta = 0.0
+        elif self.bytes_total and self.bytes_done:
+            eta = elapsed * (self.bytes_total - self.bytes_done) / self.bytes_done
+        elif self.files_total and self.files_done:
+            eta = elapsed * (self.files_total - self.files_done) / self.files_done
+        return ProgressEvent(self.operation, self.files_done, self.files_total, self.bytes_done,
+                             self.bytes_total, current_file, elapsed, eta, done)
+
+
+def file_sizes(filenames):
+    """ Returns {filename: size} for the files that can be stat()ed. """
+    sizes = dict()
+    for filename in filenames:
+        try:
+            sizes[filename] = os.path.getsize(filename)
+        except OSError:
+            sizes[filename] = 0
+    return sizes
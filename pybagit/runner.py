@@ -0,0 +1,286 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Running bag operations in the background for PyBagIt """
+
+import collections
+import threading
+from multiprocessing.pool import ThreadPool
+
+from pybagit.exceptions import *
+
+PENDING = 'pending'
+RUNNING = 'running'
+CANCELLED = 'cancelled'
+FINISHED = 'finished'
+
+
+class BagFuture(object):
+    """ An update(), validate(), fetch() or package() that a BagRunner
+        has been asked to run.
+
+        progress is the last pybagit.progress.ProgressEvent the operation
+        sent, or None if it has sent none yet.
+    """
+    def __init__(self, bag, operation):
+        self.bag = bag
+        self.operation = operation
+        self.progress = None
+        self._state = PENDING
+        self._result = None
+        self._exception = None
+        self._stop = False  # set when a running operation is cancelled
+        self._callbacks = []
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return "<BagFuture {0} {1} {2}>".format(self.operation, self.bag.bag_directory, self._state)
+
+    def running(self):
+        return self._state == RUNNING
+
+    def done(self):
+        """ True once the operation has finished, failed or been cancelled. """
+        return self._state in (FINISHED, CANCELLED)
+
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def cancel(self):
+        """ Cancels the operation. One that hasn't started yet never will;
+            one that is running stops when it next finishes a file, unless
+            it finishes altogether first. Returns False if the operation
+            had already finished.
+        """
+        with self._condition:
+            if self._state == FINISHED:
+                return False
+            if self._state == PENDING:
+                self._state = CANCELLED
+                self._exception = BagOperationCancelled("{0} was cancelled.".format(self.operation))
+                self._condition.notify_all()
+            else:
+                self._stop = True
+        if self._state == CANCELLED:
+            self._run_callbacks()
+        return True
+
+    def wait(self, timeout=None):
+        """ Waits for the operation to be done, for at most timeout seconds
+            if it is given. Returns done().
+        """
+        with self._condition:
+            if not self.done():
+                # Condition.wait() without a timeout can't be interrupted.
+                self._condition.wait(timeout if timeout is not None else 0x7fffffff)
+        return self.done()
+
+    def result(self):
+        """ Waits for the operation, and returns what it returned, or
+            raises what it raised. A cancelled operation raises
+            BagOperationCancelled.
+        """
+        while not self.wait():
+            pass
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """ Waits for the operation, and returns the exception it raised,
+            or None.
+        """
+        while not self.wait():
+            pass
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """ Calls callback with this future once it is done, straight away
+            if it already is. Callbacks are called in the runner's thread,
+            not the caller's; anything they raise is ignored.
+        """
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def _on_progress(self, event):
+        self.progress = event
+        if self._stop:
+            raise BagOperationCancelled("{0} was cancelled.".format(self.operation))
+
+    def _start(self):
+        with self._condition:
+            if self._state != PENDING:
+                return False
+            self._state = RUNNING
+            return True
+
+    def _finish(self, result=None, exception=None):
+        with self._condition:
+            self._result = result
+            self._exception = exception
+            if isinstance(exception, BagOperationCancelled):
+                self._state = CANCELLED
+            else:
+                self._state = FINISHED
+            self._condition.notify_all()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            pass
+
+
+class BagRunner(object):
+    """ Runs bag operations in the background, at most max_bags at once,
+        and hands back a BagFuture for each.
+
+        processes is passed to every update() and validate() that isn't
+        given its own, so that the number of checksum workers stays
+        bounded however many bags are being worked on. Operations on the
+        same bag are run one after another, in the order they were asked
+        for; each waits in its bag's queue, not in the pool, so a busy bag
+        never holds up the others.
+    """
+    def __init__(self, max_bags=2, processes=1):
+        if not isinstance(max_bags, (int, long)) or max_bags < 1:
+            raise BagError("max_bags must be a positive number.")
+        self.max_bags = max_bags
+        self.processes = processes
+        self._pool = ThreadPool(max_bags)
+        self._condition = threading.Condition()
+        self._queues = {}  # {bag: deque of operations waiting for the running one}
+        self._closing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def update(self, bag, **kwargs):
+        kwargs.setdefault('processes', self.processes)
+        return self.submit(bag, 'update', **kwargs)
+
+    def validate(self, bag, **kwargs):
+        kwargs.setdefault('processes', self.processes)
+        return self.submit(bag, 'validate', **kwargs)
+
+    def fetch(self, bag, **kwargs):
+        return self.submit(bag, 'fetch', **kwargs)
+
+    def package(self, bag, destination, **kwargs):
+        return self.submit(bag, 'package', destination, **kwargs)
+
+    def submit(self, bag, operation, *args, **kwargs):
+        """ Runs getattr(bag, operation)(*args, **kwargs) in the
+            background, and returns its BagFuture.
+        """
+        if operation not in ('update', 'validate', 'fetch', 'package'):
+            raise BagError("{0} is not a bag operation.".format(operation))
+        future = BagFuture(bag, operation)
+        with self._condition:
+            if self._closing:
+                raise BagError("The runner has been shut down.")
+            queue = self._queues.get(bag)
+            if queue is not None:
+                # the bag is busy; this runs when its turn comes.
+                queue.append((future, args, kwargs))
+                return future
+            self._queues[bag] = collections.deque()
+        self._pool.apply_async(self._run, (future, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """ Stops taking operations. The ones already asked for are still
+            run; if wait is True, this waits for them to finish.
+        """
+        with self._condition:
+            self._closing = True
+            if not self._queues:
+                self._pool.close()
+            if not wait:
+                return
+            while self._queues:
+                # a timeout keeps the wait interruptible.
+                self._condition.wait(1)
+        self._pool.join()
+
+    def _run(self, future, args, kwargs):
+        try:
+            if future._start():
+                self._call(future, args, kwargs)
+        finally:
+            self._next(future.bag)
+
+    def _call(self, future, args, kwargs):
+        bag = future.bag
+        progress = bag.progress
+
+        def on_progress(event):
+            future._on_progress(event)
+            if progress is not None:
+                progress(event)
+
+        bag.progress = on_progress
+        try:
+            result = getattr(bag, future.operation)(*args, **kwargs)
+        except Exception, e:
+            future._finish(exception=e)
+        else:
+            future._finish(result)
+        finally:
+            bag.progress = progress
+
+    def _next(self, bag):
+        """ Hands the bag's next operation to the pool, skipping any that
+            were cancelled while they waited.
+        """
+        with self._condition:
+            queue = self._queues[bag]
+            while queue:
+                future, args, kwargs = queue.popleft()
+                if not future.cancelled():
+                    break
+            else:
+                del self._queues[bag]
+                if not self._queues:
+                    if self._closing:
+                        self._pool.close()
+                    self._condition.notify_all()
+                return
+        self._pool.apply_async(self._run, (future, args, kwargs))
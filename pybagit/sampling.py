@@ -0,0 +1,78 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Reproducible random sampling of manifest entries for PyBagIt """
+
+import math
+import random
+
+from pybagit.exceptions import *
+
+
+def sample_size(sample, population):
+    """ Returns how many of population items to pick for sample, which is
+        either a fraction of them (a float, up to 1.0) or a number of them
+        (an int).
+    """
+    if isinstance(sample, bool) or not isinstance(sample, (int, long, float)) or sample < 0:
+        raise BagError("sample must be a fraction between 0 and 1, or a number of files; got {0!r}".format(sample))
+    if isinstance(sample, float):
+        if sample > 1:
+            raise BagError("sample must be a fraction between 0 and 1, or a number of files; got {0!r}".format(sample))
+        return int(math.ceil(sample * population))
+    return min(sample, population)
+
+
+def weighted_sample(items, k, weight=None, seed=None):
+    """ Picks k of items at random, without replacement, and returns them
+        in the order they were given.
+
+        weight may be a function returning each item's weight; an item
+        twice as heavy as another is twice as likely to be picked first.
+        Items are keyed by random() ** (1 / weight) and the k largest keys
+        win (Efraimidis and Spirakis' weighted random sampling), so the
+        same items, weights and seed always give the same sample. The keys
+        are compared as logarithms, which keeps them apart for weights as
+        large as file sizes.
+    """
+    items = list(items)
+    if k >= len(items):
+        return items
+
+    rng = random.Random(seed)
+    keys = dict()
+    for item in items:
+        u = 1.0 - rng.random()  # in (0, 1], so that it has a logarithm.
+        w = 1.0 if weight is None else float(weight(item))
+        if w > 0:
+            keys[item] = (1, math.log(u) / w)
+        else:
+            # never chosen ahead of an item with any weight at all.
+            keys[item] = (0, u)
+
+    chosen = set(sorted(items, key=lambda item: keys[item], reverse=True)[:k])
+    return [item for item in items if item in chosen]
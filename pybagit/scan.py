@@ -0,0 +1,231 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" A single pass over a payload directory tree for PyBagIt """
+
+import os
+import stat
+import threading
+from multiprocessing.pool import ThreadPool
+
+# python 2 has no os.scandir; use the scandir package if it's installed,
+# and otherwise listdir() and one lstat() per entry.
+_scandir = getattr(os, 'scandir', None)
+if _scandir is None:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+FILE, DIRECTORY, LINKED_DIRECTORY = range(3)
+
+
+class Scan(object):
+    """ The files found under a directory, with what stat() said about
+        each, gathered by scan_tree() so that nothing needs to stat them
+        again.
+
+        files is the list of file paths, in the order os.walk() would give
+        them; stats is {path: stat result}, the result being None for files
+        that could not be stat()ed, such as dangling links. empty_dirs lists
+        the directories with nothing at all in them. tree is {directory:
+        (subdirectories, files)} for every directory that was listed; links
+        to directories are among the subdirectories, but aren't listed.
+    """
+    def __init__(self):
+        self.files = []
+        self.stats = {}
+        self.empty_dirs = []
+        self.tree = {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def add(self, path):
+        """ Adds a file created since the scan. """
+        self.files.append(path)
+        self.stats[path] = _stat(path)
+
+    def rename(self, index, new):
+        """ Records that the file at files[index] was renamed to new. """
+        old = self.files[index]
+        self.files[index] = new
+        self.stats[new] = self.stats.pop(old)
+
+    def sizes(self, paths=None):
+        """ Returns {path: size} for paths (by default, every file), with 0
+            for files that could not be stat()ed.
+        """
+        if paths is None:
+            paths = self.files
+        stats = self.stats
+        return dict((path, stats[path].st_size if stats.get(path) is not None else 0) for path in paths)
+
+
+def scan_tree(top, threads=1):
+    """ Scans the tree under top in one pass, stat()ing every entry once.
+        Links to directories are not followed, as with os.walk(); links to
+        files are stat()ed through.
+
+        With more than one thread, up to that many directories are listed
+        at once. On network filesystems, where every listing and stat()
+        waits on the server, this hides most of that latency. The result
+        is the same either way.
+    """
+    if threads > 1:
+        listed = _list_parallel(top, threads)
+        list_directory = listed.get
+    else:
+        list_directory = _try_entries
+
+    scan = Scan()
+    pending = [top]
+    while pending:
+        directory = pending.pop()
+        entries = list_directory(directory)
+        if entries is None:
+            # as os.walk() does, skip directories that can't be listed.
+            continue
+
+        if not entries:
+            scan.empty_dirs.append(directory)
+        subdirs = []
+        dirs = []
+        files = []
+        for path, kind, st in entries:
+            if kind == FILE:
+                files.append(path)
+                scan.stats[path] = st
+            else:
+                dirs.append(path)
+                if kind == DIRECTORY:
+                    subdirs.append(path)
+        scan.files.extend(files)
+        scan.tree[directory] = (dirs, files)
+        pending.extend(reversed(subdirs))
+    return scan
+
+
+def _list_parallel(top, threads):
+    """ Lists every directory under top with a pool of threads, handing
+        each subdirectory to the pool as soon as it is found. Returns
+        {directory: entries}, with None for those that couldn't be listed.
+    """
+    listed = {}
+    failures = []
+    outstanding = [0]
+    finished = threading.Condition()
+    pool = ThreadPool(threads)
+
+    def submit(directory):
+        outstanding[0] += 1
+        pool.apply_async(_list_one, (directory,), callback=done)
+
+    def done(result):
+        # runs in the pool's result thread, one result at a time.
+        directory, entries, error = result
+        with finished:
+            listed[directory] = entries
+            if error is not None:
+                failures.append(error)
+            elif entries is not None:
+                for path, kind, st in entries:
+                    if kind == DIRECTORY:
+                        submit(path)
+            outstanding[0] -= 1
+            if not outstanding[0] or failures:
+                finished.notify()
+
+    try:
+        with finished:
+            submit(top)
+            while outstanding[0] and not failures:
+                # a timeout keeps the wait interruptible.
+                finished.wait(1)
+        if failures:
+            raise failures[0]
+    finally:
+        pool.terminate()
+        pool.join()
+    return listed
+
+
+def _list_one(directory):
+    try:
+        return (directory, _try_entries(directory), None)
+    except Exception, e:
+        return (directory, None, e)
+
+
+def _try_entries(directory):
+    try:
+        return _entries(directory)
+    except OSError:
+        return None
+
+
+def _entries(directory):
+    # [(path, kind, stat result)] for the entries in directory.
+    entries = []
+    if _scandir is not None:
+        for entry in _scandir(directory):
+            if entry.is_dir():
+                entries.append((entry.path, LINKED_DIRECTORY if entry.is_symlink() else DIRECTORY, None))
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                st = None
+            entries.append((entry.path, FILE, st))
+        return entries
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        st = _lstat(path)
+        kind = FILE
+        if st is not None and stat.S_ISLNK(st.st_mode):
+            st = _stat(path)
+            if st is not None and stat.S_ISDIR(st.st_mode):
+                kind = LINKED_DIRECTORY
+        elif st is not None and stat.S_ISDIR(st.st_mode):
+            kind = DIRECTORY
+        entries.append((path, kind, None if kind != FILE else st))
+    return entries
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _lstat(path):
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
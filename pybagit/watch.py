@@ -0,0 +1,310 @@
+__author__ = "Andrew Hankinson (andrew.hankinson@mail.mcgill.ca)"
+__version__ = "1.5"
+__date__ = "2011"
+__copyright__ = "Creative Commons Attribution"
+__license__ = """The MIT License
+
+                Permission is hereby granted, free of charge, to any person obtaining a copy
+                of this software and associated documentation files (the "Software"), to deal
+                in the Software without restriction, including without limitation the rights
+                to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+                copies of the Software, and to permit persons to whom the Software is
+                furnished to do so, subject to the following conditions:
+
+                The above copyright notice and this permission notice shall be included in
+                all copies or substantial portions of the Software.
+
+                THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+                IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+                FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+                AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+                LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+                OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+                THE SOFTWARE."""
+
+
+
+
+""" Keeps a bag's manifests in sync with its payload, using Linux inotify """
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from pybagit.exceptions import *
+from pybagit.manifest import Manifest
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _inotify():
+    """ Returns libc, checking that it has inotify. """
+    global _libc
+    if _libc is None:
+        if not sys.platform.startswith('linux'):
+            raise BagError("Watching a bag needs Linux inotify.")
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise BagError("This C library does not support inotify.")
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+class BagWatcher(object):
+    """ Follows the files created, modified, renamed and deleted under a
+        bag's data directory, and updates its manifests and tag manifests
+        to match, checksumming only the files that changed.
+
+        A file is only checksummed once it has been left alone for debounce
+        seconds, so a burst of writes to it is checksummed once. Call
+        process_events() (or run(), which calls it until it is stopped)
+        to handle the changes.
+
+        File names are not sanitised as update() does, and names that
+        aren't valid in the filesystem encoding are skipped and recorded in
+        bag_errors. If the kernel's
+        event queue overflows, the watcher falls back to update(full=False).
+    """
+    def __init__(self, bag, debounce=1.0, processes=1, sync=True):
+        bag._check_writable()
+        self.bag = bag
+        self.debounce = debounce
+        self.processes = processes
+        self._libc = _inotify()
+        self._encoding = sys.getfilesystemencoding() or 'utf-8'
+        self._watches = {}  # watch descriptor -> directory
+        self._pending = {}  # path -> time of its last event
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise BagError("Could not start watching the bag: {0}".format(os.strerror(e)))
+
+        # watch first, then catch up, so that nothing can slip in between.
+        self._watch_tree(self.bag.data_directory)
+        if sync:
+            self.bag.update(full=False, processes=processes)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self._watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def pending(self):
+        """ Returns the number of changed paths not handled yet. """
+        return len(self._pending)
+
+    def process_events(self, timeout=0):
+        """ Waits up to timeout seconds for changes, then brings the
+            manifests up to date with every path that has settled. Returns
+            the set of bag-relative paths whose entries changed.
+        """
+        readable, writable, exceptional = select.select([self.fd], [], [], timeout)
+        if readable:
+            self._read_events()
+
+        now = time.time()
+        settled = [path for path, last in self._pending.iteritems() if now - last >= self.debounce]
+        return self._apply(settled)
+
+    def flush(self):
+        """ Handles every pending change at once, settled or not. """
+        self._read_events()
+        return self._apply(self._pending.keys())
+
+    def run(self, stop, poll=0.5):
+        """ Processes events until stop (a threading.Event) is set, then
+            flushes any pending changes.
+        """
+        while not stop.is_set():
+            self.process_events(poll)
+        self.flush()
+
+    def _watch_tree(self, top):
+        """ Watches top and every directory under it. Returns the files
+            found in them, which may have been written before the watch
+            started.
+        """
+        found = []
+        if isinstance(top, str):
+            top = top.decode(self._encoding)
+        # not os.walk, which fails joining a name it couldn't decode.
+        directories = [top]
+        while directories:
+            dirpath = directories.pop()
+            wd = self._libc.inotify_add_watch(self.fd, dirpath.encode(self._encoding), WATCH_MASK)
+            if wd < 0:
+                e = ctypes.get_errno()
+                if e == errno.ENOENT:
+                    continue
+                raise BagError("Could not watch {0}: {1}".format(dirpath, os.strerror(e)))
+            self._watches[wd] = dirpath
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            for name in names:
+                # listdir hands back the names it can't decode as byte strings.
+                if isinstance(name, str):
+                    self._undecodable(dirpath, name)
+                    continue
+                path = os.path.join(dirpath, name)
+                if not os.path.isdir(path):
+                    found.append(path)
+                elif not os.path.islink(path):
+                    directories.append(path)
+        return found
+
+    def _unwatch_tree(self, top):
+        prefix = top + os.sep
+        for wd, directory in self._watches.items():
+            if directory == top or directory.startswith(prefix):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self._watches[wd]
+
+    def _read_events(self):
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return
+                raise
+            if not buf:
+                return
+
+            now = time.time()
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip("\0")
+                offset += length
+                try:
+                    name = name.decode(self._encoding)
+                except UnicodeDecodeError:
+                    self._undecodable(self._watches.get(wd), name)
+                    continue
+                self._handle_event(wd, mask, name, now)
+
+    def _undecodable(self, directory, name):
+        """ Records a name in directory that can't be decoded in the
+            filesystem encoding as a bag error; the watcher can't follow it.
+        """
+        if directory is None:
+            return
+        path = os.path.join(directory, name.decode(self._encoding, 'replace'))
+        error = (os.path.relpath(path, self.bag.bag_directory),
+                 'File name is not valid {0}, so it is not being watched'.format(self._encoding))
+        if error not in self.bag.bag_errors:
+            self.bag.bag_errors.append(error)
+
+    def _handle_event(self, wd, mask, name, now):
+        if mask & IN_Q_OVERFLOW:
+            # we've lost track; start again from a scan of the tree.
+            self._pending = {}
+            self._watch_tree(self.bag.data_directory)
+            self.bag.update(full=False, processes=self.processes)
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+
+        directory = self._watches.get(wd)
+        if directory is None or not name:
+            return
+        path = os.path.join(directory, name)
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                for found in self._watch_tree(path):
+                    self._pending[found] = now
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._unwatch_tree(path)
+                # everything the manifests list under it has gone.
+                prefix = os.path.relpath(path, self.bag.bag_directory) + os.sep
+                for relpath in self.bag.manifest_contents.keys():
+                    if relpath.startswith(prefix):
+                        self._pending[os.path.join(self.bag.bag_directory, relpath)] = now
+            return
+
+        self._pending[path] = now
+
+    def _apply(self, paths):
+        """ Updates the manifests for paths, and writes them out if
+            anything changed.
+        """
+        if not paths:
+            return set()
+        for path in paths:
+            del self._pending[path]
+
+        bag = self.bag
+        present = [p for p in paths if os.path.isfile(p)]
+        checksums, failures = bag._checksum_files(present, bag.hash_encodings, self.processes)
+
+        for alg in bag.hash_encodings:
+            bag.manifests.setdefault(alg, Manifest(alg))
+        bag.manifest_contents = bag.manifests[bag.hash_encoding]
+
+        # errors from the last time these paths were handled no longer apply.
+        handled = set(os.path.relpath(p, bag.bag_directory) for p in paths)
+        bag.bag_errors = [e for e in bag.bag_errors if e[0] not in handled]
+
+        changed = set()
+        for path in paths:
+            relpath = os.path.relpath(path, bag.bag_directory)
+            for alg in bag.hash_encodings:
+                manifest = bag.manifests[alg]
+                old = manifest.get(relpath)
+                new = checksums[path][alg] if path in checksums else None
+                if old == new:
+                    continue
+                if new is None:
+                    del manifest[relpath]
+                else:
+                    manifest[relpath] = new
+                changed.add(relpath)
+            if path in failures:
+                bag.bag_errors.append((relpath, 'File could not be read: {0}'.format(failures[path])))
+
+        if changed:
+            for alg in bag.hash_encodings:
+                bag._write_dict_to_manifest(algorithm=alg)
+            bag._update_payload_oxum()
+            bag._update_tag_manifests()
+        return changed
@@ -0,0 +1,79 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+
+
+class ChecksumCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'testbag')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), self.bagdir)
+        self.cache_file = os.path.join(self.tdir, '.testbag.checksum-cache')
+        self.bag = BagIt(self.bagdir, checksum_cache=True)
+        self.bag.update()
+        self.angry = os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg')
+        self.angry_rel = os.path.join('data', 'subdir', 'subsubdir', 'angry.jpg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _overwrite_keeping_stat(self, filename):
+        st = os.stat(filename)
+        f = open(filename, 'r+b')
+        f.write('X')
+        f.close()
+        os.utime(filename, (st.st_atime, st.st_mtime))
+
+    def test_cache_file_is_written_next_to_bag(self):
+        self.assertTrue(os.path.exists(self.cache_file))
+        self.assertFalse(os.path.exists(os.path.join(self.bagdir, '.testbag.checksum-cache')))
+
+    def test_cache_is_persistent(self):
+        reopened = BagIt(self.bagdir, checksum_cache=True)
+        self.assertEquals(len(reopened._get_checksum_cache()), len(self.bag.manifest_contents))
+
+    def test_unchanged_files_are_not_read(self):
+        self._overwrite_keeping_stat(self.angry)
+        self.assertEquals(self.bag.validate(), [])
+
+    def test_strict_reads_every_file(self):
+        self._overwrite_keeping_stat(self.angry)
+        self.assertEquals([e[0] for e in self.bag.validate(strict=True)], [self.angry_rel])
+
+    def test_partial_update_notices_changed_files(self):
+        old = self.bag.manifest_contents[self.angry_rel]
+        f = open(self.angry, 'ab')
+        f.write('changed')
+        f.close()
+        self.bag.update(full=False)
+        self.assertNotEquals(self.bag.manifest_contents[self.angry_rel], old)
+        self.assertEquals(self.bag.validate(strict=True), [])
+
+    def test_last_checked_is_persistent(self):
+        checked = self.bag._get_checksum_cache().last_checked(self.angry_rel)
+        self.assertTrue(checked > 0)
+        reopened = BagIt(self.bagdir, checksum_cache=True)
+        self.assertEquals(reopened._get_checksum_cache().last_checked(self.angry_rel), checked)
+
+    def test_old_cache_is_read(self):
+        f = open(self.cache_file, 'rb')
+        lines = f.readlines()
+        f.close()
+        f = open(self.cache_file, 'wb')
+        f.write(lines[0].replace('cache 2', 'cache 1'))
+        for line in lines[1:]:
+            fields = line.split(' ', 6)
+            f.write(' '.join(fields[:5] + fields[6:]))
+        f.close()
+        reopened = BagIt(self.bagdir, checksum_cache=True)
+        cache = reopened._get_checksum_cache()
+        self.assertEquals(len(cache), len(self.bag.manifest_contents))
+        self.assertEquals(cache.last_checked(self.angry_rel), None)
+
+
+def suite():
+    test_suite = unittest.makeSuite(ChecksumCacheTest, 'test')
+    return test_suite
@@ -0,0 +1,99 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+from pybagit.metrics import Metrics
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'checkpointbag')
+        self.checkpoint = os.path.join(self.tdir, '.checkpointbag.validate-checkpoint')
+        bag = BagIt(self.bagdir)
+        for i in range(10):
+            f = open(os.path.join(bag.data_directory, 'file{0}.txt'.format(i)), 'w')
+            f.write('contents of file {0}\n'.format(i))
+            f.close()
+        bag.update()
+        self.corrupt = os.path.join(bag.data_directory, 'file3.txt')
+        f = open(self.corrupt, 'ab')
+        f.write('corrupt')
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _interrupt_after(self, files, checkpoint=True):
+        events = []
+
+        def progress(event):
+            events.append(event)
+            if len(events) == files:
+                raise Interrupted()
+        bag = BagIt(self.bagdir, progress=progress)
+        self.assertRaises(Interrupted, bag.validate, processes=1, checkpoint=checkpoint)
+
+    def _resume(self):
+        metrics = Metrics()
+        bag = BagIt(self.bagdir, metrics=metrics)
+        errors = bag.validate(processes=1, checkpoint=True)
+        return errors, metrics.files
+
+    def test_resume_gives_the_same_result(self):
+        expected = BagIt(self.bagdir).validate(processes=1)
+        self.assertEquals(len(expected), 1)
+        self._interrupt_after(6)
+        self.assertTrue(os.path.exists(self.checkpoint))
+        errors, read = self._resume()
+        self.assertEquals(errors, expected)
+        self.assertEquals(read, 4)
+
+    def test_checkpoint_is_removed_when_done(self):
+        self._interrupt_after(6)
+        self._resume()
+        self.assertFalse(os.path.exists(self.checkpoint))
+        BagIt(self.bagdir).validate(checkpoint=True)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_changed_files_are_read_again(self):
+        self._interrupt_after(10)
+        f = open(self.corrupt, 'wb')
+        f.write('contents of file 3\n')
+        f.close()
+        os.utime(self.corrupt, (0, 0))
+        errors, read = self._resume()
+        self.assertEquals(errors, [])
+        self.assertEquals(read, 1)
+
+    def test_checkpoint_is_saved_periodically(self):
+        saved = []
+
+        def progress(event):
+            if os.path.exists(self.checkpoint):
+                f = open(self.checkpoint, 'rb')
+                saved.append(len(json.load(f)['files']))
+                f.close()
+        BagIt(self.bagdir, progress=progress).validate(processes=1, checkpoint=True, checkpoint_interval=0)
+        self.assertEquals(saved, range(1, 11))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_checkpoint_path(self):
+        checkpoint = os.path.join(self.tdir, 'elsewhere.json')
+        self._interrupt_after(3, checkpoint)
+        self.assertTrue(os.path.exists(checkpoint))
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEquals(len(BagIt(self.bagdir).validate(checkpoint=checkpoint)), 1)
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+def suite():
+    test_suite = unittest.makeSuite(CheckpointTest, 'test')
+    return test_suite
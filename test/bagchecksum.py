@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import hashlib
+import tempfile
+from StringIO import StringIO
+from pybagit import multichecksum
+from pybagit.bagit import BagIt
+
+
+class ChecksumReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.contents = os.urandom(100000)
+        self.filename = os.path.join(self.tdir, 'file')
+        f = open(self.filename, 'wb')
+        f.write(self.contents)
+        f.close()
+        self.expected = dict((alg, hashlib.new(alg, self.contents).hexdigest()) for alg in multichecksum.ALGORITHMS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_read(self):
+        self.assertEquals(multichecksum.csumfile(self.filename, 'sha1'), (self.expected['sha1'], self.filename))
+
+    def test_blocksizes(self):
+        for blocksize in (1, 7, 4096, 100000, 0x100000):
+            checksum, filename = multichecksum.csumfile(self.filename, multichecksum.ALGORITHMS, blocksize)
+            self.assertEquals(checksum, self.expected)
+
+    def test_mmap(self):
+        for blocksize in (7, 0x10000):
+            checksum, filename = multichecksum.csumfile(self.filename, multichecksum.ALGORITHMS, blocksize,
+                                                        mmap_threshold=1)
+            self.assertEquals(checksum, self.expected)
+
+    def test_mmap_empty_file(self):
+        empty = os.path.join(self.tdir, 'empty')
+        open(empty, 'wb').close()
+        self.assertEquals(multichecksum.csumfile(empty, 'md5', mmap_threshold=0)[0], hashlib.md5().hexdigest())
+
+    def test_with_fadvise(self):
+        self.assertFalse(multichecksum.FADVISE)
+        self.assertEquals(multichecksum.csumfile(self.filename, 'sha256', fadvise=True)[0], self.expected['sha256'])
+
+    def test_stream_without_readinto(self):
+        self.assertEquals(multichecksum.csumstream(StringIO(self.contents), 'sha512', 999), self.expected['sha512'])
+
+    def test_module_defaults(self):
+        blocksize, threshold = multichecksum.BLOCKSIZE, multichecksum.MMAP_THRESHOLD
+        multichecksum.BLOCKSIZE, multichecksum.MMAP_THRESHOLD = 3, 50000
+        try:
+            self.assertEquals(multichecksum.csumfile(self.filename, 'md5')[0], self.expected['md5'])
+        finally:
+            multichecksum.BLOCKSIZE, multichecksum.MMAP_THRESHOLD = blocksize, threshold
+
+    def test_bag_checksum(self):
+        bag = BagIt(os.path.join(self.tdir, 'bag'))
+        self.assertEquals(bag._calculate_checksum(self.filename), self.expected['sha1'])
+
+
+def suite():
+    test_suite = unittest.makeSuite(ChecksumReaderTest, 'test')
+    return test_suite
@@ -0,0 +1,154 @@
+import unittest
+import os
+import shutil
+import hashlib
+import tempfile
+from pybagit import multichecksum
+from pybagit.bagit import BagIt
+from pybagit.chunks import ChunkManifest, chunk_ranges
+from pybagit.exceptions import BagError
+
+
+class ChunkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'chunkbag')
+        self.bag = BagIt(self.bagdir)
+        self.big = os.path.join(self.bag.data_directory, 'big.bin')
+        self.big_rel = os.path.join('data', 'big.bin')
+        self.contents = os.urandom(100000)
+        f = open(self.big, 'wb')
+        f.write(self.contents)
+        f.close()
+        f = open(os.path.join(self.bag.data_directory, 'small.txt'), 'w')
+        f.write('small')
+        f.close()
+        self.chunkfile = os.path.join(self.bagdir, 'chunkmanifest-sha1.txt')
+        self.bag.set_chunk_size(16384)
+        self.bag.update(processes=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _overwrite(self, offset, data):
+        f = open(self.big, 'r+b')
+        f.seek(offset)
+        f.write(data)
+        f.close()
+
+    def test_chunk_manifest(self):
+        self.assertTrue(os.path.exists(self.chunkfile))
+        self.assertTrue('chunkmanifest-sha1.txt' in self.bag.tag_manifest_contents)
+        chunks = ChunkManifest.read(self.chunkfile, 'sha1')
+        self.assertEquals(list(chunks), [self.big_rel])
+        size, big_chunks = chunks.get(self.big_rel, self.bag.manifest_contents[self.big_rel])
+        self.assertEquals(size, 100000)
+        self.assertEquals([(offset, length) for offset, length, csum in big_chunks], chunk_ranges(100000, 16384))
+        self.assertEquals(big_chunks[1][2], hashlib.sha1(self.contents[16384:32768]).hexdigest())
+
+    def test_chunk_size_is_read(self):
+        self.assertEquals(BagIt(self.bagdir).chunk_size, 16384)
+
+    def test_validate(self):
+        self.assertEquals(BagIt(self.bagdir).validate(processes=1), [])
+        self.assertEquals(BagIt(self.bagdir).validate(processes=2), [])
+
+    def test_corrupt_range_is_reported(self):
+        self._overwrite(40000, 'corrupt')
+        errors = BagIt(self.bagdir).validate(processes=2)
+        self.assertEquals(errors, [(self.big_rel, 'Incorrect filename or checksum in manifest'),
+                                   (self.big_rel, 'Bytes 32768-49151 do not match chunkmanifest-sha1.txt')])
+
+    def test_appended_data_is_reported(self):
+        f = open(self.big, 'ab')
+        f.write('more')
+        f.close()
+        errors = BagIt(self.bagdir).validate()
+        self.assertEquals(errors, [(self.big_rel, 'Incorrect filename or checksum in manifest'),
+                                   (self.big_rel, 'File is 100004 bytes, but 100000 bytes in chunkmanifest-sha1.txt')])
+
+    def test_update_rechunks_changed_files(self):
+        self._overwrite(0, 'changed')
+        self.bag.update(processes=1)
+        self.assertEquals(BagIt(self.bagdir).validate(), [])
+
+    def test_stale_chunks_are_not_used(self):
+        self._overwrite(0, 'changed')
+        bag = BagIt(self.bagdir)
+        bag.manifest_contents[self.big_rel] = bag._calculate_checksum(self.big)
+        self.assertEquals(bag._chunked_files([self.big]), {})
+
+    def test_disable(self):
+        self.bag.set_chunk_size(None)
+        self.bag.update()
+        self.assertFalse(os.path.exists(self.chunkfile))
+        self.assertEquals(BagIt(self.bagdir).chunk_size, None)
+
+    def test_hash_encoding(self):
+        self.bag.set_hash_encodings(['sha256', 'md5'])
+        self.bag.update()
+        self.assertFalse(os.path.exists(self.chunkfile))
+        self.assertTrue(os.path.exists(os.path.join(self.bagdir, 'chunkmanifest-sha256.txt')))
+        self.assertEquals(BagIt(self.bagdir).validate(), [])
+
+    def test_update_reads_large_files_once(self):
+        ranges = []
+        csumrange = multichecksum.csumrange
+
+        def counted(*args, **kwargs):
+            ranges.append(args)
+            return csumrange(*args, **kwargs)
+        multichecksum.csumrange = counted
+        try:
+            self._overwrite(0, 'changed')
+            self.bag.update(processes=1)
+        finally:
+            multichecksum.csumrange = csumrange
+        self.assertEquals(ranges, [])
+        chunks = ChunkManifest.read(self.chunkfile, 'sha1')
+        size, big_chunks = chunks.get(self.big_rel, self.bag.manifest_contents[self.big_rel])
+        self.assertEquals(big_chunks[0][2], hashlib.sha1('changed' + self.contents[7:16384]).hexdigest())
+        self.assertEquals(BagIt(self.bagdir).validate(), [])
+
+    def test_other_algorithms_are_checked_in_full(self):
+        self.bag.set_hash_encodings(['sha1', 'md5'])
+        self.bag.update(processes=1)
+        bag = BagIt(self.bagdir)
+        bag.manifests['md5'][self.big_rel] = '0' * 32
+        self.assertEquals(bag.validate(processes=1), [(self.big_rel, 'Incorrect filename or checksum in manifest-md5.txt')])
+
+        self._overwrite(40000, 'corrupt')
+        errors = BagIt(self.bagdir).validate(processes=1)
+        self.assertEquals(errors, [(self.big_rel, 'Incorrect filename or checksum in manifest'),
+                                   (self.big_rel, 'Incorrect filename or checksum in manifest-md5.txt'),
+                                   (self.big_rel, 'Bytes 32768-49151 do not match chunkmanifest-sha1.txt')])
+
+    def test_chunk_manifest_must_match_tag_manifest(self):
+        # chunk digests rewritten to match a corrupted file are not trusted.
+        self._overwrite(40000, 'corrupt')
+        chunks = ChunkManifest.read(self.chunkfile, 'sha1')
+        size, big_chunks = chunks.get(self.big_rel, self.bag.manifest_contents[self.big_rel])
+        big_chunks = [(offset, length, multichecksum.csumrange(self.big, offset, length, 'sha1'))
+                      for offset, length, csum in big_chunks]
+        chunks.set(self.big_rel, self.bag.manifest_contents[self.big_rel], size, big_chunks)
+        chunks.write(self.chunkfile)
+        errors = BagIt(self.bagdir).validate(processes=1)
+        self.assertEquals(errors, [('chunkmanifest-sha1.txt', 'Incorrect checksum in tagmanifest-sha1.txt'),
+                                   (self.big_rel, 'Incorrect filename or checksum in manifest')])
+
+    def test_bad_chunk_size(self):
+        self.assertRaises(BagError, self.bag.set_chunk_size, 0)
+
+    def test_checksum_ranges(self):
+        ranges = [(self.big, offset, length) for offset, length in chunk_ranges(100000, 30000)]
+        checksums, failures = multichecksum.checksum_ranges(ranges, 'md5', processes=2)
+        self.assertEquals(failures, {})
+        for filename, offset, length in ranges:
+            self.assertEquals(checksums[(filename, offset)],
+                              hashlib.md5(self.contents[offset:offset + length]).hexdigest())
+
+
+def suite():
+    test_suite = unittest.makeSuite(ChunkTest, 'test')
+    return test_suite
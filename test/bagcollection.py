@@ -0,0 +1,101 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import multiprocessing
+from StringIO import StringIO
+from pybagit.bagit import BagIt
+from pybagit.collection import BagCollection, find_bags, main
+from pybagit import multichecksum
+
+
+class Stop(Exception):
+    pass
+
+class CollectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bags = []
+        for i in range(4):
+            path = os.path.join(self.tdir, 'shelf{0}'.format(i % 2), 'bag{0}'.format(i))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            bag = BagIt(path)
+            for j in range(3):
+                f = open(os.path.join(bag.data_directory, 'file{0}.txt'.format(j)), 'w')
+                f.write('bag {0} file {1}\n'.format(i, j))
+                f.close()
+            if i == 0:
+                # a bag inside a bag's payload is part of that bag's payload.
+                BagIt(os.path.join(bag.data_directory, 'inner'))
+            bag.update(processes=1)
+            self.bags.append(bag.bag_directory)
+        self.bags.sort()
+        self.corrupt = self.bags[2]
+        f = open(os.path.join(self.corrupt, 'data', 'file1.txt'), 'a')
+        f.write('corrupt')
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_find_bags(self):
+        self.assertEquals(find_bags(self.tdir), self.bags)
+
+    def test_validate(self):
+        finished = []
+        collection = BagCollection(self.tdir, processes=2, bags_at_once=3)
+        report = collection.validate(callback=lambda bag, errors: finished.append(bag))
+        self.assertEquals(report.results.keys(), self.bags)
+        self.assertEquals(sorted(finished), self.bags)
+        self.assertEquals(report.invalid(), [self.corrupt])
+        self.assertEquals(len(report.valid()), 3)
+        self.assertFalse(report.is_valid())
+        self.assertEquals(report.results[self.corrupt][0][0], 'data/file1.txt')
+        self.assertEquals(report.as_dict()['invalid'], 1)
+        self.assertTrue(u"INVALID {0}".format(self.corrupt) in report.report())
+        self.assertFalse(self.bags[0] in report.report(invalid_only=True))
+
+    def test_validate_options(self):
+        missing = os.path.join(self.tdir, 'missing')
+        report = BagCollection(self.bags + [missing], processes=1).validate(fast=True)
+        # the corrupted file has grown, so even a fast validation notices.
+        self.assertEquals(report.results[missing], [('bag', 'Bag does not exist')])
+        self.assertFalse(os.path.exists(missing))
+        self.assertEquals(report.invalid(), [self.corrupt, missing])
+
+    def test_callback_stops_validation(self):
+        def stop(bag, errors):
+            raise Stop()
+        collection = BagCollection(self.bags, processes=1, bags_at_once=1)
+        self.assertRaises(Stop, collection.validate, stop)
+
+    def test_shared_pool(self):
+        files = [os.path.join(bag, 'data', 'file0.txt') for bag in self.bags]
+        pool = multiprocessing.Pool(2)
+        try:
+            first = multichecksum.checksum_files(files, 'sha1', pool)
+            second = multichecksum.checksum_files(files[:1], 'sha1', pool)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEquals(len(first[0]), 4)
+        self.assertEquals(second[0], {files[0]: first[0][files[0]]})
+
+    def test_main(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertRaises(SystemExit, main, ['-p', '1', '-q', self.tdir])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEquals(output.splitlines()[0], "INVALID {0}".format(self.corrupt))
+        self.assertTrue("4 bags, 1 invalid" in output)
+
+
+def suite():
+    test_suite = unittest.makeSuite(CollectionTest, 'test')
+    return test_suite
@@ -1,7 +1,15 @@
 import unittest
+import gzip
 import os
 import shutil
+import StringIO
+import subprocess
+import tarfile
+import tempfile
+import zipfile
 from pybagit.bagit import BagIt
+from pybagit.archive import ParallelGzipWriter
+from pybagit.exceptions import BagError
 
 
 class CompressTest(unittest.TestCase):
@@ -52,6 +60,161 @@ class CompressTest(unittest.TestCase):
         self.assertTrue(os.path.exists(zipbag.bag_directory))
 
 
+class StreamingPackageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bag = BagIt(os.path.join(os.getcwd(), 'test', 'testbag'))
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _package_through_pipe(self, method):
+        # cat only ever sees a pipe, which can't seek.
+        output = os.path.join(self.tdir, 'piped.{0}'.format(method))
+        outfile = open(output, 'wb')
+        p = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=outfile)
+        self.assertEquals(self.bag.package(p.stdin, method=method), p.stdin)
+        p.stdin.close()
+        p.wait()
+        outfile.close()
+        return output
+
+    def test_package_to_file_path(self):
+        path = os.path.join(self.tdir, 'mybag.zip')
+        self.assertEquals(self.bag.package(path, method='zip'), path)
+        self.assertEquals(os.listdir(self.tdir), ['mybag.zip'])
+        self.assertEquals(zipfile.ZipFile(path).testzip(), None)
+
+    def test_zip_to_pipe(self):
+        z = zipfile.ZipFile(self._package_through_pipe('zip'))
+        self.assertEquals(z.testzip(), None)
+        self.assertEquals(z.read('bagit.txt'),
+                          open(os.path.join(self.bag.bag_directory, 'bagit.txt'), 'rb').read())
+        self.assertTrue(os.path.join('data', 'subdir', 'subsubdir', 'angry.jpg') in z.namelist())
+
+    def test_tgz_to_pipe_puts_tag_files_first(self):
+        t = tarfile.open(self._package_through_pipe('tgz'))
+        names = [m.name for m in t.getmembers() if m.isfile()]
+        t.close()
+        self.assertEquals(names[0], './bag-info.txt')
+        self.assertTrue(names.index('./tagmanifest-sha1.txt') < names.index('./data/subdir/subsubdir/angry.jpg'))
+
+    def test_parallel_tgz(self):
+        path = os.path.join(self.tdir, 'parallel.tgz')
+        self.bag.package(path, processes=4, compresslevel=6)
+        t = tarfile.open(path)
+        angry = t.extractfile('./data/subdir/subsubdir/angry.jpg').read()
+        t.close()
+        self.assertEquals(angry, open(os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg'), 'rb').read())
+
+
+class ParallelGzipTest(unittest.TestCase):
+
+    def test_output_is_a_single_gzip_stream(self):
+        data = "".join(str(i) for i in xrange(200000)) + os.urandom(100000)
+        out = StringIO.StringIO()
+        gz = ParallelGzipWriter(out, processes=3, compresslevel=1, blocksize=4096)
+        for start in xrange(0, len(data), 1000):
+            gz.write(data[start:start + 1000])
+        gz.close()
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO.StringIO(out.getvalue())).read(), data)
+
+    def test_empty_input(self):
+        out = StringIO.StringIO()
+        ParallelGzipWriter(out, processes=2).close()
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO.StringIO(out.getvalue())).read(), "")
+
+
+class ArchiveBagTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), os.path.join(self.tdir, 'testbag'))
+        self.bag = BagIt(os.path.join(self.tdir, 'testbag'))
+        self.bag.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _package(self, method):
+        return self.bag.package(os.path.join(self.tdir, 'packaged.{0}'.format(method)), method=method)
+
+    def test_validate_zip_in_place(self):
+        zbag = BagIt(self._package('zip'), extract=False)
+        self.assertEquals(zbag.bag_directory, os.path.join(self.tdir, 'packaged.zip'))
+        self.assertEquals(zbag.validate(), [])
+        self.assertEquals(len(zbag.get_bag_contents()), len(self.bag.get_bag_contents()))
+
+    def test_validate_tgz_in_place(self):
+        tbag = BagIt(self._package('tgz'), extract=False)
+        self.assertEquals(tbag.manifest_contents, self.bag.manifest_contents)
+        self.assertEquals(tbag.validate(), [])
+
+    def test_validate_tgz_with_top_level_directory(self):
+        path = os.path.join(self.tdir, 'named.tgz')
+        t = tarfile.open(path, 'w:gz')
+        t.add(self.bag.bag_directory, arcname='testbag')
+        t.close()
+        tbag = BagIt(path, extract=False)
+        self.assertEquals(tbag.validate(), [])
+
+    def test_tag_files_after_payload(self):
+        # as plain tar or zip can write them, rather than package().
+        names = sorted(n for n in os.listdir(self.bag.bag_directory) if n not in ('bagit.txt', 'data'))
+        path = os.path.join(self.tdir, 'reordered.tgz')
+        t = tarfile.open(path, 'w:gz')
+        zpath = os.path.join(self.tdir, 'reordered.zip')
+        z = zipfile.ZipFile(zpath, 'w')
+        for name in ['bagit.txt', 'data'] + names:
+            t.add(os.path.join(self.bag.bag_directory, name), arcname=name)
+        for dirpath, dirnames, filenames in os.walk(self.bag.data_directory):
+            for f in filenames:
+                z.write(os.path.join(dirpath, f), os.path.relpath(os.path.join(dirpath, f), self.bag.bag_directory))
+        z.write(os.path.join(self.bag.bag_directory, 'bagit.txt'), 'bagit.txt')
+        for name in names:
+            z.write(os.path.join(self.bag.bag_directory, name), name)
+        t.close()
+        z.close()
+        for package in (path, zpath):
+            pbag = BagIt(package, extract=False)
+            self.assertEquals(sorted(pbag._archive.tag_files), sorted(['bagit.txt'] + names))
+            self.assertEquals(pbag.validate(), [])
+
+    def test_scan_stops_at_payload(self):
+        # bagit.txt and the manifests come first, as package() writes them,
+        # so the payload and anything after it are left to payload().
+        names = sorted(n for n in os.listdir(self.bag.bag_directory) if n != 'data')
+        path = os.path.join(self.tdir, 'late.tgz')
+        late = os.path.join(self.tdir, 'late.txt')
+        open(late, 'w').write('after the payload')
+        t = tarfile.open(path, 'w:gz')
+        for name in names + ['data']:
+            t.add(os.path.join(self.bag.bag_directory, name), arcname=name)
+        t.add(late, arcname='late.txt')
+        t.close()
+        pbag = BagIt(path, extract=False)
+        self.assertEquals(sorted(pbag._archive.tag_files), names)
+        self.assertEquals(pbag.validate(), [])
+
+    def test_corrupt_payload_is_reported(self):
+        fl = open(os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg'), 'ab')
+        fl.write('trailing garbage')
+        fl.close()
+        tbag = BagIt(self._package('tgz'), extract=False)
+        self.assertEquals(tbag.validate(), [(os.path.join('data', 'subdir', 'subsubdir', 'angry.jpg'),
+                                             'Incorrect filename or checksum in manifest')])
+
+    def test_bag_cannot_be_changed(self):
+        zbag = BagIt(self._package('zip'), extract=False)
+        self.assertRaises(BagError, zbag.update)
+        self.assertRaises(BagError, zbag.package, self.tdir)
+
+
 def suite():
-    test_suite = unittest.makeSuite(CompressTest, 'test')
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(CompressTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(StreamingPackageTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(ParallelGzipTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(ArchiveBagTest, 'test'))
     return test_suite
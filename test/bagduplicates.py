@@ -0,0 +1,78 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+from pybagit.manifest import find_duplicates
+from pybagit.scan import scan_tree
+from pybagit import multichecksum
+
+
+class DuplicatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bag = BagIt(os.path.join(self.tdir, 'dupbag'))
+        data = self.bag.data_directory
+        for name, contents in (('original.txt', 'x' * 100), ('copy.txt', 'x' * 100), ('other.txt', 'y')):
+            f = open(os.path.join(data, name), 'wb')
+            f.write(contents)
+            f.close()
+        os.link(os.path.join(data, 'original.txt'), os.path.join(data, 'link.txt'))
+
+        self.reads = []
+        self._csumfile = multichecksum.csumfile
+
+        def counted(filename, *args, **kwargs):
+            if os.path.dirname(filename) == data:
+                self.reads.append(os.path.basename(filename))
+            return self._csumfile(filename, *args, **kwargs)
+        multichecksum.csumfile = counted
+
+    def tearDown(self):
+        multichecksum.csumfile = self._csumfile
+        shutil.rmtree(self.tdir)
+
+    def test_hard_links_are_read_once(self):
+        self.bag.update(processes=1)
+        self.assertEquals(len(self.bag.manifest_contents), 4)
+        self.assertEquals(self.bag.manifest_contents['data/link.txt'],
+                          self.bag.manifest_contents['data/original.txt'])
+        self.assertEquals(len(self.reads), 3)
+        self.assertEquals(len([r for r in self.reads if r in ('link.txt', 'original.txt')]), 1)
+
+        self.bag.validate(processes=1)
+        self.assertTrue(self.bag.is_valid())
+
+    def test_checksum_files(self):
+        scan = scan_tree(self.bag.data_directory)
+        called = []
+        checksums, failures = multichecksum.checksum_files(scan.files, 'sha1', 1, stats=scan.stats,
+                                                           progress=called.append)
+        self.assertEquals(sorted(called), sorted(scan.files))
+        self.assertEquals(len(checksums), 4)
+        self.assertEquals(len(self.reads), 3)
+
+        # without the stats, every path is read.
+        multichecksum.checksum_files(scan.files, 'sha1', 1)
+        self.assertEquals(len(self.reads), 7)
+
+    def test_get_duplicates(self):
+        self.assertEquals(self.bag.get_duplicates(), [])
+        self.bag.update(processes=1)
+        duplicates = self.bag.get_duplicates()
+        self.assertEquals(len(duplicates), 1)
+        checksum, size, wasted, paths = duplicates[0]
+        self.assertEquals(checksum, self.bag.manifest_contents['data/original.txt'])
+        self.assertEquals(paths, ['data/copy.txt', 'data/link.txt', 'data/original.txt'])
+        self.assertEquals(size, 100)
+        # the link takes no space of its own.
+        self.assertEquals(wasted, 100)
+
+    def test_find_duplicates(self):
+        self.assertEquals(find_duplicates([('b', '1'), ('a', '1'), ('c', '2')]), {'1': ['a', 'b']})
+
+
+def suite():
+    test_suite = unittest.makeSuite(DuplicatesTest, 'test')
+    return test_suite
@@ -0,0 +1,210 @@
+import unittest
+import BaseHTTPServer
+import hashlib
+import os
+import re
+import shutil
+import SocketServer
+import tempfile
+import threading
+from pybagit.bagit import BagIt
+from pybagit.fetcher import Fetcher
+
+CONTENT = dict(('/file{0}.txt'.format(i), "file {0}\n".format(i) * 5000) for i in xrange(5))
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class FetchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves CONTENT at /<name>, and misbehaves when asked to:
+            /flaky/<name>      fails with a 503 the first time;
+            /truncated/<name>  drops the connection half way the first time;
+            /redirect/<name>   redirects to /<name>.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.requests.append((self.path, self.headers.getheader('range')))
+            attempts = server.attempts[self.path] = server.attempts.get(self.path, 0) + 1
+
+        match = re.match(r"^(/flaky|/truncated|/redirect)?(/.*)$", self.path)
+        behaviour, name = match.groups()
+        if name not in CONTENT:
+            return self._send(404, "")
+        if behaviour == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', name)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if behaviour == '/flaky' and attempts == 1:
+            return self._send(503, "try again")
+
+        body = CONTENT[name]
+        rng = self.headers.getheader('range')
+        if rng:
+            start = int(re.match(r"bytes=(\d+)-", rng).group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, len(body) - 1, len(body)))
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if behaviour == '/truncated' and attempts == 1:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = 1
+            return
+        self.wfile.write(body)
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), FetchHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = set()
+        self.server.requests = []
+        self.server.attempts = {}
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tdir)
+
+
+class FetcherTest(LocalServerTestCase):
+
+    def _entries(self, prefix=''):
+        return [(self.base + prefix + name, os.path.join(self.tdir, 'data', name[1:])) for name in sorted(CONTENT)]
+
+    def _assert_downloaded(self, entries):
+        for url, destination in entries:
+            self.assertEquals(open(destination, 'rb').read(), CONTENT[url[url.rindex('/'):]])
+            self.assertFalse(os.path.exists(destination + '.part'))
+
+    def test_fetch_concurrently(self):
+        entries = self._entries()
+        self.assertEquals(Fetcher(workers=3, per_host=3).fetch(entries)[1], {})
+        self._assert_downloaded(entries)
+
+    def test_connections_are_reused(self):
+        entries = self._entries()
+        self.assertEquals(Fetcher(workers=4, per_host=1).fetch(entries)[1], {})
+        self._assert_downloaded(entries)
+        self.assertEquals(len(self.server.connections), 1)
+
+    def test_retry_after_server_error(self):
+        entries = self._entries('/flaky')
+        self.assertEquals(Fetcher(workers=2, backoff=0).fetch(entries)[1], {})
+        self._assert_downloaded(entries)
+
+    def test_resume_partial_download(self):
+        entries = self._entries('/truncated')[:1]
+        self.assertEquals(Fetcher(backoff=0).fetch(entries)[1], {})
+        self._assert_downloaded(entries)
+        half = len(CONTENT['/file0.txt']) // 2
+        self.assertEquals(self.server.requests, [('/truncated/file0.txt', None),
+                                                 ('/truncated/file0.txt', 'bytes={0}-'.format(half))])
+
+    def test_resumed_download_is_checksummed(self):
+        url, destination = self._entries('/truncated')[0]
+        checksums, failures = Fetcher(backoff=0, algorithms=['md5']).fetch([(url, destination)])
+        self.assertEquals(checksums[destination], {'md5': hashlib.md5(CONTENT['/file0.txt']).hexdigest()})
+
+    def test_download_matching_checksum(self):
+        url, destination = self._entries()[0]
+        expected = {'sha1': hashlib.sha1(CONTENT['/file0.txt']).hexdigest().upper()}
+        checksums, failures = Fetcher().fetch([(url, destination, expected)])
+        self.assertEquals(failures, {})
+        self._assert_downloaded([(url, destination)])
+
+    def test_download_with_wrong_checksum_is_discarded(self):
+        url, destination = self._entries()[0]
+        checksums, failures = Fetcher(backoff=0).fetch([(url, destination, {'sha1': '0' * 40})])
+        self.assertEquals(failures.keys(), [destination])
+        self.assertTrue('does not match' in failures[destination])
+        self.assertFalse(os.path.exists(destination))
+        self.assertFalse(os.path.exists(destination + '.part'))
+        # a mismatch is not worth downloading again.
+        self.assertEquals(len(self.server.requests), 1)
+
+    def test_follow_redirect(self):
+        entries = self._entries('/redirect')[:1]
+        self.assertEquals(Fetcher().fetch(entries)[1], {})
+        self._assert_downloaded(entries)
+
+    def test_failures_are_reported(self):
+        url = self.base + '/nothing-here.txt'
+        destination = os.path.join(self.tdir, 'nothing-here.txt')
+        checksums, failures = Fetcher(retries=2, backoff=0).fetch([(url, destination)])
+        self.assertEquals(failures.keys(), [destination])
+        self.assertTrue('404' in failures[destination])
+        # a 404 is not worth asking for again.
+        self.assertEquals(len(self.server.requests), 1)
+
+
+class BagFetchTest(LocalServerTestCase):
+
+    def setUp(self):
+        LocalServerTestCase.setUp(self)
+        self.bag = BagIt(os.path.join(self.tdir, 'fetchbag'))
+
+    def _add_entries(self, checksums):
+        self.bag.add_fetch_entries([{'url': self.base + '/file{0}.txt'.format(i),
+                                     'filename': 'data/file{0}.txt'.format(i)} for i in checksums])
+        for i, csum in checksums.iteritems():
+            self.bag.manifest_contents['data/file{0}.txt'.format(i)] = csum
+        self.bag._write_dict_to_manifest()
+
+    def test_fetch_verifies_downloads(self):
+        self._add_entries({0: hashlib.sha1(CONTENT['/file0.txt']).hexdigest(),
+                           1: hashlib.sha1('something else').hexdigest()})
+        self.bag.fetch()
+        self.assertTrue(os.path.exists(os.path.join(self.bag.data_directory, 'file0.txt')))
+        self.assertFalse(os.path.exists(os.path.join(self.bag.data_directory, 'file1.txt')))
+        self.assertEquals(len(self.bag.bag_errors), 1)
+        self.assertTrue(self.bag.bag_errors[0][1].startswith('URL {0}/file1.txt could not be downloaded'.format(self.base)))
+
+    def test_fetch_progress(self):
+        events = []
+        self.bag.progress = events.append
+        self.bag.add_fetch_entries([{'url': self.base + '/file{0}.txt'.format(i),
+                                     'filename': 'data/file{0}.txt'.format(i)} for i in xrange(3)])
+        self.bag.fetch()
+        self.assertEquals([(e.files_done, e.files_total) for e in events], [(1, 3), (2, 3), (3, 3), (3, 3)])
+        self.assertEquals(events[-1].bytes_done, sum(len(CONTENT['/file{0}.txt'.format(i)]) for i in xrange(3)))
+        self.assertTrue(events[-1].done)
+
+    def test_fetch_adds_unlisted_downloads_to_the_manifest(self):
+        self.bag.add_fetch_entries([{'url': self.base + '/file2.txt', 'filename': 'data/file2.txt'}])
+        self.bag.fetch(validate_downloads=True)
+        self.assertEquals(self.bag.manifest_contents['data/file2.txt'],
+                          hashlib.sha1(CONTENT['/file2.txt']).hexdigest())
+        self.assertEquals(BagIt(self.bag.bag_directory).validate(), [])
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(FetcherTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(BagFetchTest, 'test'))
+    return test_suite
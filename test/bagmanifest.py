@@ -1,11 +1,21 @@
 import unittest
 import os
+import shutil
+import tempfile
 from pybagit.bagit import BagIt
+from pybagit.exceptions import BagCheckSumNotValid, BagManifestNotValid
+from pybagit.manifest import read_manifest, Manifest
 
 
 class ManifestTest(unittest.TestCase):
     def setUp(self):
-        self.bag = BagIt(os.path.join(os.getcwd(), 'test', 'testbag'))
+        # work on a copy, so that updating doesn't change the fixture.
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), os.path.join(self.tdir, 'testbag'))
+        self.bag = BagIt(os.path.join(self.tdir, 'testbag'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
 
     def set_hash_md5(self):
         self.bag.set_hash_encoding('md5')
@@ -40,6 +50,138 @@ class ManifestTest(unittest.TestCase):
                 'manifest-md5.txt')
 
 
+class MultipleManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'testbag')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), self.bagdir)
+        self.bag = BagIt(self.bagdir)
+        self.angry = os.path.join('data', 'subdir', 'subsubdir', 'angry.jpg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_sha256(self):
+        self.bag.set_hash_encoding('sha256')
+        self.bag.update()
+        self.assertEquals(self.bag.manifest_contents[self.angry],
+                '89055c269540043eee9c509b143d1e22045e37873ed15851ca228805ac214482')
+
+    def test_manifest_per_algorithm(self):
+        self.bag.set_hash_encodings(['md5', 'sha256', 'sha512'])
+        self.bag.update()
+        for alg in ('md5', 'sha256', 'sha512'):
+            self.assertTrue(os.path.exists(os.path.join(self.bagdir, 'manifest-{0}.txt'.format(alg))))
+            self.assertTrue(os.path.exists(os.path.join(self.bagdir, 'tagmanifest-{0}.txt'.format(alg))))
+        self.assertFalse(os.path.exists(os.path.join(self.bagdir, 'manifest-sha1.txt')))
+        self.assertEquals(self.bag.manifests['md5'][self.angry], '5f294603675cb6c0f83cef9316bb5be7')
+        self.assertEquals(sorted(self.bag.tag_manifests['sha512']),
+                ['bag-info.txt', 'bagit.txt', 'fetch.txt', 'manifest-md5.txt', 'manifest-sha256.txt', 'manifest-sha512.txt'])
+
+    def test_open_and_validate_every_manifest(self):
+        self.bag.set_hash_encodings(['md5', 'sha256'])
+        self.bag.update()
+        reopened = BagIt(self.bagdir)
+        self.assertEquals(reopened.hash_encoding, 'sha256')
+        self.assertEquals(sorted(reopened.manifests), ['md5', 'sha256'])
+        self.assertEquals(reopened.validate(), [])
+
+        reopened.manifests['md5'][self.angry] = '0' * 32
+        self.assertEquals(reopened.validate(), [(self.angry, 'Incorrect filename or checksum in manifest-md5.txt')])
+
+    def test_partial_update_removes_old_manifests(self):
+        self.bag.update()
+        self.bag.set_hash_encodings(['md5'])
+        self.bag.update(full=False)
+        self.assertEquals(sorted(f for f in os.listdir(self.bagdir) if f.endswith('.txt') and 'manifest' in f),
+                          ['manifest-md5.txt', 'tagmanifest-md5.txt'])
+        reopened = BagIt(self.bagdir)
+        self.assertEquals(reopened.hash_encoding, 'md5')
+        self.assertEquals(reopened.validate(), [])
+
+    def test_invalid_algorithm(self):
+        self.assertRaises(BagCheckSumNotValid, self.bag.set_hash_encoding, 'crc32')
+
+
+class ManifestParserTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.manifest = os.path.join(self.tdir, 'manifest-md5.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _write(self, contents):
+        f = open(self.manifest, 'wb')
+        f.write(contents)
+        f.close()
+
+    def test_read_manifest(self):
+        self._write('\xef\xbb\xbf5F294603675CB6C0F83CEF9316BB5BE7  data/a file.txt\r\n'
+                    '\n'
+                    'abcd\tdata/t\xc3\xabst.gif\n')
+        self.assertEquals(list(read_manifest(self.manifest)),
+                [(u'data/a file.txt', '5f294603675cb6c0f83cef9316bb5be7'),
+                 (u'data/t\xebst.gif', 'abcd')])
+
+    def test_malformed_line(self):
+        self._write('5f294603675cb6c0f83cef9316bb5be7 data/a.txt\nnot-a-checksum data/b.txt\n')
+        try:
+            list(read_manifest(self.manifest))
+        except BagManifestNotValid, e:
+            self.assertTrue('line 2' in e.message)
+        else:
+            self.fail('BagManifestNotValid not raised')
+
+    def test_malformed_manifest_is_reported(self):
+        bagdir = os.path.join(self.tdir, 'testbag')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), bagdir)
+        f = open(os.path.join(bagdir, 'manifest-sha1.txt'), 'ab')
+        f.write('data/missing-checksum.txt\n')
+        f.close()
+        bag = BagIt(bagdir)
+        self.assertEquals(len(bag.bag_errors), 1)
+        self.assertTrue('manifest-sha1.txt, line 5' in bag.bag_errors[0][1])
+
+
+class ManifestStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.entries = {os.path.join(u'data', u'a.txt'): 'c5913ae67aa40398f1182e52d2fa2c2e4c08f696',
+                        os.path.join(u'data', u'sub', u't\xebst.gif'): '0000000000000000000000000000000000000001',
+                        u'bagit.txt': 'ffffffffffffffffffffffffffffffffffffffff'}
+        self.manifest = Manifest('sha1', self.entries)
+
+    def test_behaves_like_dict(self):
+        self.assertEquals(len(self.manifest), 3)
+        self.assertEquals(self.manifest, self.entries)
+        self.assertEquals(dict(self.manifest.iteritems()), self.entries)
+        self.assertEquals(sorted(self.manifest), sorted(self.entries))
+        self.assertTrue(u'bagit.txt' in self.manifest)
+        self.assertFalse(os.path.join(u'data', u'b.txt') in self.manifest)
+        self.assertRaises(KeyError, self.manifest.__getitem__, os.path.join(u'data', u'b.txt'))
+
+    def test_set_and_delete(self):
+        path = os.path.join(u'data', u'a.txt')
+        self.manifest[path] = 'A' * 40
+        self.assertEquals(self.manifest[path], 'a' * 40)
+        del self.manifest[path]
+        self.assertEquals(len(self.manifest), 2)
+        self.manifest[os.path.join(u'data', u'c.txt')] = '1' * 40
+        self.assertEquals(self.manifest[os.path.join(u'data', u'c.txt')], '1' * 40)
+        self.assertEquals(len(self.manifest), 3)
+
+    def test_checksums_of_unexpected_length(self):
+        self.manifest[u'odd.txt'] = 'abc'
+        self.assertEquals(self.manifest[u'odd.txt'], 'abc')
+        self.assertEquals(len(self.manifest), 4)
+        del self.manifest[u'odd.txt']
+        self.assertFalse(u'odd.txt' in self.manifest)
+
+
 def suite():
-    test_suite = unittest.makeSuite(ManifestTest, 'test')
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(ManifestTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(MultipleManifestTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(ManifestParserTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(ManifestStoreTest, 'test'))
     return test_suite
@@ -0,0 +1,63 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+from pybagit.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'testbag')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), self.bagdir)
+        self.metrics = Metrics(slowest=2)
+        self.bag = BagIt(self.bagdir, metrics=self.metrics)
+        self.payload_size = sum(os.path.getsize(f) for f in self.bag.get_bag_contents())
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_update_phases(self):
+        self.bag.update(processes=1)
+        self.assertEquals(self.metrics.phases.keys(),
+                          ['update.read_manifests', 'update.walk', 'update.sanitise', 'update.hash',
+                           'update.write_manifests', 'update.tag_manifests'])
+        self.assertEquals(self.metrics.files, 4)
+        self.assertEquals(self.metrics.bytes_read, self.payload_size)
+
+    def test_validate_in_parallel(self):
+        self.bag.update(processes=1)
+        self.metrics.reset()
+        self.bag.validate(processes=2)
+        self.assertEquals(self.metrics.phases.keys(), ['validate.walk', 'validate.hash', 'validate.compare'])
+        self.assertEquals(self.metrics.files, 4)
+        utilisation = self.metrics.utilisation()
+        self.assertTrue(0.0 <= utilisation <= 1.0)
+
+    def test_slowest_files(self):
+        self.bag.validate(processes=1)
+        slowest = self.metrics.slowest_files()
+        self.assertEquals(len(slowest), 2)
+        self.assertTrue(slowest[0][2] >= slowest[1][2])
+        self.assertTrue(slowest[0][0] in self.bag.get_bag_contents())
+
+    def test_package(self):
+        self.bag.package(self.tdir, method='zip')
+        self.assertEquals(self.metrics.phases.keys(), ['package.compress'])
+        # the payload and the tag files
+        self.assertTrue(self.metrics.files > 4)
+        self.assertTrue('package.compress' in self.metrics.report())
+
+    def test_nothing_is_recorded_without_metrics(self):
+        bag = BagIt(self.bagdir)
+        bag.update()
+        bag.validate()
+        self.assertEquals(bag.metrics, None)
+        self.assertEquals(self.metrics.phases, {})
+
+
+def suite():
+    test_suite = unittest.makeSuite(MetricsTest, 'test')
+    return test_suite
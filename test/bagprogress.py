@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+from pybagit.multichecksum import dirwalk
+
+
+class Cancelled(Exception):
+    pass
+
+
+class ProgressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'testbag')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), self.bagdir)
+        self.events = []
+        self.bag = BagIt(self.bagdir, progress=self.events.append)
+        self.payload_size = sum(os.path.getsize(f) for f in self.bag.get_bag_contents())
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _check_events(self, operation, files):
+        self.assertEquals([e.operation for e in self.events], [operation] * (files + 1))
+        self.assertEquals([e.files_done for e in self.events], range(1, files + 1) + [files])
+        last = self.events[-1]
+        self.assertTrue(last.done)
+        self.assertEquals(last.eta, 0.0)
+        self.assertEquals(last.bytes_done, last.bytes_total)
+        for event in self.events[:-1]:
+            self.assertFalse(event.done)
+            self.assertTrue(event.current_file is not None)
+
+    def test_update(self):
+        self.bag.update(processes=1)
+        self._check_events('update', 4)
+        self.assertEquals(self.events[-1].bytes_total, self.payload_size)
+
+    def test_parallel_validate(self):
+        self.bag.validate(processes=2)
+        self._check_events('validate', 4)
+        self.assertEquals(sorted(e.current_file for e in self.events[:-1]), sorted(dirwalk(self.bag.data_directory)))
+
+    def test_package(self):
+        self.bag.package(self.tdir, method='tgz')
+        # the payload and the tag files
+        self.assertTrue(self.events[-1].files_done > 4)
+        self._check_events('package', self.events[-1].files_done)
+
+    def test_callback_can_stop_an_operation(self):
+        def stop(event):
+            raise Cancelled()
+        self.bag.progress = stop
+        self.assertRaises(Cancelled, self.bag.validate, processes=2)
+
+    def test_stopped_update_keeps_the_manifests(self):
+        manifests = sorted(f for f in os.listdir(self.bagdir) if f.endswith('manifest-sha1.txt'))
+        self.assertEquals(manifests, ['manifest-sha1.txt', 'tagmanifest-sha1.txt'])
+        before = [open(os.path.join(self.bagdir, f), 'rb').read() for f in manifests]
+        errors = BagIt(self.bagdir).validate()
+
+        def stop(event):
+            if event.files_done == 2:
+                raise Cancelled()
+        self.bag.progress = stop
+        for full in (True, False):
+            # a new file, so that a partial update has something to read.
+            open(os.path.join(self.bag.data_directory, 'new{0}.txt'.format(full)), 'w').write('new')
+            self.assertRaises(Cancelled, self.bag.update, full=full, processes=1)
+            self.assertEquals([open(os.path.join(self.bagdir, f), 'rb').read() for f in manifests], before)
+
+        # only the new files are unaccounted for.
+        reopened = BagIt(self.bagdir)
+        unlisted = [(u'data/new{0}.txt'.format(full), 'File is not correct in manifest') for full in (True, False)]
+        self.assertEquals(sorted(reopened.validate()), sorted(errors + unlisted))
+        reopened.update(full=False)
+        self.assertTrue(set(['data/newTrue.txt', 'data/newFalse.txt']) <= reopened.new_files)
+        self.assertTrue(reopened.existing_files)
+
+
+def suite():
+    test_suite = unittest.makeSuite(ProgressTest, 'test')
+    return test_suite
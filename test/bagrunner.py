@@ -0,0 +1,150 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from pybagit.bagit import BagIt
+from pybagit.runner import BagRunner
+from pybagit.exceptions import *
+
+
+class RunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.runner = BagRunner(max_bags=2)
+
+    def tearDown(self):
+        self.runner.shutdown()
+        shutil.rmtree(self.tdir)
+
+    def _bag(self, name, files=5, **kwargs):
+        bag = BagIt(os.path.join(self.tdir, name), **kwargs)
+        for i in range(files):
+            f = open(os.path.join(bag.data_directory, 'file{0}.txt'.format(i)), 'w')
+            f.write('contents of file {0}\n'.format(i))
+            f.close()
+        return bag
+
+    def _blocking(self):
+        """ A progress callback that holds up the operation at its first
+            file until released.
+        """
+        started = threading.Event()
+        release = threading.Event()
+
+        def progress(event):
+            if not started.is_set():
+                started.set()
+                release.wait(10)
+        return progress, started, release
+
+    def test_many_bags(self):
+        bags = [self._bag('bag{0}'.format(i)) for i in range(4)]
+        futures = [self.runner.update(bag) for bag in bags]
+        for future in futures:
+            future.result()
+            self.assertTrue(future.done())
+            self.assertFalse(future.cancelled())
+        validations = [self.runner.validate(bag) for bag in bags]
+        self.assertEquals([v.result() for v in validations], [[]] * 4)
+        self.assertEquals(validations[0].progress.done, True)
+        self.assertEquals(validations[0].progress.files_total, 5)
+
+    def test_same_bag_runs_in_order(self):
+        bag = self._bag('bag')
+        update = self.runner.update(bag)
+        validate = self.runner.validate(bag)
+        self.assertEquals(validate.result(), [])
+        self.assertTrue(update.done())
+        self.assertEquals(len(bag.manifest_contents), 5)
+
+    def test_busy_bag_does_not_hold_up_others(self):
+        progress, started, release = self._blocking()
+        busy = self._bag('busy', progress=progress)
+        first = self.runner.update(busy)
+        self.assertTrue(started.wait(10))
+        queued = [self.runner.validate(busy), self.runner.validate(busy)]
+        other = self.runner.update(self._bag('other'))
+        # with max_bags=2, the other bag gets the second thread.
+        self.assertTrue(other.wait(10))
+        self.assertFalse(first.done())
+        self.assertFalse([f for f in queued if f.running() or f.done()])
+
+        self.assertTrue(queued[0].cancel())
+        release.set()
+        self.assertEquals(queued[1].result(), [])
+        self.assertTrue(queued[0].cancelled())
+        self.assertTrue(first.done())
+
+    def test_shutdown_runs_queued_operations(self):
+        progress, started, release = self._blocking()
+        bag = self._bag('bag', progress=progress)
+        self.runner.update(bag)
+        validate = self.runner.validate(bag)
+        self.assertTrue(started.wait(10))
+        release.set()
+        self.runner.shutdown()
+        self.assertEquals(validate.result(), [])
+        self.assertRaises(BagError, self.runner.validate, bag)
+
+    def test_exceptions_are_raised_by_result(self):
+        bag = self._bag('bag')
+        future = self.runner.package(bag, os.path.join(self.tdir, 'package.tgz'), method="rar")
+        self.assertRaises(BagError, future.result)
+        self.assertTrue(isinstance(future.exception(), BagError))
+
+    def test_done_callback(self):
+        bag = self._bag('bag')
+        called = []
+        future = self.runner.update(bag)
+        future.add_done_callback(called.append)
+        future.result()
+        future.wait()
+        future.add_done_callback(called.append)
+        self.assertEquals(called, [future, future])
+
+    def test_cancel_pending(self):
+        runner = BagRunner(max_bags=1)
+        progress, started, release = self._blocking()
+        first = runner.update(self._bag('first', progress=progress))
+        second = runner.update(self._bag('second'))
+        self.assertTrue(started.wait(10))
+        self.assertTrue(second.cancel())
+        release.set()
+        runner.shutdown()
+        self.assertTrue(second.cancelled())
+        self.assertRaises(BagOperationCancelled, second.result)
+        self.assertEquals(second.bag.manifest_contents, {})
+        first.result()
+        self.assertFalse(first.cancel())
+
+    def test_cancel_running(self):
+        progress, started, release = self._blocking()
+        bag = self._bag('bag')
+        bag.update()
+        bag.progress = progress
+        future = self.runner.update(bag)
+        self.assertTrue(started.wait(10))
+        self.assertTrue(future.running())
+        self.assertTrue(future.cancel())
+        release.set()
+        self.assertTrue(future.wait(10))
+        self.assertTrue(future.cancelled())
+        self.assertTrue(isinstance(future.exception(), BagOperationCancelled))
+        self.assertEquals(bag.progress, progress)
+
+        # the cancelled update left the manifests alone.
+        self.assertTrue(os.path.exists(os.path.join(bag.bag_directory, 'manifest-sha1.txt')))
+        bag.progress = None
+        self.assertEquals(bag.validate(), [])
+        self.assertEquals(BagIt(bag.bag_directory).validate(), [])
+
+    def test_bad_operation(self):
+        self.assertRaises(BagError, self.runner.submit, self._bag('bag'), 'delete')
+        self.assertRaises(BagError, BagRunner, 0)
+
+
+def suite():
+    test_suite = unittest.makeSuite(RunnerTest, 'test')
+    return test_suite
@@ -0,0 +1,107 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+from pybagit.exceptions import BagError
+from pybagit.sampling import sample_size, weighted_sample
+
+
+class SampledValidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bag = BagIt(os.path.join(self.tdir, 'samplebag'), checksum_cache=True)
+        for i in range(20):
+            f = open(os.path.join(self.bag.data_directory, 'file{0:02d}.txt'.format(i)), 'w')
+            f.write('contents of file {0}\n'.format(i) * (i + 1))
+            f.close()
+        self.bag.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _corrupt_everything(self):
+        for filepath in self.bag.get_bag_contents():
+            f = open(filepath, 'ab')
+            f.write('corrupt')
+            f.close()
+
+    def _sampled(self, **kwargs):
+        return [e[0] for e in self.bag.validate(**kwargs)]
+
+    def test_sample_count(self):
+        self._corrupt_everything()
+        self.assertEquals(len(self._sampled(sample=5, seed=1)), 5)
+
+    def test_sample_fraction(self):
+        self._corrupt_everything()
+        self.assertEquals(len(self._sampled(sample=0.12, seed=1)), 3)
+        self.assertEquals(len(self._sampled(sample=1.0, seed=1)), 20)
+
+    def test_sample_is_reproducible(self):
+        self._corrupt_everything()
+        self.assertEquals(self._sampled(sample=5, seed=42), self._sampled(sample=5, seed=42))
+
+    def test_sampled_files_are_read_despite_cache(self):
+        self._corrupt_everything()
+        f = os.path.join(self.bag.data_directory, 'file00.txt')
+        errors = self.bag.validate(sample=1, weight=lambda relpath: 1 if relpath.endswith('file00.txt') else 0)
+        self.assertEquals(errors, [(os.path.relpath(f, self.bag.bag_directory),
+                                    'Incorrect filename or checksum in manifest')])
+
+    def test_missing_sampled_file_is_reported(self):
+        os.remove(os.path.join(self.bag.data_directory, 'file03.txt'))
+        errors = self.bag.validate(sample=1.0)
+        self.assertEquals(errors, [(os.path.join('data', 'file03.txt'), 'File listed in the manifest is missing')])
+
+    def test_weight_by_age(self):
+        self._corrupt_everything()
+        cache = self.bag._get_checksum_cache()
+        relpath = os.path.join('data', 'file07.txt')
+        st = os.stat(os.path.join(self.bag.bag_directory, relpath))
+        cache.store(relpath, st, 'sha1', self.bag.manifest_contents[relpath], checked=0)
+        self.assertEquals(self._sampled(sample=1, seed=3, weight='age'), [relpath])
+        self.assertNotEquals(cache.last_checked(relpath), 0)
+
+    def test_weight_by_age_needs_cache(self):
+        bag = BagIt(self.bag.bag_directory)
+        self.assertRaises(BagError, bag.validate, sample=1, weight='age')
+
+    def test_weight_by_size(self):
+        self.assertEquals(self.bag.validate(sample=4, seed=7, weight='size'), [])
+
+    def test_sample_archive(self):
+        self.bag.package(self.tdir, method='zip')
+        package = BagIt(os.path.join(self.tdir, 'samplebag.zip'), extract=False)
+        self.assertEquals(package.validate(sample=4, seed=1), [])
+
+
+class SamplingTest(unittest.TestCase):
+
+    def test_sample_size(self):
+        self.assertEquals(sample_size(0.5, 9), 5)
+        self.assertEquals(sample_size(3, 9), 3)
+        self.assertEquals(sample_size(30, 9), 9)
+        self.assertRaises(BagError, sample_size, 1.5, 9)
+        self.assertRaises(BagError, sample_size, -1, 9)
+        self.assertRaises(BagError, sample_size, 'all', 9)
+
+    def test_weighted_sample_keeps_order(self):
+        items = range(100)
+        picked = weighted_sample(items, 10, seed=5)
+        self.assertEquals(len(picked), 10)
+        self.assertEquals(picked, sorted(picked))
+        self.assertEquals(picked, weighted_sample(items, 10, seed=5))
+
+    def test_weightless_items_come_last(self):
+        items = range(10)
+        picked = weighted_sample(items, 3, weight=lambda i: 1 if i in (2, 5, 8) else 0, seed=1)
+        self.assertEquals(picked, [2, 5, 8])
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(SampledValidateTest, 'test'))
+    test_suite.addTest(unittest.makeSuite(SamplingTest, 'test'))
+    return test_suite
@@ -0,0 +1,117 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+from pybagit.scan import scan_tree
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.top = os.path.join(self.tdir, 'top')
+        os.makedirs(os.path.join(self.top, 'a', 'b'))
+        os.makedirs(os.path.join(self.top, 'empty'))
+        os.makedirs(os.path.join(self.tdir, 'outside'))
+        for path, size in (('one.txt', 1), ('a/two.txt', 2), ('a/b/three.txt', 3)):
+            f = open(os.path.join(self.top, path), 'wb')
+            f.write('x' * size)
+            f.close()
+        open(os.path.join(self.tdir, 'outside', 'elsewhere.txt'), 'wb').close()
+        os.symlink(os.path.join(self.tdir, 'outside'), os.path.join(self.top, 'linked'))
+        os.symlink(os.path.join(self.top, 'one.txt'), os.path.join(self.top, 'a', 'link.txt'))
+        os.symlink(os.path.join(self.top, 'missing'), os.path.join(self.top, 'dangling'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_same_files_as_os_walk(self):
+        walked = []
+        for dirpath, dirnames, filenames in os.walk(self.top):
+            walked.extend(os.path.join(dirpath, f) for f in filenames)
+        self.assertEquals(scan_tree(self.top).files, walked)
+
+    def test_stats(self):
+        result = scan_tree(self.top)
+        self.assertEquals(result.sizes([os.path.join(self.top, 'a', 'b', 'three.txt'),
+                                        os.path.join(self.top, 'a', 'link.txt')]),
+                          {os.path.join(self.top, 'a', 'b', 'three.txt'): 3,
+                           os.path.join(self.top, 'a', 'link.txt'): 1})
+        self.assertEquals(result.stats[os.path.join(self.top, 'dangling')], None)
+        self.assertEquals(result.sizes()[os.path.join(self.top, 'dangling')], 0)
+
+    def test_linked_directories_are_not_followed(self):
+        self.assertFalse([f for f in scan_tree(self.top).files if 'elsewhere' in f])
+
+    def test_empty_dirs(self):
+        self.assertEquals(scan_tree(self.top).empty_dirs, [os.path.join(self.top, 'empty')])
+
+    def test_rename(self):
+        result = scan_tree(self.top)
+        old = os.path.join(self.top, 'one.txt')
+        index = result.files.index(old)
+        result.rename(index, os.path.join(self.top, 'uno.txt'))
+        self.assertEquals(result.files[index], os.path.join(self.top, 'uno.txt'))
+        self.assertEquals(result.sizes([os.path.join(self.top, 'uno.txt')]).values(), [1])
+        self.assertFalse(old in result.stats)
+
+    def test_update_stats_each_file_once(self):
+        bag = BagIt(os.path.join(self.tdir, 'bag'))
+        for i in range(50):
+            open(os.path.join(bag.data_directory, 'file{0}.txt'.format(i)), 'wb').close()
+        calls = []
+        stat, lstat = os.stat, os.lstat
+
+        def counted(function):
+            def call(path):
+                if path.startswith(bag.data_directory):
+                    calls.append(path)
+                return function(path)
+            return call
+        os.stat, os.lstat = counted(stat), counted(lstat)
+        try:
+            bag.update(processes=1)
+        finally:
+            os.stat, os.lstat = stat, lstat
+        self.assertEquals(len(bag.manifest_contents), 50)
+        self.assertTrue(len(calls) <= 51, len(calls))
+
+    def test_threads_give_the_same_scan(self):
+        for i in range(20):
+            os.makedirs(os.path.join(self.top, 'many', str(i), 'deeper'))
+            open(os.path.join(self.top, 'many', str(i), 'deeper', 'f.txt'), 'wb').close()
+        serial = scan_tree(self.top)
+        threaded = scan_tree(self.top, threads=4)
+        self.assertEquals(threaded.files, serial.files)
+        self.assertEquals(threaded.sizes(), serial.sizes())
+        self.assertEquals(threaded.empty_dirs, serial.empty_dirs)
+        self.assertEquals(threaded.tree, serial.tree)
+
+    def test_threads_skip_unreadable_directories(self):
+        if os.getuid() == 0:
+            return  # root can list anything
+        os.chmod(os.path.join(self.top, 'a'), 0)
+        try:
+            self.assertEquals(scan_tree(self.top, threads=4).files, scan_tree(self.top).files)
+        finally:
+            os.chmod(os.path.join(self.top, 'a'), 0755)
+
+    def test_bag_with_scan_threads(self):
+        bag = BagIt(os.path.join(self.tdir, 'bag'), scan_threads=4)
+        shutil.copytree(self.top, os.path.join(bag.data_directory, 'top'), symlinks=True)
+        os.remove(os.path.join(bag.data_directory, 'top', 'dangling'))
+        bag.update()
+        self.assertEquals(sorted(os.path.relpath(f, bag.bag_directory) for f in bag.get_bag_contents()),
+                          sorted(bag.manifest_contents.keys()))
+        self.assertEquals(len(bag.manifest_contents), 5)  # with the empty directory's .keep
+        bag.validate()
+        self.assertTrue(bag.is_valid())
+
+        serial = BagIt(bag.bag_directory)
+        self.assertEquals(list(bag._archive_members()), list(serial._archive_members()))
+
+
+def suite():
+    test_suite = unittest.makeSuite(ScanTest, 'test')
+    return test_suite
@@ -1,18 +1,21 @@
 import unittest
 import os
 import shutil
+import tempfile
 from pybagit.bagit import BagIt
 
 
 class UpdateTest(unittest.TestCase):
 
     def setUp(self):
-        self.bag = BagIt(os.path.join(os.getcwd(), 'test', 'testbag'))
-        self.invalid_bag = BagIt(os.path.join(os.getcwd(), 'test', 'invalid_bag'))
+        # work on a copy, so that updating doesn't change the fixture.
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), os.path.join(self.tdir, 'testbag'))
+        self.bag = BagIt(os.path.join(self.tdir, 'testbag'))
+        self.invalid_bag = BagIt(os.path.join(self.tdir, 'invalid_bag'))
 
     def tearDown(self):
-        if os.path.exists(os.path.join(os.getcwd(), 'test', 'invalid_bag')):
-            shutil.rmtree(os.path.join(os.getcwd(), 'test', 'invalid_bag'))
+        shutil.rmtree(self.tdir)
 
     def test_full_update(self):
         self.bag.update(full=True)
@@ -26,6 +29,40 @@ class UpdateTest(unittest.TestCase):
         self.bag.update()
         self.assertEquals(self.bag.is_valid(), True)
 
+    def test_payload_oxum(self):
+        self.bag.update()
+        payload = self.bag.get_bag_contents()
+        octets = sum(os.path.getsize(f) for f in payload)
+        self.assertEquals(self.bag.baginfo_contents['Payload-Oxum'], "{0}.{1}".format(octets, len(payload)))
+        self.assertEquals(BagIt(self.bag.bag_directory).baginfo_contents['Payload-Oxum'],
+                          "{0}.{1}".format(octets, len(payload)))
+        self.assertEquals(self.bag.validate(), [])
+
+    def test_payload_oxum_keeps_other_fields(self):
+        f = open(self.invalid_bag.baginfo_file, 'w')
+        f.write("Source-Organization: Example\nPayload-Oxum: 1.1\nExternal-Description: two\n  lines\n")
+        f.close()
+        self.invalid_bag.update()
+        f = open(self.invalid_bag.baginfo_file, 'r')
+        lines = f.readlines()
+        f.close()
+        self.assertEquals(lines, ["Source-Organization: Example\n", "Payload-Oxum: 0.1\n",
+                                  "External-Description: two\n", "  lines\n"])
+
+    def test_unreadable_file_is_reported(self):
+        os.symlink(os.path.join(self.invalid_bag.data_directory, 'missing'),
+                   os.path.join(self.invalid_bag.data_directory, 'dangling'))
+        self.invalid_bag.update()
+        self.assertEquals([e[0] for e in self.invalid_bag.bag_errors], [os.path.join('data', 'dangling')])
+        self.assertFalse(os.path.join('data', 'dangling') in self.invalid_bag.manifest_contents)
+
+        # once it can be read, the error goes.
+        os.remove(os.path.join(self.invalid_bag.data_directory, 'dangling'))
+        open(os.path.join(self.invalid_bag.data_directory, 'dangling'), 'w').close()
+        self.invalid_bag.update(full=False)
+        self.assertEquals(self.invalid_bag.bag_errors, [])
+        self.assertTrue(os.path.join('data', 'dangling') in self.invalid_bag.manifest_contents)
+
     def test_not_valid(self):
         os.remove(self.invalid_bag.manifest_file)
         self.invalid_bag.validate()
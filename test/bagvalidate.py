@@ -0,0 +1,69 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pybagit.bagit import BagIt
+
+
+class ValidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bagdir = os.path.join(self.tdir, 'testbag')
+        shutil.copytree(os.path.join(os.getcwd(), 'test', 'testbag'), self.bagdir)
+        self.bag = BagIt(self.bagdir)
+        self.bag.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_parallel_validate(self):
+        self.assertEquals(self.bag.validate(processes=4), [])
+
+    def test_serial_and_parallel_agree(self):
+        f = open(os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg'), 'ab')
+        f.write('corrupt')
+        f.close()
+        serial = self.bag.validate(processes=1)
+        parallel = self.bag.validate(processes=4)
+        self.assertEquals(serial, parallel)
+        self.assertEquals(parallel, [(os.path.join('data', 'subdir', 'subsubdir', 'angry.jpg'),
+                                      'Incorrect filename or checksum in manifest')])
+
+    def test_fast_validate(self):
+        self.assertEquals(self.bag.validate(fast=True), [])
+
+    def test_fast_validate_misses_corruption(self):
+        f = open(os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg'), 'r+b')
+        f.write('corrupt')
+        f.close()
+        self.assertEquals(self.bag.validate(fast=True), [])
+
+    def test_fast_validate_truncated_file(self):
+        f = open(os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg'), 'r+b')
+        f.truncate(10)
+        f.close()
+        errors = self.bag.validate(fast=True)
+        self.assertEquals([e[0] for e in errors], ['bag-info.txt'])
+        self.assertTrue(errors[0][1].startswith('Payload-Oxum is '))
+
+    def test_fast_validate_missing_and_extra_files(self):
+        os.remove(os.path.join(self.bag.data_directory, 'subdir', 'subsubdir', 'angry.jpg'))
+        f = open(os.path.join(self.bag.data_directory, 'extra.txt'), 'w')
+        f.write('extra')
+        f.close()
+        errors = self.bag.validate(fast=True)
+        self.assertTrue((os.path.join('data', 'extra.txt'), 'File is not correct in manifest') in errors)
+        self.assertTrue((os.path.join('data', 'subdir', 'subsubdir', 'angry.jpg'),
+                         'File listed in the manifest is missing') in errors)
+        self.assertEquals(errors[-1][0], 'bag-info.txt')
+
+    def test_fast_validate_archive(self):
+        package = os.path.join(self.tdir, 'testbag.zip')
+        self.bag.package(self.tdir, method='zip')
+        self.assertEquals(BagIt(package, extract=False).validate(fast=True), [])
+
+
+def suite():
+    test_suite = unittest.makeSuite(ValidateTest, 'test')
+    return test_suite
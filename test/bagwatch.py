@@ -0,0 +1,127 @@
+import unittest
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pybagit import multichecksum
+from pybagit.bagit import BagIt
+
+
+def write(filename, contents):
+    fl = open(filename, 'wb')
+    fl.write(contents)
+    fl.close()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "watching a bag needs inotify")
+class WatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp(prefix='bagit_')
+        self.bag = BagIt(os.path.join(self.tdir, 'watchbag'))
+        write(os.path.join(self.bag.data_directory, 'before.txt'), 'written before watching')
+        self.watcher = self.bag.watch(debounce=0)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.tdir)
+
+    def _data(self, *parts):
+        return os.path.join(self.bag.data_directory, *parts)
+
+    def _assert_bag_matches_disk(self):
+        self.assertEquals(BagIt(self.bag.bag_directory).validate(), [])
+        reopened = BagIt(self.bag.bag_directory)
+        self.assertEquals(dict(reopened.manifest_contents), dict(self.bag.manifest_contents))
+
+    def test_initial_sync(self):
+        self.assertEquals(self.bag.manifest_contents['data/before.txt'],
+                          hashlib.sha1('written before watching').hexdigest())
+
+    def test_create_modify_delete(self):
+        write(self._data('new.txt'), 'one')
+        self.assertEquals(self.watcher.process_events(1), set(['data/new.txt']))
+        self.assertEquals(self.bag.manifest_contents['data/new.txt'], hashlib.sha1('one').hexdigest())
+
+        write(self._data('new.txt'), 'two')
+        self.watcher.process_events(1)
+        self.assertEquals(self.bag.manifest_contents['data/new.txt'], hashlib.sha1('two').hexdigest())
+        self._assert_bag_matches_disk()
+
+        os.remove(self._data('new.txt'))
+        self.assertEquals(self.watcher.process_events(1), set(['data/new.txt']))
+        self.assertFalse('data/new.txt' in self.bag.manifest_contents)
+        self._assert_bag_matches_disk()
+
+    def test_rename(self):
+        os.rename(self._data('before.txt'), self._data('after.txt'))
+        self.assertEquals(self.watcher.process_events(1), set(['data/before.txt', 'data/after.txt']))
+        self.assertFalse('data/before.txt' in self.bag.manifest_contents)
+        self.assertTrue('data/after.txt' in self.bag.manifest_contents)
+        self._assert_bag_matches_disk()
+
+    def test_new_directory(self):
+        os.makedirs(self._data('sub', 'subsub'))
+        write(self._data('sub', 'subsub', 'deep.txt'), 'deep')
+        self.watcher.process_events(1)
+        self.watcher.process_events(0)
+        self.assertTrue('data/sub/subsub/deep.txt' in self.bag.manifest_contents)
+        self._assert_bag_matches_disk()
+
+        shutil.rmtree(self._data('sub'))
+        self.watcher.process_events(1)
+        self.assertFalse('data/sub/subsub/deep.txt' in self.bag.manifest_contents)
+        self._assert_bag_matches_disk()
+
+    def test_undecodable_name(self):
+        data = self.bag.data_directory.encode(sys.getfilesystemencoding() or 'utf-8')
+        write(os.path.join(data, 'bad\xff.txt'), 'bad')
+        write(self._data('good.txt'), 'good')
+        self.assertEquals(self.watcher.process_events(1), set(['data/good.txt']))
+        self.assertEquals([e[0] for e in self.bag.bag_errors], [u'data/bad\ufffd.txt'])
+
+        # and one found in a new directory.
+        os.makedirs(self._data('sub'))
+        write(os.path.join(data, 'sub', 'bad\xff.txt'), 'bad')
+        self.watcher.process_events(1)
+        self.watcher.process_events(0)
+        self.assertEquals(sorted(e[0] for e in self.bag.bag_errors),
+                          [u'data/bad\ufffd.txt', u'data/sub/bad\ufffd.txt'])
+
+    def test_read_errors_are_cleared(self):
+        csumfile = multichecksum.csumfile
+
+        def failing(filename, *args, **kwargs):
+            if os.path.basename(filename) == 'flaky.txt':
+                raise IOError("Input/output error")
+            return csumfile(filename, *args, **kwargs)
+        multichecksum.csumfile = failing
+        try:
+            write(self._data('flaky.txt'), 'one')
+            self.watcher.process_events(1)
+            write(self._data('flaky.txt'), 'two')
+            self.watcher.process_events(1)
+        finally:
+            multichecksum.csumfile = csumfile
+        self.assertEquals(self.bag.bag_errors, [('data/flaky.txt', 'File could not be read: Input/output error')])
+
+        write(self._data('flaky.txt'), 'three')
+        self.watcher.process_events(1)
+        self.assertEquals(self.bag.bag_errors, [])
+        self.assertEquals(self.bag.manifest_contents['data/flaky.txt'], hashlib.sha1('three').hexdigest())
+
+    def test_debounce(self):
+        self.watcher.debounce = 0.2
+        write(self._data('burst.txt'), 'partial')
+        self.assertEquals(self.watcher.process_events(0.05), set())
+        self.assertEquals(self.watcher.pending(), 1)
+        time.sleep(0.25)
+        self.assertEquals(self.watcher.process_events(0), set(['data/burst.txt']))
+        self.assertEquals(self.watcher.pending(), 0)
+
+
+def suite():
+    test_suite = unittest.makeSuite(WatchTest, 'test')
+    return test_suite